@@ -2,19 +2,40 @@ import logging
 import os
 import re
 import secrets
-from datetime import timedelta
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
 from decimal import Decimal, InvalidOperation
 from logging.handlers import RotatingFileHandler
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from flask import Flask, render_template, request, redirect, url_for, session, abort, flash
-
-from config import get_db_conn
-from hospital_db_setup import encrypt_data, decrypt_data
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, abort, flash, jsonify,
+                   stream_template, stream_with_context)
+
+import audit
+from billing import (BILLS_PAGE_SIZE, PaymentError, fetch_bills_with_payments, new_idempotency_key,
+                     outstanding_balance, payment_history, post_payment)
+from config import dispose_pool, get_app_secret_key, get_db_conn, get_pool_stats, reset_pool_after_fork
+from crypto_utils import install_reload_signal_handler, load_keys, reload_key
+from hospital_db_setup import connect_to_db, encrypt_data, decrypt_many, blind_index, encrypted_columns
+from masking import is_sensitive_column, mask_sensitive_data
+import instrumentation
+from patient_search import parse_cursor, search_patients
+from row_pipeline import (EXPORT_BATCH_SIZE, STREAM_BATCH_SIZE, PageState, csv_chunks, decrypt_batches,
+                          fetch_batches, iter_rows, json_object_chunks, mask_batches, mask_selected, ndjson_chunks,
+                          summarize_binary, take_page)
+from schema_cache import schema_cache
+from sessions import create_session_interface
+from startup import StartupError, ensure_schema, readiness
+from scheduling import (DEFAULT_APPOINTMENT_MINUTES, SchedulingError, availability, book_appointment,
+                        calendar_entries, calendar_range, doctor_calendar, patient_calendar)
 # Project authors: Suksham Fulzele (ID: 989686048), Sahil Shekhar Desai (ID: 989485311), Sruthi Satyavarapu (ID: 989492060), Sriyuktha Sanagavarapu (ID: 989483329)
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)  # For session management
+# Stable key shared by all workers; session data itself is stored server-side (SESSION_BACKEND)
+app.secret_key = get_app_secret_key()
+app.session_interface = create_session_interface()
 app.config.update(
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE="Strict",
@@ -33,115 +54,12 @@ handler.setLevel(logging.INFO)
 handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
 app.logger.addHandler(handler)
 app.logger.setLevel(logging.INFO)
+instrumentation.init_app(app)
 
-EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
-
+# Orchestrator probes: plain HTTP from the node, no login
+PROBE_ENDPOINTS = ("healthz", "readyz")
 
-def is_sensitive_column(column_name):
-    """Check if a column name indicates sensitive data"""
-    if not column_name:
-        return False
-    column_lower = column_name.lower()
-    sensitive_keywords = [
-        'ssn', 'social_security', 'phone', 'email', 'card', 'account', 'routing',
-        'mrn', 'medical_record', 'insurance', 'address', 'password', 'pwd',
-        'state_id', 'drivers_license', 'license'
-    ]
-    return any(keyword in column_lower for keyword in sensitive_keywords)
-
-
-def mask_sensitive_data(value, column_name):
-    """Mask sensitive data based on column name and value type"""
-    if value is None:
-        return None
-    
-    # Convert to string for processing
-    value_str = str(value).strip()
-    if not value_str or value_str in ['NULL', 'None', '']:
-        return value_str
-    
-    column_lower = column_name.lower()
-    
-    # SSN masking: ***-**-1234
-    if 'ssn' in column_lower or 'social_security' in column_lower:
-        if len(value_str) >= 4:
-            # Remove any dashes/spaces and get last 4 digits
-            digits = re.sub(r'[^\d]', '', value_str)
-            if len(digits) >= 4:
-                return f"***-**-{digits[-4:]}"
-        return "***-**-****"
-    
-    # Phone number masking: (***) ***-1234
-    if 'phone' in column_lower:
-        digits = re.sub(r'[^\d]', '', value_str)
-        if len(digits) >= 4:
-            return f"(***) ***-{digits[-4:]}"
-        return "(***) ***-****"
-    
-    # Email masking: j***@example.com
-    if 'email' in column_lower:
-        if '@' in value_str:
-            parts = value_str.split('@')
-            if len(parts) == 2:
-                username = parts[0]
-                domain = parts[1]
-                if len(username) > 0:
-                    masked_username = username[0] + '*' * min(3, len(username) - 1)
-                    return f"{masked_username}@{domain}"
-        return "***@***.***"
-    
-    # Credit card masking: ****-****-****-1234
-    if 'card' in column_lower and ('number' in column_lower or 'num' in column_lower):
-        digits = re.sub(r'[^\d]', '', value_str)
-        if len(digits) >= 4:
-            return f"****-****-****-{digits[-4:]}"
-        return "****-****-****-****"
-    
-    # Account number masking
-    if 'account' in column_lower and 'number' in column_lower:
-        digits = re.sub(r'[^\d]', '', value_str)
-        if len(digits) >= 4:
-            return f"****{digits[-4:]}"
-        return "****"
-    
-    # Routing number masking
-    if 'routing' in column_lower:
-        return "****"
-    
-    # MRN (Medical Record Number) masking: MRN-****1234
-    if 'mrn' in column_lower or 'medical_record' in column_lower:
-        digits = re.sub(r'[^\d]', '', value_str)
-        if len(digits) >= 4:
-            return f"MRN-****{digits[-4:]}"
-        return "MRN-****"
-    
-    # Insurance policy masking
-    if 'insurance' in column_lower and ('policy' in column_lower or 'number' in column_lower):
-        digits = re.sub(r'[^\d]', '', value_str)
-        if len(digits) >= 4:
-            return f"POL-****{digits[-4:]}"
-        return "POL-****"
-    
-    # Address masking: Show only city/state
-    if 'address' in column_lower or 'home_address' in column_lower:
-        # Try to extract city/state if present, otherwise mask completely
-        parts = value_str.split(',')
-        if len(parts) >= 2:
-            return f"***, {parts[-1].strip()}"
-        return "*** [Address Hidden]"
-    
-    # Password masking (should never be shown, but just in case)
-    if 'password' in column_lower or 'pwd' in column_lower:
-        return "********"
-    
-    # State ID / Driver's License masking
-    if 'state_id' in column_lower or 'drivers_license' in column_lower or 'license' in column_lower:
-        if len(value_str) >= 4:
-            return f"***{value_str[-4:]}"
-        return "***"
-    
-    # Default: return as is if not sensitive
-    return value_str
+EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
 
 def get_patient_record(patient_id: int):
@@ -153,7 +71,7 @@ def get_patient_record(patient_id: int):
         cur.execute(
             """
             SELECT p.patient_id, p.first_name, p.last_name, p.dob, p.gender,
-                   p.phone_number, p.email, ps.mrn, ps.home_address, ps.insurance_policy, ps.card_last4
+                   p.phone_number, p.email, ps.sensitive_id, ps.mrn, ps.home_address, ps.insurance_policy, ps.card_last4
             FROM Patient p
             LEFT JOIN Patient_Sensitive ps ON ps.patient_id = p.patient_id
             WHERE p.patient_id = %s
@@ -164,11 +82,7 @@ def get_patient_record(patient_id: int):
         if not row:
             return None
         # Decrypt fields that are stored encrypted
-        row["email"] = decrypt_data(row["email"]) if row.get("email") else ""
-        row["phone_number"] = decrypt_data(row["phone_number"]) if row.get("phone_number") else ""
-        row["mrn"] = decrypt_data(row["mrn"]) if row.get("mrn") else ""
-        row["home_address"] = decrypt_data(row["home_address"]) if row.get("home_address") else ""
-        row["insurance_policy"] = decrypt_data(row["insurance_policy"]) if row.get("insurance_policy") else ""
+        decrypt_many([row], encrypted_columns("Patient", row) + encrypted_columns("Patient_Sensitive", row))
         return row
     finally:
         if cur:
@@ -188,6 +102,10 @@ def get_current_user_role():
     """Get the current user's role from session"""
     return session.get('user_role')
 
+def get_audit_actor():
+    """Acting user recorded in Audit_Log, e.g. 'staff:12'"""
+    return f"{session.get('user_role', 'anonymous')}:{session.get('user_id', '-')}"
+
 def require_login(f):
     """Decorator to require user to be logged in"""
     from functools import wraps
@@ -255,8 +173,10 @@ app.jinja_env.filters["is_sensitive"] = is_sensitive_column
 
 @app.before_request
 def enforce_security():
+    instrumentation.start_request()
     session.permanent = True
-    if app.config["REQUIRE_HTTPS"] and not request.is_secure and request.headers.get("X-Forwarded-Proto", "http") != "https":
+    if (app.config["REQUIRE_HTTPS"] and request.endpoint not in PROBE_ENDPOINTS and not request.is_secure
+            and request.headers.get("X-Forwarded-Proto", "http") != "https"):
         # Enforce HTTPS by rejecting non-HTTPS requests to avoid any open-redirect risk
         abort(403, description="HTTPS is required")
     if request.method == "POST":
@@ -280,7 +200,7 @@ def add_security_headers(response):
     if app.config["REQUIRE_HTTPS"]:
         response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
     response.headers["Cache-Control"] = "no-store"
-    return response
+    return instrumentation.finish_request(f"{request.method} {request.endpoint or '<unmatched>'}", response)
 
 
 @app.route("/")
@@ -328,7 +248,9 @@ def login():
             user = cur.fetchone()
             
             if user and check_password_hash(user['password_hash'], password):
-                # Valid credentials
+                # Valid credentials: start from a fresh session id
+                session.clear()
+                session.regenerate()
                 session['logged_in'] = True
                 session['user_role'] = user['role']
                 session['user_id'] = user['user_id']
@@ -459,10 +381,12 @@ def patient_form():
             # 1) Store in Patient table (matching existing database schema)
             cur.execute(
                 """
-                INSERT INTO Patient (first_name, last_name, dob, gender, phone_number, email, ssn, state_id, primary_doctor_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO Patient (first_name, last_name, dob, gender, phone_number, email, ssn, state_id, primary_doctor_id,
+                                     email_bidx, phone_bidx)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
-                (first_name, last_name, dob, "Unknown", encrypted_phone, encrypted_email, encrypt_data(""), encrypt_data(""), None),
+                (first_name, last_name, dob, "Unknown", encrypted_phone, encrypted_email, encrypt_data(""), encrypt_data(""), None,
+                 blind_index(email, "email"), blind_index(phone, "phone")),
             )
             patient_id = cur.lastrowid
 
@@ -479,10 +403,12 @@ def patient_form():
             # 3) Store masked identifiers (MRN, address) in a dedicated table
             cur.execute(
                 """
-                INSERT INTO Patient_Sensitive (patient_id, mrn, home_address, insurance_policy, card_last4)
-                VALUES (%s, %s, %s, %s, %s)
+                INSERT INTO Patient_Sensitive (patient_id, mrn, home_address, insurance_policy, card_last4,
+                                               mrn_bidx, insurance_bidx)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """,
-                (patient_id, encrypted_mrn, encrypted_address, encrypted_insurance, None),
+                (patient_id, encrypted_mrn, encrypted_address, encrypted_insurance, None,
+                 blind_index(mrn, "mrn"), blind_index(insurance, "insurance")),
             )
 
             # 4) Create user account for the patient
@@ -512,6 +438,8 @@ def patient_form():
                 cur.execute("SELECT user_id FROM Users WHERE email = %s AND role = 'patient'", (email.lower(),))
                 user_account = cur.fetchone()
                 if user_account:
+                    session.clear()
+                    session.regenerate()
                     session['logged_in'] = True
                     session['user_id'] = user_account[0]
                     session['user_role'] = 'patient'
@@ -608,20 +536,32 @@ def patient_edit(patient_id: int):
             cur.execute(
                 """
                 UPDATE Patient
-                SET first_name=%s, last_name=%s, phone_number=%s, email=%s
+                SET first_name=%s, last_name=%s, phone_number=%s, email=%s, email_bidx=%s, phone_bidx=%s
                 WHERE patient_id=%s
                 """,
-                (first_name, last_name, encrypt_data(sanitized_phone), encrypt_data(email), patient_id),
+                (first_name, last_name, encrypt_data(sanitized_phone), encrypt_data(email),
+                 blind_index(email, "email"), blind_index(sanitized_phone, "phone"), patient_id),
             )
             cur.execute(
                 """
                 UPDATE Patient_Sensitive
-                SET mrn=%s, home_address=%s, insurance_policy=%s
+                SET mrn=%s, home_address=%s, insurance_policy=%s, mrn_bidx=%s, insurance_bidx=%s
                 WHERE patient_id=%s
                 """,
-                (encrypt_data(mrn), encrypt_data(address), encrypt_data(insurance), patient_id),
+                (encrypt_data(mrn), encrypt_data(address), encrypt_data(insurance),
+                 blind_index(mrn, "mrn"), blind_index(insurance, "insurance"), patient_id),
             )
             conn.commit()
+            actor = get_audit_actor()
+            audit.record("Patient", patient_id, "UPDATE",
+                         old={key: record.get(key) for key in ("first_name", "last_name", "dob", "gender")},
+                         new={"first_name": first_name, "last_name": last_name, "dob": record.get("dob"),
+                              "gender": record.get("gender"),
+                              "changed": ["first_name", "last_name", "phone_number", "email"]},
+                         changed_by=actor)
+            if record.get("sensitive_id") is not None:
+                audit.record("Patient_Sensitive", record["sensitive_id"], "UPDATE",
+                             new={"changed": ["mrn", "home_address", "insurance_policy"]}, changed_by=actor)
             flash("Patient updated.", "success")
             return redirect(url_for("patient_detail", patient_id=patient_id))
         except Exception as e:
@@ -752,6 +692,7 @@ def appointment_form():
             {'name': 'patient_id', 'label': 'Patient ID', 'type': 'text', 'required': True, 'placeholder': 'Enter Patient ID'},
             {'name': 'doctor_id', 'label': 'Doctor ID', 'type': 'text', 'required': False, 'placeholder': 'Enter Staff/Doctor ID (optional)'},
             {'name': 'appointment_date', 'label': 'Appointment Date & Time', 'type': 'datetime-local', 'required': True},
+            {'name': 'duration_minutes', 'label': 'Length (minutes)', 'type': 'number', 'required': False, 'step': '5', 'min': '5', 'placeholder': f'Default {DEFAULT_APPOINTMENT_MINUTES}'},
             {'name': 'status', 'label': 'Status', 'type': 'select', 'required': False,
              'options': [
                  {'value': 'Scheduled', 'label': 'Scheduled', 'selected': True},
@@ -768,6 +709,7 @@ def appointment_form():
                 # Patient ID is already set from session
                 doctor_id_raw = request.form.get("doctor_id", "").strip()
                 appt_date = request.form.get("appointment_date")
+                duration_raw = ""  # patients always book the default length
                 if not appt_date:
                     flash("Appointment date is required.", "error")
                     return redirect(url_for("appointment_form"))
@@ -777,6 +719,7 @@ def appointment_form():
                 doctor_id_raw = request.form.get("doctor_id", "").strip()
                 appt_date = request.form.get("appointment_date")
                 status = request.form.get("status", "Scheduled")
+                duration_raw = request.form.get("duration_minutes", "").strip()
                 
                 if not patient_id_raw or not appt_date:
                     flash("Patient ID and appointment date are required.", "error")
@@ -799,17 +742,19 @@ def appointment_form():
                                            form_fields=form_fields), 400
 
             doctor_id_val = None
-            if doctor_id_raw:
-                try:
+            try:
+                appt_start = datetime.fromisoformat(appt_date)
+                duration_val = int(duration_raw) if duration_raw else DEFAULT_APPOINTMENT_MINUTES
+                if doctor_id_raw:
                     doctor_id_val = int(doctor_id_raw)
-                except ValueError:
-                    flash("Doctor ID must be a number.", "error")
-                    return render_template("form.html",
-                                           form_title="Book Appointment",
-                                           form_subtitle="Schedule a new appointment",
-                                           form_action="/appointment",
-                                           submit_button_text="Book Appointment",
-                                           form_fields=form_fields), 400
+            except ValueError:
+                flash("Doctor ID, date and length must be valid values.", "error")
+                return render_template("form.html",
+                                       form_title="Book Appointment",
+                                       form_subtitle="Schedule a new appointment",
+                                       form_action="/appointment",
+                                       submit_button_text="Book Appointment",
+                                       form_fields=form_fields), 400
 
             conn = get_db_conn()
             cur = conn.cursor()
@@ -825,15 +770,20 @@ def appointment_form():
                                        submit_button_text="Book Appointment",
                                        form_fields=form_fields), 400
 
-            # Insert appointment
-            cur.execute(
-                """INSERT INTO Appointment (patient_id, doctor_id, appointment_date, status)
-                   VALUES (%s, %s, %s, %s)""",
-                (patient_id_val, doctor_id_val, appt_date, status)
-            )
-            conn.commit()
+            # Insert appointment; rejected if it overlaps another booking of the doctor. Front
+            # desk staff may book outside the doctor's template hours, patients may not.
+            book_appointment(conn, patient_id_val, doctor_id_val, appt_start, duration_val, status,
+                             enforce_availability=user_role == 'patient')
             flash("Appointment booked successfully!", "success")
             return redirect(url_for("success", message="Appointment booked successfully!"))
+        except SchedulingError as e:
+            flash(str(e), "error")
+            return render_template("form.html",
+                                   form_title="Book Appointment",
+                                   form_subtitle="Schedule a new appointment",
+                                   form_action="/appointment",
+                                   submit_button_text="Book Appointment",
+                                   form_fields=form_fields), 409
         except Exception as e:
             if conn:
                 conn.rollback()
@@ -859,6 +809,84 @@ def appointment_form():
         form_fields=form_fields)
 
 
+@app.route("/api/slots")
+@require_login
+def api_free_slots():
+    """Next free appointment slots for one doctor (?doctor_id=) or any doctor, served from the availability cache"""
+    try:
+        doctor_id = int(request.args["doctor_id"]) if request.args.get("doctor_id") else None
+        after = datetime.fromisoformat(request.args["after"]) if request.args.get("after") else None
+        limit = int(request.args.get("limit", "10"))
+    except ValueError:
+        return jsonify({"error": "doctor_id and limit must be integers, after an ISO date/time"}), 400
+    slots = availability.next_free_slots(doctor_id, after, limit)
+    return jsonify({"slots": [
+        {"doctor_id": slot_doctor, "start": start.isoformat(timespec="minutes"), "end": end.isoformat(timespec="minutes")}
+        for slot_doctor, start, end in slots
+    ]})
+
+
+def parse_calendar_args():
+    """(view, first day, day after the last) from ?view=day|week|month&date=YYYY-MM-DD (default: this week)"""
+    view = request.args.get("view", "week")
+    day = date.fromisoformat(request.args["date"]) if request.args.get("date") else date.today()
+    first, last = calendar_range(view, day)
+    return view, first, last
+
+
+@app.route("/calendar/doctor/<int:doctor_id>")
+@require_role('staff', 'admin')
+def doctor_calendar_view(doctor_id: int):
+    """A doctor's appointments for a day, week or month as JSON, from the per doctor-day cache"""
+    try:
+        view, first, last = parse_calendar_args()
+    except ValueError:
+        return jsonify({"error": "view must be day, week or month and date YYYY-MM-DD"}), 400
+    conn = get_db_conn()
+    try:
+        entries = doctor_calendar(conn, doctor_id, first, last)
+    finally:
+        conn.close()
+    batches = (entries[i:i + STREAM_BATCH_SIZE] for i in range(0, len(entries), STREAM_BATCH_SIZE))
+    chunks = json_object_chunks({"doctor_id": doctor_id, "view": view, "start": first.isoformat(),
+                                 "end": last.isoformat()}, "appointments", batches)
+    return Response(chunks, mimetype="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.route("/calendar/patient/<int:patient_id>")
+@require_login
+def patient_calendar_view(patient_id: int):
+    """A patient's appointments for a day, week or month as JSON; patients only see their own"""
+    if get_current_user_role() == 'patient' and (session.get('patient_id') or session.get('user_id')) != patient_id:
+        return jsonify({"error": "You can only view your own appointments."}), 403
+    try:
+        view, first, last = parse_calendar_args()
+    except ValueError:
+        return jsonify({"error": "view must be day, week or month and date YYYY-MM-DD"}), 400
+
+    conn = get_db_conn()
+    try:
+        cur = conn.cursor(buffered=False)
+        patient_calendar(cur, patient_id, first, last)
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        try:
+            yield from json_object_chunks({"patient_id": patient_id, "view": view, "start": first.isoformat(),
+                                           "end": last.isoformat()},
+                                          "appointments", calendar_entries(fetch_batches(cur)))
+        finally:
+            try:
+                cur.close()
+            finally:
+                conn.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/json",
+                    headers={"Cache-Control": "no-store"})
+
+
 @app.route("/medical-record", methods=["GET", "POST"])
 @require_role('staff', 'admin')
 def medical_record_form():
@@ -925,32 +953,25 @@ def view_my_bills():
         flash("This page is for patients only.", "error")
         return redirect(url_for("dashboard"))
     
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+
     conn = cur = None
     try:
         conn = get_db_conn()
         cur = conn.cursor(dictionary=True)
         
-        # Get all bills for this patient
-        cur.execute("""
-            SELECT billing_id, total_amount, paid_amount, status, created_at, payment_due_date
-            FROM Billing
-            WHERE patient_id = %s
-            ORDER BY created_at DESC
-        """, (user_id,))
-        
-        bills = cur.fetchall()
-        
-        # Get payment transactions for each bill
-        for bill in bills:
-            cur.execute("""
-                SELECT amount, paid_at, status, note
-                FROM Payment_Transactions
-                WHERE billing_id = %s
-                ORDER BY paid_at DESC
-            """, (bill['billing_id'],))
-            bill['payments'] = cur.fetchall()
+        # One joined query for this page of bills and all of their payments
+        # (fetch one extra bill to know whether a next page exists)
+        bills = fetch_bills_with_payments(cur, user_id, limit=BILLS_PAGE_SIZE + 1,
+                                          offset=(page - 1) * BILLS_PAGE_SIZE)
+        has_next = len(bills) > BILLS_PAGE_SIZE
+        bills = bills[:BILLS_PAGE_SIZE]
         
-        return render_template("my_bills.html", bills=bills)
+        return render_template("my_bills.html", bills=bills, page=page, has_next=has_next,
+                               outstanding=outstanding_balance(cur, user_id))
     except Exception as e:
         print(f"Error fetching bills: {e}")
         flash("Unable to load billing information.", "error")
@@ -971,60 +992,18 @@ def list_patients():
         conn = get_db_conn()
         cur = conn.cursor(dictionary=True)
         
-        # Get search query if provided
+        # Get search query and keyset cursor if provided
         search_query = request.args.get('search', '').strip()
+        after = parse_cursor(request.args.get('after'))
         
-        if search_query:
-            # Search by name or patient ID (can't search encrypted email directly)
-            # Try to match patient ID first (numeric)
-            try:
-                patient_id_search = int(search_query)
-                cur.execute("""
-                    SELECT p.patient_id, p.first_name, p.last_name, 
-                           p.email, p.phone_number, p.dob
-                    FROM Patient p
-                    WHERE p.patient_id = %s
-                    ORDER BY p.patient_id DESC
-                    LIMIT 50
-                """, (patient_id_search,))
-            except ValueError:
-                # Not a number, search by name
-                cur.execute("""
-                    SELECT p.patient_id, p.first_name, p.last_name, 
-                           p.email, p.phone_number, p.dob
-                    FROM Patient p
-                    WHERE p.first_name LIKE %s 
-                       OR p.last_name LIKE %s
-                       OR CONCAT(p.first_name, ' ', p.last_name) LIKE %s
-                    ORDER BY p.patient_id DESC
-                    LIMIT 50
-                """, (f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'))
-        else:
-            # Get recent patients (last 50)
-            cur.execute("""
-                SELECT p.patient_id, p.first_name, p.last_name, 
-                       p.email, p.phone_number, p.dob
-                FROM Patient p
-                ORDER BY p.patient_id DESC
-                LIMIT 50
-            """)
-        
-        patients = cur.fetchall()
+        patients, next_cursor = search_patients(cur, search_query, after=after)
         
         # Decrypt sensitive fields
-        for patient in patients:
-            if patient.get('email'):
-                try:
-                    patient['email'] = decrypt_data(patient['email'])
-                except Exception as e:
-                    patient['email'] = '[Encrypted]'
-            if patient.get('phone_number'):
-                try:
-                    patient['phone_number'] = decrypt_data(patient['phone_number'])
-                except Exception as e:
-                    patient['phone_number'] = '[Encrypted]'
+        if patients:
+            decrypt_many(patients, encrypted_columns("Patient", patients[0]))
         
-        return render_template("patient_list.html", patients=patients, search_query=search_query)
+        return render_template("patient_list.html", patients=patients, search_query=search_query,
+                               next_cursor=next_cursor, is_first_page=after is None)
     except Exception as e:
         error_msg = str(e)
         print(f"Error listing patients: {error_msg}")
@@ -1137,17 +1116,6 @@ def payment_form():
                     flash("Invalid input values.", "error")
                     return redirect(url_for("payment_form"))
                 
-                # Verify billing belongs to this patient
-                cur.execute("SELECT patient_id, total_amount, status FROM Billing WHERE billing_id = %s", (billing_id_val,))
-                billing = cur.fetchone()
-                if not billing:
-                    flash("Billing record not found.", "error")
-                    return redirect(url_for("payment_form"))
-                
-                if billing['patient_id'] != user_id:
-                    flash("You can only make payments for your own bills.", "error")
-                    return redirect(url_for("payment_form"))
-                
                 # Verify payment method belongs to this patient
                 if payment_method_id_val:
                     cur.execute("SELECT payment_method_id, type, last4 FROM Payment_Methods WHERE payment_method_id = %s AND patient_id = %s", 
@@ -1166,16 +1134,20 @@ def payment_form():
                 payment_method_last4 = pm['last4'] if pm else 'N/A'
                 transaction_note = f"Payment Method: {payment_method_type} ending in {payment_method_last4}; Transaction ID: {transaction_id}"
                 
-                # Insert into Payment_Transactions
-                cur.execute(
-                    """INSERT INTO Payment_Transactions (billing_id, patient_id, payment_method_id, amount, paid_at, status, note)
-                       VALUES (%s, %s, %s, %s, NOW(), %s, %s)""",
-                    (billing_id_val, user_id, payment_method_id_val, payment_amount_val, 'Posted', transaction_note)
-                )
-                
-                conn.commit()
-                flash(f"Payment processed successfully! Transaction ID: {transaction_id}", "success")
+                # Locks the bill, checks ownership and balance, and records the payment at most
+                # once per form submission (a double-submit returns the original payment)
+                _, created = post_payment(conn, billing_id_val, payment_amount_val,
+                                          request.form.get("idempotency_key", "").strip(),
+                                          payment_method_id=payment_method_id_val, note=transaction_note,
+                                          patient_id=user_id, changed_by=get_audit_actor())
+                if created:
+                    flash(f"Payment processed successfully! Transaction ID: {transaction_id}", "success")
+                else:
+                    flash("This payment was already processed.", "success")
                 return redirect(url_for("dashboard"))
+            except PaymentError as e:
+                flash(str(e), "error")
+                return redirect(url_for("payment_form"))
             except Exception as e:
                 if conn:
                     conn.rollback()
@@ -1194,14 +1166,8 @@ def payment_form():
             conn = get_db_conn()
             cur = conn.cursor(dictionary=True)
             
-            # Get patient's bills (for making payments)
-            cur.execute("""
-                SELECT billing_id, total_amount, paid_amount, status, created_at, payment_due_date
-                FROM Billing
-                WHERE patient_id = %s
-                ORDER BY created_at DESC
-            """, (user_id,))
-            bills = cur.fetchall()
+            # Get patient's bills (for making payments) together with their payments
+            bills = fetch_bills_with_payments(cur, user_id)
             
             # Get patient's payment methods
             cur.execute("""
@@ -1212,18 +1178,9 @@ def payment_form():
             """, (user_id,))
             payment_methods = cur.fetchall()
             
-            # Get patient's payment history (transactions)
-            cur.execute("""
-                SELECT pt.payment_id, pt.billing_id, pt.amount, pt.paid_at, pt.status, pt.note,
-                       b.total_amount as bill_total
-                FROM Payment_Transactions pt
-                JOIN Billing b ON pt.billing_id = b.billing_id
-                WHERE pt.patient_id = %s
-                ORDER BY pt.paid_at DESC
-            """, (user_id,))
-            payment_history = cur.fetchall()
-            
-            return render_template("patient_payment.html", bills=bills, payment_methods=payment_methods, payment_history=payment_history)
+            # Payment history is assembled from the payments already grouped under each bill
+            return render_template("patient_payment.html", bills=bills, payment_methods=payment_methods,
+                                   payment_history=payment_history(bills), idempotency_key=new_idempotency_key())
         except Exception as e:
             print(f"Error loading payment page: {e}")
             flash("Unable to load payment information.", "error")
@@ -1264,7 +1221,7 @@ def payment_form():
                         {'name': 'payment_date', 'label': 'Payment Date', 'type': 'datetime-local', 'required': True},
                         {'name': 'payment_method', 'label': 'Payment Method', 'type': 'text', 'required': True, 'placeholder': 'e.g., Credit Card, Debit Card, Cash'},
                         {'name': 'transaction_id', 'label': 'Transaction ID', 'type': 'text', 'required': True, 'placeholder': 'Enter transaction ID'}
-                    ]), 400
+                    ], idempotency_key=new_idempotency_key()), 400
             
             patient_id = billing_row[0]
             
@@ -1279,20 +1236,20 @@ def payment_form():
             payment_method_name = request.form.get('payment_method', '')
             transaction_note = f"Payment Method: {payment_method_name}; Transaction ID: [encrypted]"
             
-            # Use Payment_Transactions
-            cur.execute(
-                """INSERT INTO Payment_Transactions (billing_id, patient_id, payment_method_id, amount, paid_at, status, note)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                (request.form.get("billing_id"), patient_id, payment_method_id, request.form.get("payment_amount"),
-                 request.form.get("payment_date"), 'Posted', transaction_note)
-            )
-            conn.commit()
-            return redirect(url_for("success", message="Payment processed successfully!"))
+            # Use Payment_Transactions; the bill is locked and its ledger updated in the same transaction
+            _, created = post_payment(conn, int(request.form.get("billing_id")),
+                                      Decimal(request.form.get("payment_amount")),
+                                      request.form.get("idempotency_key", "").strip(),
+                                      payment_method_id=payment_method_id, note=transaction_note,
+                                      paid_at=request.form.get("payment_date") or None, changed_by=get_audit_actor())
+            message = "Payment processed successfully!" if created else "This payment was already processed."
+            return redirect(url_for("success", message=message))
         except Exception as e:
             if conn:
                 conn.rollback()
             print("Payment processing error:", repr(e))
-            flash("Unable to process payment. Check billing ID and amounts.", "error")
+            flash(str(e) if isinstance(e, PaymentError) else "Unable to process payment. Check billing ID and amounts.",
+                  "error")
             return render_template("form.html",
                 form_title="Payment Processing",
                 form_subtitle="Process a payment for a billing record",
@@ -1304,7 +1261,7 @@ def payment_form():
                     {'name': 'payment_date', 'label': 'Payment Date', 'type': 'datetime-local', 'required': True},
                     {'name': 'payment_method', 'label': 'Payment Method', 'type': 'text', 'required': True, 'placeholder': 'e.g., Credit Card, Debit Card, Cash'},
                     {'name': 'transaction_id', 'label': 'Transaction ID', 'type': 'text', 'required': True, 'placeholder': 'Enter transaction ID'}
-                ]), 500
+                ], idempotency_key=new_idempotency_key()), 500
         finally:
             if cur:
                 cur.close()
@@ -1327,7 +1284,7 @@ def payment_form():
             {'name': 'payment_date', 'label': 'Payment Date', 'type': 'datetime-local', 'required': True},
             {'name': 'payment_method', 'label': 'Payment Method', 'type': 'text', 'required': True, 'placeholder': 'e.g., Credit Card, Debit Card, Cash'},
             {'name': 'transaction_id', 'label': 'Transaction ID', 'type': 'text', 'required': True, 'placeholder': 'Enter transaction ID'}
-        ])
+        ], idempotency_key=new_idempotency_key())
 
 
 @app.route("/add-payment-method", methods=["GET", "POST"])
@@ -1429,6 +1386,98 @@ def add_payment_method():
     return render_template("add_payment_method.html", form_data={})
 
 
+# Hard-allowlist tables and their primary keys; all admin browser SQL is built from
+# these constants (never from request input) to avoid dynamic SQL injection.
+ADMIN_TABLE_PRIMARY_KEYS = {
+    "Users": "user_id",
+    "Staff": "staff_id",
+    "Patient": "patient_id",
+    "Patient_Sensitive": "sensitive_id",
+    "Appointment": "appointment_id",
+    "Medical_Record": "record_id",
+    "Billing": "billing_id",
+    "Payment_Methods": "payment_method_id",
+    "Payment_Transactions": "payment_id",
+    "Audit_Log": "audit_id",
+}
+
+# Keyset ("seek") pagination: every page is an index range read on the primary key,
+# so page 1 and page 10,000 of Audit_Log cost the same.
+ALLOWED_TABLE_QUERIES = {
+    table: {
+        "count": f"SELECT COUNT(*) AS count FROM {table}",
+        "first": f"SELECT * FROM {table} ORDER BY {pk} LIMIT %s",
+        "after": f"SELECT * FROM {table} WHERE {pk} > %s ORDER BY {pk} LIMIT %s",
+        # Backward pages are read descending and re-sorted by the server so rows stream in key order
+        "before": f"SELECT * FROM (SELECT * FROM {table} WHERE {pk} < %s ORDER BY {pk} DESC LIMIT %s) page "
+                  f"ORDER BY {pk}",
+        "last": f"SELECT * FROM (SELECT * FROM {table} ORDER BY {pk} DESC LIMIT %s) page ORDER BY {pk}",
+        "exists_before": f"SELECT 1 AS found FROM {table} WHERE {pk} < %s LIMIT 1",
+    }
+    for table, pk in ADMIN_TABLE_PRIMARY_KEYS.items()
+}
+
+ADMIN_PAGE_SIZE = 50
+# Pages stream through row_pipeline in STREAM_BATCH_SIZE chunks, so large pages stay cheap on memory
+ADMIN_MAX_PAGE_SIZE = int(os.environ.get("ADMIN_MAX_PAGE_SIZE", "5000"))
+EXPORT_FORMATS = {
+    "csv": ("text/csv", csv_chunks),
+    "ndjson": ("application/x-ndjson", ndjson_chunks),
+}
+# Export column policy: these are never exported, not even with plaintext=1 (credentials,
+# full card payloads). plaintext=1 only decrypts the encrypted-registry columns; every
+# other sensitive column stays masked.
+EXPORT_OMITTED_COLUMNS = {
+    "Users": ("password_hash",),
+    "Payment_Methods": ("data_enc",),
+}
+ROW_COUNT_CACHE_TTL = int(os.environ.get("ROW_COUNT_CACHE_TTL", "60"))
+_row_count_cache = {}  # table -> (count, is_exact, fetched_at)
+_row_count_lock = threading.Lock()
+
+
+def get_table_row_count(cur, table_name, exact=False):
+    """Return (row_count, is_exact) for an allowlisted table.
+
+    Estimates come from information_schema.TABLES (refreshed for every table at
+    once, at most every ROW_COUNT_CACHE_TTL seconds); an exact COUNT(*) is only
+    run on demand and then cached for the same TTL.
+    """
+    now = time.time()
+    with _row_count_lock:
+        cached = _row_count_cache.get(table_name)
+    if cached and now - cached[2] < ROW_COUNT_CACHE_TTL and (cached[1] or not exact):
+        return cached[0], cached[1]
+
+    if exact:
+        cur.execute(ALLOWED_TABLE_QUERIES[table_name]["count"])
+        result = (cur.fetchone()["count"], True, now)
+        with _row_count_lock:
+            _row_count_cache[table_name] = result
+        return result[0], True
+
+    cur.execute("""
+        SELECT TABLE_NAME, TABLE_ROWS
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+    """)
+    with _row_count_lock:
+        for row in cur.fetchall():
+            previous = _row_count_cache.get(row["TABLE_NAME"])
+            if previous and previous[1] and now - previous[2] < ROW_COUNT_CACHE_TTL:
+                continue
+            _row_count_cache[row["TABLE_NAME"]] = (int(row["TABLE_ROWS"] or 0), False, now)
+        cached = _row_count_cache.get(table_name, (0, False, now))
+    return cached[0], cached[1]
+
+
+def _parse_key(raw):
+    try:
+        return int(raw) if raw not in (None, "") else None
+    except ValueError:
+        return None
+
+
 @app.route("/admin/tables")
 @require_role('admin')
 def admin_view_tables():
@@ -1438,124 +1487,91 @@ def admin_view_tables():
         conn = get_db_conn()
         cur = conn.cursor(dictionary=True)
         
-        # Get the selected table name
+        # Get the selected table name, keyset cursor and page size
         table_name = request.args.get('table', '').strip()
-        page = int(request.args.get('page', 1))
-        limit = 50
-        offset = (page - 1) * limit
+        after = _parse_key(request.args.get('after'))
+        before = _parse_key(request.args.get('before'))
+        jump_to_last = request.args.get('last') == '1'
+        exact_count = request.args.get('exact') == '1'
+        limit = min(max(_parse_key(request.args.get('size')) or ADMIN_PAGE_SIZE, 1), ADMIN_MAX_PAGE_SIZE)
+        page_size = limit if limit != ADMIN_PAGE_SIZE else None
+        
+        # Get list of all tables in the database (from the in-process schema cache)
+        all_tables = schema_cache.tables()
         
-        # Get list of all tables in the database
-        cur.execute("""
-            SELECT TABLE_NAME 
-            FROM information_schema.TABLES 
-            WHERE TABLE_SCHEMA = DATABASE()
-            ORDER BY TABLE_NAME
-        """)
-        all_tables = [row['TABLE_NAME'] for row in cur.fetchall()]
-
-        # Hard-allowlist tables and their safe queries to avoid dynamic SQL injection
-        allowed_table_queries = {
-            "Users": (
-                "SELECT COUNT(*) as count FROM Users",
-                "SELECT * FROM Users LIMIT %s OFFSET %s",
-            ),
-            "Staff": (
-                "SELECT COUNT(*) as count FROM Staff",
-                "SELECT * FROM Staff LIMIT %s OFFSET %s",
-            ),
-            "Patient": (
-                "SELECT COUNT(*) as count FROM Patient",
-                "SELECT * FROM Patient LIMIT %s OFFSET %s",
-            ),
-            "Patient_Sensitive": (
-                "SELECT COUNT(*) as count FROM Patient_Sensitive",
-                "SELECT * FROM Patient_Sensitive LIMIT %s OFFSET %s",
-            ),
-            "Appointment": (
-                "SELECT COUNT(*) as count FROM Appointment",
-                "SELECT * FROM Appointment LIMIT %s OFFSET %s",
-            ),
-            "Medical_Record": (
-                "SELECT COUNT(*) as count FROM Medical_Record",
-                "SELECT * FROM Medical_Record LIMIT %s OFFSET %s",
-            ),
-            "Billing": (
-                "SELECT COUNT(*) as count FROM Billing",
-                "SELECT * FROM Billing LIMIT %s OFFSET %s",
-            ),
-            "Payment_Methods": (
-                "SELECT COUNT(*) as count FROM Payment_Methods",
-                "SELECT * FROM Payment_Methods LIMIT %s OFFSET %s",
-            ),
-            "Payment_Transactions": (
-                "SELECT COUNT(*) as count FROM Payment_Transactions",
-                "SELECT * FROM Payment_Transactions LIMIT %s OFFSET %s",
-            ),
-            "Audit_Log": (
-                "SELECT COUNT(*) as count FROM Audit_Log",
-                "SELECT * FROM Audit_Log LIMIT %s OFFSET %s",
-            ),
-        }
+        if not table_name:
+            return render_template("admin_tables.html", tables=all_tables, selected_table=None, columns=[])
+
+        # Validate table name to prevent SQL injection and enforce allowlist
+        if table_name not in all_tables or table_name not in ALLOWED_TABLE_QUERIES:
+            flash(f"Table '{table_name}' not found or not allowed.", "error")
+            return render_template("admin_tables.html", tables=all_tables, selected_table=None, columns=[])
         
-        table_data = None
-        total_rows = 0
-        columns = []
+        # Get column information
+        columns = schema_cache.columns(table_name)
+        column_names = [col['COLUMN_NAME'] for col in columns]
         
-        if table_name:
-            # Validate table name to prevent SQL injection and enforce allowlist
-            if table_name not in all_tables or table_name not in allowed_table_queries:
-                flash(f"Table '{table_name}' not found or not allowed.", "error")
-                return render_template("admin_tables.html", 
-                                     tables=all_tables, 
-                                     selected_table=None,
-                                     table_data=None,
-                                     columns=[],
-                                     page=1,
-                                     total_pages=0)
-            
-            # Get column information
-            cur.execute(f"""
-                SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-                FROM information_schema.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
-                ORDER BY ORDINAL_POSITION
-            """, (table_name,))
-            columns = cur.fetchall()
-            
-            # Get total row count using allowlisted query
-            sql_count = allowed_table_queries[table_name][0]
-            cur.execute(sql_count)
-            total_rows = cur.fetchone()['count']
-            total_pages = (total_rows + limit - 1) // limit
-            
-            # Get table data with pagination
-            sql_data = allowed_table_queries[table_name][1]
-            cur.execute(sql_data, (limit, offset))
-            table_data = cur.fetchall()
-            
-            # Try to decrypt BLOB fields that might be encrypted
-            for row in table_data:
-                for key, value in row.items():
-                    if isinstance(value, bytes) and value:
-                        try:
-                            # Try to decrypt - if it fails, keep as is
-                            decrypted = decrypt_data(value)
-                            row[key] = decrypted
-                        except:
-                            # If decryption fails, show as hex or base64
-                            try:
-                                row[key] = f"[BLOB: {len(value)} bytes]"
-                            except:
-                                row[key] = "[Binary Data]"
+        total_rows, total_rows_exact = get_table_row_count(cur, table_name, exact=exact_count)
+        
+        # Keyset pagination; forward pages read one extra row to tell whether more exist
+        queries = ALLOWED_TABLE_QUERIES[table_name]
+        primary_key = ADMIN_TABLE_PRIMARY_KEYS[table_name]
+        if before is not None:
+            cur.execute(queries["before"], (before, limit))
+        elif jump_to_last:
+            cur.execute(queries["last"], (limit,))
+        elif after is not None:
+            cur.execute(queries["after"], (after, limit + 1))
+        else:
+            cur.execute(queries["first"], (limit + 1,))
+        
+        # fetch -> decrypt registry columns only -> summarize other binary values -> mask.
+        # Plaintext never reaches the template; it only sees masked display values.
+        page = PageState()
+        batches = take_page(fetch_batches(cur), limit, primary_key, page)
+        batches = decrypt_batches(batches, encrypted_columns(table_name, column_names))
+        batches = mask_batches(summarize_binary(batches), column_names)
+        first_batch = next(batches, None)
+        
+        def stream_rows(conn, cur):
+            try:
+                if first_batch:
+                    yield from first_batch
+                    yield from iter_rows(batches)
+                if before is not None or jump_to_last:
+                    if page.first_key is not None:
+                        cur.execute(queries["exists_before"], (page.first_key,))
+                        page.has_prev = cur.fetchone() is not None
+                    page.has_next = before is not None
+                else:
+                    page.has_prev = after is not None
+                    page.has_next = page.has_more
+            except Exception as e:
+                # Re-raised so the response is aborted: a shortened table must not render as complete
+                app.logger.error(f"Error streaming table {table_name}: {e}", exc_info=True)
+                raise
+            finally:
+                try:
+                    cur.fetchall()
+                except Exception:
+                    pass
+                cur.close()
+                conn.close()
         
-        return render_template("admin_tables.html",
-                             tables=all_tables,
-                             selected_table=table_name,
-                             table_data=table_data,
-                             columns=columns,
-                             page=page,
-                             total_pages=total_pages if table_name else 0,
-                             total_rows=total_rows)
+        rows = stream_rows(conn, cur)
+        # The row generator now owns the connection and closes it when the page is done
+        conn = cur = None
+        return Response(stream_template("admin_tables.html",
+                                        tables=all_tables,
+                                        selected_table=table_name,
+                                        rows=rows,
+                                        page=page,
+                                        page_size=page_size,
+                                        sensitive_columns={name for name in column_names if is_sensitive_column(name)},
+                                        columns=columns,
+                                        primary_key=primary_key,
+                                        total_rows=total_rows,
+                                        total_rows_exact=total_rows_exact))
     except Exception as e:
         error_msg = str(e)
         print(f"Error viewing tables: {error_msg}")
@@ -1569,106 +1585,182 @@ def admin_view_tables():
             conn.close()
 
 
+@app.route("/admin/export/<table_name>")
+@require_role('admin')
+def admin_export_table(table_name):
+    """Stream a full allowlisted table as CSV or NDJSON (masked; plaintext=1 decrypts encrypted columns)"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description="format must be csv or ndjson")
+    if table_name not in ALLOWED_TABLE_QUERIES or table_name not in schema_cache.tables():
+        abort(404)
+    plaintext = request.args.get('plaintext') == '1'
+    omitted = EXPORT_OMITTED_COLUMNS.get(table_name, ())
+    column_names = [name for name in schema_cache.column_names(table_name)
+                    if name not in omitted and "password" not in name.lower()]
+    decrypted = encrypted_columns(table_name, column_names)
+    masked_in_plaintext = [name for name in column_names if is_sensitive_column(name) and name not in decrypted]
+    mimetype, serialize = EXPORT_FORMATS[export_format]
+    app.logger.info(f"Table export: table={table_name} format={export_format} plaintext={plaintext} "
+                    f"user_id={session.get('user_id')}")
+
+    conn = get_db_conn()
+    try:
+        # Unbuffered cursor: rows are read off the socket batch by batch, so memory
+        # stays flat regardless of table size
+        cur = conn.cursor(dictionary=True, buffered=False)
+        # Explicit column list (names from the schema cache) so omitted columns are never read
+        cur.execute(f"SELECT {', '.join(f'`{name}`' for name in column_names)} FROM {table_name} "
+                    f"ORDER BY {ADMIN_TABLE_PRIMARY_KEYS[table_name]}")
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        try:
+            batches = decrypt_batches(fetch_batches(cur, EXPORT_BATCH_SIZE), decrypted)
+            batches = summarize_binary(batches)
+            if plaintext:
+                batches = mask_selected(batches, masked_in_plaintext)
+            else:
+                batches = mask_batches(batches, column_names)
+            yield from serialize(batches, column_names)
+        except Exception as e:
+            # Re-raised so the server aborts the response: a truncated file must not look complete
+            app.logger.error(f"Error exporting table {table_name}: {e}", exc_info=True)
+            raise
+        finally:
+            try:
+                cur.close()
+            finally:
+                conn.close()
+
+    filename = f"{table_name}-{time.strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Accel-Buffering": "no",
+    })
+
+
+@app.route("/admin/db-pool")
+@require_role('admin')
+def admin_db_pool_stats():
+    """Connection pool counters for sizing DB_POOL_SIZE / DB_POOL_MAX_OVERFLOW"""
+    return jsonify(get_pool_stats())
+
+
+@app.route("/admin/users/<int:user_id>/revoke-sessions", methods=["POST"])
+@require_role('admin')
+def admin_revoke_sessions(user_id: int):
+    """Log a user out everywhere, e.g. after changing their role or deactivating them"""
+    revoked = app.session_interface.revoke_user(user_id)
+    app.logger.info(f"Sessions revoked: user_id={user_id} count={revoked} by={get_audit_actor()}")
+    return jsonify({"user_id": user_id, "revoked": revoked})
+
+
+@app.route("/admin/metrics")
+@require_role('admin')
+def admin_metrics():
+    """Per-endpoint latency histograms (wall, DB, crypto, template) since startup, plus audit writer counters"""
+    return jsonify(dict(instrumentation.registry.snapshot(), audit=audit.stats(),
+                        sessions=app.session_interface.stats()))
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is serving requests"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: database reachable with a current schema and key material loaded"""
+    ready, checks = readiness(get_db_conn)
+    return jsonify({"status": "ready" if ready else "not ready", "checks": checks}), 200 if ready else 503
+
+
 @app.route("/success")
 def success():
     message = request.args.get("message", "Your information has been successfully submitted and securely stored in the system.")
     return render_template("success.html", success_message=message)
 
 
+def preload_shared_state():
+    """Load key material, table metadata and compiled templates up front.
+
+    In a pre-forking server this runs once in the master (gunicorn.conf.py), so
+    workers inherit the results instead of each paying for them on its first
+    requests. Idle DB connections opened here are closed before forking.
+    """
+    reload_key()  # also on server reload, so rotated keys are picked up
+    load_keys()
+    schema_cache.refresh(force=True)
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+    dispose_pool()
+
+
+def reset_after_fork():
+    """Drop state a forked worker must not share with its master (pooled DB sockets)."""
+    reset_pool_after_fork()
+
+
+def confirm_migration(state):
+    """Operator prompt used by interactive starts (stdin is a terminal)"""
+    print("\n" + "="*60)
+    print(f"Database 'secure_hospital_db' {state}.")
+    print("="*60)
+    print("The database needs to be set up or upgraded before running the application.")
+    print("A new database also gets the initial users and dummy data.")
+    response = input("\nRun hospital_db_setup.py now? (y/n): ").strip().lower()
+    return response in ['y', 'yes']
+
+
 def check_mysql_and_database():
-    """Check MySQL connection and database existence before starting the app"""
-    import mysql.connector
+    """Wait for MySQL and make sure the schema is current before starting the app.
+
+    Connection attempts back off for up to DB_STARTUP_TIMEOUT seconds, then the
+    Schema_Meta version is compared with hospital_db_setup.SCHEMA_VERSION. A
+    missing or old schema is migrated when AUTO_MIGRATE allows it, or after a
+    prompt if stdin is a terminal (STARTUP_INTERACTIVE=0 disables prompts).
+    """
     from mysql.connector import Error
     
-    # Check if .env file exists
-    if not os.path.exists('.env'):
-        print("\n" + "="*60)
-        print("ERROR: .env file not found!")
-        print("="*60)
-        print("Please create a .env file in the project root with:")
-        print("  DB_USER=your_mysql_username")
-        print("  DB_PASS=your_mysql_password")
-        print("\nExample:")
-        print("  DB_USER=root")
-        print("  DB_PASS=mypassword")
-        print("\nFor detailed setup instructions, please refer to README.md")
-        print("="*60 + "\n")
-        return False
-    
-    # Get credentials from .env
+    # Credentials come from .env or the process environment (containers)
     db_user = os.environ.get("DB_USER")
     db_pass = os.environ.get("DB_PASS")
     
     if not db_user or not db_pass:
         print("\n" + "="*60)
-        print("ERROR: Database credentials not found in .env file!")
+        print("ERROR: Database credentials not found!")
         print("="*60)
-        print("Please ensure your .env file contains:")
+        print("Please set DB_USER and DB_PASS in the environment or in a .env file in the project root:")
         print("  DB_USER=your_mysql_username")
         print("  DB_PASS=your_mysql_password")
         print("\nFor detailed setup instructions, please refer to README.md")
         print("="*60 + "\n")
         return False
     
-    # Try to connect to MySQL server (without specifying database)
+    interactive = os.environ.get("STARTUP_INTERACTIVE", "1" if sys.stdin and sys.stdin.isatty() else "0") == "1"
     try:
         print("\n" + "="*60)
-        print("Checking MySQL connection...")
+        print("Checking MySQL connection and schema version...")
         print("="*60)
-        conn = mysql.connector.connect(
-            host="localhost",
-            user=db_user,
-            password=db_pass
-        )
-        print("✓ MySQL server is running and accessible")
-        cursor = conn.cursor()
-        
-        # Check if database exists
-        cursor.execute("SHOW DATABASES LIKE 'secure_hospital_db'")
-        db_exists = cursor.fetchone() is not None
-        
-        cursor.close()
-        conn.close()
-        
-        if not db_exists:
-            print("\n" + "="*60)
-            print("Database 'secure_hospital_db' not found!")
-            print("="*60)
-            print("The database needs to be set up before running the application.")
-            print("\nWould you like to run the database setup script now?")
-            print("This will create the database, tables, and insert dummy data.")
-            
-            response = input("\nRun hospital_db_setup.py? (y/n): ").strip().lower()
-            
-            if response in ['y', 'yes']:
-                print("\nRunning database setup...")
-                from hospital_db_setup import main as setup_main
-                try:
-                    setup_main()
-                    print("\n✓ Database setup completed successfully!")
-                    return True
-                except Exception as e:
-                    print(f"\n✗ Error during database setup: {e}")
-                    print("\nYou can manually run: python hospital_db_setup.py")
-                    print("For troubleshooting, please refer to README.md")
-                    return False
-            else:
-                print("\nPlease run 'python hospital_db_setup.py' manually to set up the database.")
-                print("For detailed setup instructions, please refer to README.md")
-                print("Exiting...")
-                return False
-        else:
-            print("✓ Database 'secure_hospital_db' exists")
-            print("="*60 + "\n")
-            return True
-            
+        version = ensure_schema(connect_to_db, confirm=confirm_migration if interactive else None)
+        print(f"✓ Database 'secure_hospital_db' is at schema version {version}")
+        print("="*60 + "\n")
+        return True
+    except StartupError as e:
+        print(f"\n✗ {e}")
+        print("For detailed setup instructions, please refer to README.md")
+        return False
     except Error as e:
         print("\n" + "="*60)
         print("ERROR: Cannot connect to MySQL server!")
         print("="*60)
         print(f"Error: {e}")
         print("\nPossible issues:")
-        print("  1. MySQL server is not running")
+        print("  1. MySQL server is not running (waited DB_STARTUP_TIMEOUT seconds)")
         print("  2. Incorrect credentials in .env file")
         print("  3. MySQL server is not installed")
         print("\nTo install MySQL:")
@@ -1685,16 +1777,24 @@ def check_mysql_and_database():
         print("For troubleshooting, please refer to README.md")
         return False
 
-
 if __name__ == "__main__":
     # Check MySQL connection and database before starting
     if not check_mysql_and_database():
         exit(1)
+
+    # `kill -HUP <pid>` makes the cached AES key re-read after rotating PII_AES_KEY / the key file
+    install_reload_signal_handler()
+    # Keys, table/column metadata and templates once up front instead of on the first requests
+    preload_shared_state()
     
+    # Development server (single process). For production run `gunicorn wsgi:app`, see gunicorn.conf.py.
     # TLS/HTTPS Configuration:
-    # - SSL context enabled when REQUIRE_HTTPS=1
+    # - SSL context enabled when REQUIRE_HTTPS=1: TLS_CERT_FILE/TLS_KEY_FILE if set, else a throwaway self-signed cert
     # - HTTPS enforcement and HSTS headers configured in enforce_security() and add_security_headers()
-    ssl_ctx = "adhoc" if app.config["REQUIRE_HTTPS"] else None
+    ssl_ctx = None
+    if app.config["REQUIRE_HTTPS"]:
+        cert_file, key_file = os.environ.get("TLS_CERT_FILE"), os.environ.get("TLS_KEY_FILE")
+        ssl_ctx = (cert_file, key_file) if cert_file and key_file else "adhoc"
     # Debug disabled by default to avoid leaking stack traces; enable via FLASK_ENV=development if needed.
     host = os.environ.get("APP_HOST", "127.0.0.1")
     port = int(os.environ.get("APP_PORT", "5000"))
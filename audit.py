@@ -0,0 +1,408 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+# AUDIT_MODE=trigger (default) keeps the database triggers, which write Audit_Log
+# rows inside every business transaction as 'SYSTEM'. AUDIT_MODE=async drops the
+# triggers (see create_database_and_tables) and the application records events
+# with the acting user through a background batch writer instead. The app and the
+# setup script must run with the same mode.
+AUDIT_MODE = os.environ.get("AUDIT_MODE", "trigger").strip().lower()
+if AUDIT_MODE not in ("trigger", "async"):
+    raise RuntimeError(f"AUDIT_MODE must be 'trigger' or 'async', not {AUDIT_MODE!r}")
+ASYNC_AUDIT = AUDIT_MODE == "async"
+
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "500"))
+AUDIT_ENQUEUE_TIMEOUT = float(os.environ.get("AUDIT_ENQUEUE_TIMEOUT", "2"))
+# Events that cannot be written (queue still full, database down at shutdown) are
+# appended here and replayed by the next writer. Kept in cwd like the key files.
+_spool_env = os.environ.get("AUDIT_SPOOL_FILE", ".audit_spool.jsonl")
+AUDIT_SPOOL_FILE = os.path.join(os.getcwd(), os.path.basename(_spool_env))
+
+# Audit_Log is range-partitioned by month of changed_at (partitions pYYYYMM plus a
+# pmax catch-all). ensure_audit_partitions keeps this many future months created.
+AUDIT_PARTITIONS_AHEAD = 3
+AUDIT_OVERFLOW_PARTITION = "pmax"
+
+INSERT_SQL = """
+    INSERT INTO Audit_Log (table_name, record_id, action, changed_by, changed_at, old_data, new_data)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+WRITE_ATTEMPTS = 5
+
+
+class AsyncAuditWriter:
+    """Background thread that batches audit events into multi-row Audit_Log inserts.
+
+    submit() never touches the database. When the queue is full, callers wait up
+    to ``enqueue_timeout`` seconds for the writer to catch up (backpressure);
+    events that still do not fit go to the spool file instead of being dropped.
+    close() drains the queue and spools whatever cannot be written, so delivery
+    is at-least-once: a batch in flight at shutdown may be replayed twice.
+    """
+
+    def __init__(self, connect, queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 enqueue_timeout: float = AUDIT_ENQUEUE_TIMEOUT, spool_path: str = AUDIT_SPOOL_FILE,
+                 poll_interval: float = 0.5):
+        self._connect = connect
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self.spool_path = spool_path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._inflight = []
+        self._pid = None
+        self._stats = {"enqueued": 0, "written": 0, "batches": 0, "backpressure_waits": 0,
+                       "write_errors": 0, "spooled": 0, "replayed": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            self._start()
+
+    def _start(self) -> None:
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._stopping = threading.Event()
+        self._inflight = []
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def _check_fork(self) -> None:
+        # The writer thread does not survive fork(); events queued before it belong to the parent.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+
+    def submit(self, event) -> None:
+        """Queue one Audit_Log row (a tuple in INSERT_SQL column order)."""
+        self._check_fork()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self._stats["backpressure_waits"] += 1
+            try:
+                self._queue.put(event, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self._spool([event])
+                return
+        with self._lock:
+            self._stats["enqueued"] += 1
+
+    def _run(self) -> None:
+        self._replay_spool()
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._inflight = batch
+                self._write_with_retry(batch)
+                self._inflight = []
+                for _ in batch:
+                    self._queue.task_done()
+            elif self._stopping.is_set():
+                return
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return []
+        # Whatever accumulated while the previous batch was being written goes in one insert
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch) -> None:
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            try:
+                # mysql-connector turns executemany() of an INSERT into one multi-row statement
+                cur.executemany(INSERT_SQL, batch)
+            finally:
+                cur.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _write_with_retry(self, batch) -> bool:
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._write(batch)
+            except Exception as exc:
+                with self._lock:
+                    self._stats["write_errors"] += 1
+                if attempt == WRITE_ATTEMPTS - 1 or self._stopping.is_set():
+                    print(f"Audit writer: spooling {len(batch)} events after error: {exc!r}")
+                    self._spool(batch)
+                    return False
+                time.sleep(min(0.1 * 2 ** attempt, 5.0))
+            else:
+                with self._lock:
+                    self._stats["written"] += len(batch)
+                    self._stats["batches"] += 1
+                return True
+        return False
+
+    def _spool(self, events) -> None:
+        with self._lock:
+            with open(self.spool_path, "a", encoding="utf-8") as spool:
+                for event in events:
+                    spool.write(json.dumps(event, default=str) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+            self._stats["spooled"] += len(events)
+
+    def _replay_spool(self) -> None:
+        # Claim the spool by renaming it, so concurrent workers never replay the same file
+        claimed = f"{self.spool_path}.{os.getpid()}.replay"
+        try:
+            os.replace(self.spool_path, claimed)
+        except FileNotFoundError:
+            return
+        with open(claimed, encoding="utf-8") as spool:
+            events = [tuple(json.loads(line)) for line in spool if line.strip()]
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            if self._write_with_retry(batch):
+                with self._lock:
+                    self._stats["replayed"] += len(batch)
+        os.remove(claimed)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued event has been written (or spooled); False on timeout."""
+        if self._queue is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop the writer, writing what it can within ``timeout`` and spooling the rest."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        leftover = list(self._inflight) if self._thread.is_alive() else []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._spool(leftover)
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+        data.update(queued=self._queue.qsize() if self._queue else 0, queue_size=self.queue_size,
+                    running=bool(self._thread and self._thread.is_alive()))
+        return data
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> AsyncAuditWriter:
+    """The process-wide writer, started (and registered for shutdown) on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            from config import get_db_conn
+
+            _writer = AsyncAuditWriter(get_db_conn)
+            _writer.start()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def _json(data):
+    return None if data is None else json.dumps(data, default=str, separators=(",", ":"))
+
+
+def record(table_name: str, record_id: int, action: str, old=None, new=None, changed_by=None) -> None:
+    """Queue an audit event for a committed change (no-op in trigger mode).
+
+    ``old``/``new`` are dicts stored as JSON; ``changed_by`` names the acting user.
+    """
+    if not ASYNC_AUDIT:
+        return
+    get_writer().submit((table_name, record_id, action, changed_by or "SYSTEM", datetime.now(),
+                         _json(old), _json(new)))
+
+
+def flush(timeout: float = None) -> bool:
+    return _writer.flush(timeout) if _writer is not None else True
+
+
+def stats() -> dict:
+    data = {"mode": AUDIT_MODE}
+    if _writer is not None:
+        data.update(_writer.stats())
+    return data
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _partition_definition(month: datetime) -> str:
+    bound = _add_months(month, 1)
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{bound:%Y-%m-%d %H:%M:%S}'))"
+
+
+def audit_partition_clause(first_month: datetime, now: datetime = None, ahead: int = AUDIT_PARTITIONS_AHEAD) -> str:
+    """PARTITION BY clause with one partition per month from ``first_month`` to ``ahead`` months past now.
+
+    Rows older than the first month land in the first partition and rows past
+    the last month in pmax, so no insert ever fails for lack of a partition.
+    """
+    month = _month_start(first_month)
+    last = _add_months(_month_start(now or datetime.now()), ahead)
+    definitions = []
+    while month <= last:
+        definitions.append(_partition_definition(month))
+        month = _add_months(month, 1)
+    definitions.append(f"PARTITION {AUDIT_OVERFLOW_PARTITION} VALUES LESS THAN MAXVALUE")
+    return "PARTITION BY RANGE (UNIX_TIMESTAMP(changed_at)) (\n    " + ",\n    ".join(definitions) + "\n)"
+
+
+def audit_partitions(cur):
+    """Monthly partitions of Audit_Log in order, as ``(name, month, estimated_rows)``; [] if unpartitioned."""
+    cur.execute("""
+        SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Audit_Log' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [(name, datetime.strptime(name[1:], "%Y%m"), rows) for name, rows in cur.fetchall()
+            if name != AUDIT_OVERFLOW_PARTITION]
+
+
+def partition_audit_log(cur, now: datetime = None) -> bool:
+    """Convert an unpartitioned Audit_Log (from older versions of the setup script) in place.
+
+    The partition key has to be part of every unique key, so the primary key
+    becomes (audit_id, changed_at). Returns False if it is already partitioned.
+    """
+    cur.execute("""
+        SELECT COUNT(*) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Audit_Log' AND PARTITION_NAME IS NOT NULL
+    """)
+    if cur.fetchone()[0]:
+        return False
+    cur.execute("SELECT MIN(changed_at) FROM Audit_Log")
+    oldest = cur.fetchone()[0] or now or datetime.now()
+    cur.execute(f"""
+        ALTER TABLE Audit_Log
+            MODIFY changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (audit_id, changed_at)
+        {audit_partition_clause(oldest, now)}
+    """)
+    return True
+
+
+def ensure_audit_partitions(cur, now: datetime = None, ahead: int = AUDIT_PARTITIONS_AHEAD):
+    """Split pmax so partitions exist through ``ahead`` months from now; returns the names added."""
+    partitions = audit_partitions(cur)
+    if not partitions:
+        return []
+    target = _add_months(_month_start(now or datetime.now()), ahead)
+    month = _add_months(partitions[-1][1], 1)
+    added = []
+    while month <= target:
+        added.append(month)
+        month = _add_months(month, 1)
+    if added:
+        # pmax is normally empty, so reorganizing it is a metadata-only change
+        cur.execute(f"""
+            ALTER TABLE Audit_Log REORGANIZE PARTITION {AUDIT_OVERFLOW_PARTITION} INTO (
+                {", ".join(_partition_definition(month) for month in added)},
+                PARTITION {AUDIT_OVERFLOW_PARTITION} VALUES LESS THAN MAXVALUE
+            )
+        """)
+    return [f"p{month:%Y%m}" for month in added]
+
+
+def export_audit_partition(db_connection, partition: str, export_dir: str, batch_size: int = 5000):
+    """Write one partition as gzipped NDJSON to ``export_dir``; returns ``(path, rows)``.
+
+    The file is written under a temporary name and renamed once complete and
+    fsynced, so a partial export is never mistaken for a finished one.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, f"audit_log_{partition}.jsonl.gz")
+    partial = f"{path}.part"
+    rows = 0
+    cur = db_connection.cursor(dictionary=True)
+    try:
+        cur.execute(f"SELECT * FROM Audit_Log PARTITION ({partition}) ORDER BY audit_id")
+        with open(partial, "wb") as raw:
+            with gzip.open(raw, "wt", encoding="utf-8") as out:
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    out.write("".join(json.dumps(row, default=str) + "\n" for row in batch))
+                    rows += len(batch)
+            raw.flush()
+            os.fsync(raw.fileno())
+    finally:
+        cur.close()
+    os.replace(partial, path)
+    return path, rows
+
+
+def expire_audit_partitions(db_connection, keep_months: int, export_dir: str = None, drop: bool = True,
+                            now: datetime = None):
+    """Export and/or drop the monthly partitions older than the last ``keep_months`` months.
+
+    Dropping a partition removes a month of rows without row-by-row DELETEs or
+    long table locks. With ``export_dir`` each partition is archived first and
+    only dropped once its export is complete. Returns a list of
+    ``(partition, month, rows, export_path, dropped)``.
+    """
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1")
+    cutoff = _add_months(_month_start(now or datetime.now()), -(keep_months - 1))
+    cur = db_connection.cursor()
+    results = []
+    try:
+        for name, month, rows in audit_partitions(cur):
+            if month >= cutoff:
+                break
+            path = None
+            if export_dir:
+                path, rows = export_audit_partition(db_connection, name, export_dir)
+            if drop:
+                cur.execute(f"ALTER TABLE Audit_Log DROP PARTITION {name}")
+            results.append((name, month, rows, path, drop))
+    finally:
+        cur.close()
+    return results
@@ -0,0 +1,219 @@
+"""Micro-benchmarks for the crypto, masking and request-rendering hot paths.
+
+Run from the project root; exits non-zero when a benchmark is slower than the
+baseline by more than --threshold:
+
+    python -m benchmarks.hot_paths --save baseline.json
+    python -m benchmarks.hot_paths --baseline baseline.json --threshold 0.15
+
+Benchmarks that need MySQL (get_patient_record) are skipped when it is not
+reachable.
+"""
+import argparse
+import itertools
+import random
+from datetime import date
+
+import app as hospital_app
+from benchmarks.runner import (SkipBenchmark, compare, load_results, print_comparison, run_suite,
+                               save_results)
+from config import get_db_conn
+from crypto_utils import decrypt_value, encrypt_value
+from hospital_db_setup import decrypt_many, encrypt_many
+from masking import is_sensitive_column, mask_rows
+from row_pipeline import PageState, iter_rows, mask_batches, summarize_binary, take_page
+
+BULK_SIZE = 1000
+LARGE_PAGE = 1000
+
+# One sample value per masking rule in mask_sensitive_data, plus a non-sensitive column
+MASK_SAMPLES = {
+    "ssn": "123-45-6789",
+    "phone_number": "555-123-4567",
+    "email": "jane.doe@example.com",
+    "card_number": "4111 1111 1111 1234",
+    "account_number": "000123456789",
+    "routing_number": "021000021",
+    "mrn": "MRN000123456",
+    "insurance_policy": "INS-987654321",
+    "home_address": "123 Pine Road, Springfield, TX 75001",
+    "password_hash": "pbkdf2:sha256:600000$abc$def",
+    "state_id": "TX1234567",
+    "first_name": "Jane",
+}
+SAMPLE_PLAINTEXT = "jane.doe@example.com"
+
+BENCHMARKS = {}
+
+
+def benchmark(name, ops=1):
+    """Register ``setup`` under ``name``; setup() returns the zero-argument callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = (setup, ops)
+        return setup
+    return register
+
+
+@benchmark("crypto.encrypt_value")
+def _encrypt_single():
+    return lambda: encrypt_value(SAMPLE_PLAINTEXT)
+
+
+@benchmark("crypto.decrypt_value")
+def _decrypt_single():
+    token = encrypt_value(SAMPLE_PLAINTEXT)
+    return lambda: decrypt_value(token)
+
+
+@benchmark(f"crypto.encrypt_many[{BULK_SIZE}]", ops=BULK_SIZE)
+def _encrypt_bulk():
+    values = [f"patient{i}@example.com" for i in range(BULK_SIZE)]
+    return lambda: encrypt_many(values)
+
+
+@benchmark(f"crypto.decrypt_many[{BULK_SIZE}]", ops=BULK_SIZE)
+def _decrypt_bulk():
+    tokens = [encrypt_value(f"patient{i}@example.com") for i in range(BULK_SIZE)]
+
+    def run():
+        decrypt_many([{"email": token} for token in tokens], ("email",))
+    return run
+
+
+def _mask_benchmark(column, value):
+    @benchmark(f"mask_sensitive_data[{column}]")
+    def setup():
+        return lambda: hospital_app.mask_sensitive_data(value, column)
+
+
+for _column, _value in MASK_SAMPLES.items():
+    _mask_benchmark(_column, _value)
+
+
+@benchmark("is_sensitive_column", ops=len(MASK_SAMPLES))
+def _is_sensitive():
+    columns = list(MASK_SAMPLES)
+
+    def run():
+        for column in columns:
+            hospital_app.is_sensitive_column(column)
+    return run
+
+
+@benchmark(f"mask_rows[{LARGE_PAGE}x{len(MASK_SAMPLES)}]", ops=LARGE_PAGE * len(MASK_SAMPLES))
+def _mask_rows():
+    rows = [dict(MASK_SAMPLES) for _ in range(LARGE_PAGE)]
+    columns = list(MASK_SAMPLES)
+    return lambda: mask_rows(rows, columns)
+
+
+@benchmark("get_patient_record")
+def _patient_record():
+    try:
+        conn = get_db_conn()
+    except Exception as exc:
+        raise SkipBenchmark(f"database unavailable ({exc.__class__.__name__})")
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(patient_id) FROM Patient")
+        patient_id = cur.fetchone()[0]
+        cur.close()
+    finally:
+        conn.close()
+    if patient_id is None:
+        raise SkipBenchmark("Patient table is empty")
+    return lambda: hospital_app.get_patient_record(patient_id)
+
+
+def _synthetic_patients(count):
+    rng = random.Random(42)
+    return [{
+        "patient_id": 100000 - i,
+        "first_name": rng.choice(["Jane", "John", "Maria", "Wei"]),
+        "last_name": rng.choice(["Smith", "Garcia", "Chen", "Okafor"]),
+        "email": f"patient{i}@example.com",
+        "phone_number": f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        "dob": date(1980, 1, 1),
+        "search_rank": 0,
+    } for i in range(count)]
+
+
+def _render(template, **context):
+    """A callable rendering ``template`` with ``context`` plus any per-call keyword arguments."""
+    flask_app = hospital_app.app
+
+    def run(**per_call):
+        with flask_app.test_request_context("/"):
+            hospital_app.session["user_role"] = "admin"
+            flask_app.preprocess_request()
+            return hospital_app.render_template(template, **context, **per_call)
+    return run
+
+
+def _stream(template, **context):
+    """Like _render, through stream_template (joined, so the whole page is produced)."""
+    flask_app = hospital_app.app
+
+    def run(**per_call):
+        with flask_app.test_request_context("/"):
+            hospital_app.session["user_role"] = "admin"
+            flask_app.preprocess_request()
+            return "".join(hospital_app.stream_template(template, **context, **per_call))
+    return run
+
+
+@benchmark(f"render.patient_list[{LARGE_PAGE}]", ops=LARGE_PAGE)
+def _render_patient_list():
+    return _render("patient_list.html", patients=_synthetic_patients(LARGE_PAGE), search_query="smi",
+                   next_cursor="2.99000", is_first_page=True)
+
+
+@benchmark(f"render.admin_tables[{LARGE_PAGE}]", ops=LARGE_PAGE)
+def _render_admin_tables():
+    sample = {name: value for name, value in MASK_SAMPLES.items()}
+    columns = [{"COLUMN_NAME": "patient_id", "DATA_TYPE": "int", "IS_NULLABLE": "NO"}] + [
+        {"COLUMN_NAME": name, "DATA_TYPE": "varchar", "IS_NULLABLE": "YES"} for name in sample
+    ]
+    rows = [dict(sample, patient_id=i) for i in range(1, LARGE_PAGE + 1)]
+    names = [col["COLUMN_NAME"] for col in columns]
+    render = _stream("admin_tables.html", tables=["Patient"], selected_table="Patient", page_size=LARGE_PAGE,
+                     sensitive_columns={name for name in names if is_sensitive_column(name)}, columns=columns,
+                     primary_key="patient_id", total_rows=LARGE_PAGE * 10, total_rows_exact=False)
+
+    def run():
+        # Same pipeline as admin_view_tables, minus the database fetch
+        page = PageState()
+        batches = take_page(iter([[dict(row) for row in rows]]), LARGE_PAGE, "patient_id", page)
+        batches = mask_batches(summarize_binary(batches), names)
+        first_batch = next(batches)
+        return render(page=page, rows=itertools.chain(first_batch, iter_rows(batches)))
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", nargs="+", help="Only run benchmarks whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum seconds per timed repeat")
+    parser.add_argument("--save", help="Write results JSON to this file (e.g. a new baseline)")
+    parser.add_argument("--baseline", help="Compare against a results JSON written by --save")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown that counts as a regression (default 0.10 = 10%%)")
+    parser.add_argument("--list", action="store_true", help="List benchmark names and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    results = run_suite(BENCHMARKS, args.filter, args.repeat, args.min_time)
+    if args.save:
+        save_results(results, args.save)
+    if args.baseline:
+        rows, regressions = compare(results, load_results(args.baseline), args.threshold)
+        print_comparison(rows, regressions, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+"""HTTP load test: logs in as each role and drives the main routes at a target rate.
+
+Uses the accounts written by synthetic_data.py (credentials.json). Requests are
+issued open-loop, so latency is measured from the scheduled send time and a
+saturated server shows up as growing latency instead of a lower request rate.
+
+    python -m benchmarks.loadtest --base-url https://localhost:5000 --insecure \\
+        --credentials synthetic_data/credentials.json --rate 50 --duration 60
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import ssl
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from synthetic_data import LAST_NAMES
+
+CSRF_REGEX = re.compile(r'name="csrf_token"\s+value="([^"]+)"')
+
+# (label, method, path, weight) per role; {search} is replaced with a random name prefix
+ROUTES = {
+    "patient": [
+        ("GET /my-bills", "GET", "/my-bills", 3),
+        ("GET /payment", "GET", "/payment", 2),
+        ("GET /appointment", "GET", "/appointment", 1),
+        ("POST /appointment", "POST", "/appointment", 1),
+    ],
+    "staff": [
+        ("GET /patients", "GET", "/patients", 2),
+        ("GET /patients?search", "GET", "/patients?search={search}", 3),
+        ("GET /appointment", "GET", "/appointment", 1),
+    ],
+    "admin": [
+        ("GET /admin/tables", "GET", "/admin/tables", 1),
+        ("GET /admin/tables?table", "GET", "/admin/tables?table=Patient", 2),
+        ("GET /patients?search", "GET", "/patients?search={search}", 1),
+    ],
+}
+
+
+class VirtualUser:
+    """One logged-in browser session (cookie jar + CSRF token)."""
+
+    def __init__(self, base_url, role, email, password, ssl_context=None, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.role = role
+        self.email = email
+        self.timeout = timeout
+        self.csrf_token = None
+        handlers = [urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())]
+        if ssl_context is not None:
+            handlers.append(urllib.request.HTTPSHandler(context=ssl_context))
+        self.opener = urllib.request.build_opener(*handlers)
+        self._login(password)
+
+    def _refresh_csrf(self, html):
+        match = CSRF_REGEX.search(html)
+        if match:
+            self.csrf_token = match.group(1)
+
+    def _login(self, password):
+        self.request("GET", "/login")
+        status, html, url = self.request("POST", "/login", {"email": self.email, "password": password})
+        if status != 200 or urllib.parse.urlparse(url).path.rstrip("/") == "/login":
+            raise RuntimeError(f"Login failed for {self.email} (HTTP {status})")
+        # Logging in starts a fresh session (and CSRF token); the dashboard has no form to read it from
+        self.request("GET", "/appointment")
+
+    def request(self, method, path, form=None):
+        """Returns (status, body, final_url); redirects are followed like a browser would.
+
+        The CSRF token is refreshed from every HTML page that carries one.
+        """
+        data = None
+        if method == "POST":
+            form = dict(form or {})
+            form.setdefault("csrf_token", self.csrf_token or "")
+            data = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                status, body, url = resp.status, resp.read().decode("utf-8", "replace"), resp.geturl()
+        except urllib.error.HTTPError as exc:
+            status, body, url = exc.code, exc.read().decode("utf-8", "replace"), exc.geturl()
+        # Keep the token of the current session whenever a page carries one
+        self._refresh_csrf(body)
+        return status, body, url
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, label, latency_ms, ok):
+        with self._lock:
+            self.latencies[label].append(latency_ms)
+            if not ok:
+                self.errors[label] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        for label in sorted(self.latencies):
+            samples = sorted(self.latencies[label])
+            report[label] = {
+                "requests": len(samples),
+                "errors": self.errors[label],
+                "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "mean_ms": round(statistics.fmean(samples), 2),
+                "p50_ms": round(_percentile(samples, 50), 2),
+                "p95_ms": round(_percentile(samples, 95), 2),
+                "p99_ms": round(_percentile(samples, 99), 2),
+            }
+        return report
+
+
+def _render_path(path, rng):
+    if "{search}" in path:
+        name = rng.choice(LAST_NAMES)
+        path = path.replace("{search}", urllib.parse.quote(name[:rng.randint(2, len(name))]))
+    return path
+
+
+def _appointment_form(user, rng):
+    when = datetime.now() + timedelta(days=rng.randint(1, 60))
+    when = when.replace(hour=rng.randint(8, 16), minute=rng.choice([0, 30]))
+    return {"doctor_id": "", "appointment_date": when.strftime("%Y-%m-%dT%H:%M")}
+
+
+def run(base_url, credentials, rate, duration, workers, users_per_role, seed, ssl_context=None):
+    rng = random.Random(seed)
+    users = []
+    for role in ROUTES:
+        for email in credentials.get(role, [])[:users_per_role]:
+            users.append(VirtualUser(base_url, role, email, credentials["password"], ssl_context))
+    if not users:
+        raise SystemExit("No accounts in credentials file; run synthetic_data.py --load first.")
+    print(f"Logged in {len(users)} virtual users; {rate} req/s for {duration}s")
+
+    recorder = Recorder()
+
+    def fire(user, label, method, path, scheduled):
+        task_rng = random.Random(scheduled)
+        form = _appointment_form(user, task_rng) if method == "POST" else None
+        try:
+            status, _, _ = user.request(method, _render_path(path, task_rng), form)
+            ok = status < 400
+        except Exception:
+            ok = False
+        recorder.record(label, (time.perf_counter() - scheduled) * 1000, ok)
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        n = 0
+        while True:
+            scheduled = start + n * interval
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            user = users[n % len(users)]
+            routes = ROUTES[user.role]
+            label, method, path, _ = rng.choices(routes, weights=[r[3] for r in routes])[0]
+            pool.submit(fire, user, label, method, path, scheduled)
+            n += 1
+    elapsed = time.perf_counter() - start
+    return recorder.summary(elapsed), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="https://localhost:5000")
+    parser.add_argument("--credentials", default="synthetic_data/credentials.json")
+    parser.add_argument("--rate", type=float, default=20, help="Target requests per second (all routes)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send requests for")
+    parser.add_argument("--workers", type=int, default=64, help="Maximum concurrent requests")
+    parser.add_argument("--users-per-role", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS verification (self-signed certs)")
+    parser.add_argument("--json", help="Write per-route results to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.credentials) as f:
+        credentials = json.load(f)
+    ssl_context = None
+    if args.insecure:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    report, elapsed = run(args.base_url, credentials, args.rate, args.duration, args.workers,
+                          args.users_per_role, args.seed, ssl_context)
+    print(f"{'route':<26}{'reqs':>7}{'err':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, stats in report.items():
+        print(f"{label:<26}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    total = sum(stats["requests"] for stats in report.values())
+    print(f"total: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed_s": round(elapsed, 2), "routes": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
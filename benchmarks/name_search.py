@@ -0,0 +1,125 @@
+"""Patient name search latency vs. table size: leading-wildcard LIKE vs. indexed search.
+
+Builds a scratch copy of the Patient table (``CREATE TABLE ... LIKE Patient``
+copies the normalized name columns and their indexes), grows it to each size
+and times both query shapes. Run from the project root:
+
+    python -m benchmarks.name_search --sizes 1000 10000 100000 300000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from hospital_db_setup import connect_to_db
+from patient_search import build_search_query
+
+BENCH_TABLE = "Bench_Patient_Names"
+FIRST_NAMES = ["james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "william",
+               "elizabeth", "david", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah",
+               "charles", "karen", "maria", "jose", "wei", "fatima", "mohammed", "anh", "sofia", "lucas"]
+LAST_NAMES = ["smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "rodriguez",
+              "martinez", "hernandez", "lopez", "gonzalez", "wilson", "anderson", "thomas", "taylor",
+              "moore", "jackson", "martin", "lee", "perez", "thompson", "white", "harris", "nguyen", "chen"]
+SYLLABLES = ["an", "ber", "co", "del", "er", "fa", "gon", "ha", "is", "jo", "ka", "lin", "mor", "no",
+             "ov", "pa", "qui", "ro", "sen", "ta", "ul", "vi", "wen", "xu", "ya", "zo"]
+
+LEGACY_SQL = f"""
+    SELECT p.patient_id, p.first_name, p.last_name, p.email, p.phone_number, p.dob
+    FROM {BENCH_TABLE} p
+    WHERE p.first_name LIKE %s
+       OR p.last_name LIKE %s
+       OR CONCAT(p.first_name, ' ', p.last_name) LIKE %s
+    ORDER BY p.patient_id DESC
+    LIMIT 50
+"""
+
+
+def synthetic_name(rng: random.Random):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    # Mix in generated surnames so prefixes stay selective at large sizes
+    if rng.random() < 0.7:
+        last = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + last[:3]
+    return first.title(), last.title()
+
+
+def grow_table(cursor, db_connection, rng, current, target, batch_size=5000):
+    while current < target:
+        count = min(batch_size, target - current)
+        rows = [synthetic_name(rng) + ("1980-01-01", "Unknown") for _ in range(count)]
+        cursor.executemany(
+            f"INSERT INTO {BENCH_TABLE} (first_name, last_name, dob, gender) VALUES (%s, %s, %s, %s)", rows
+        )
+        db_connection.commit()
+        current += count
+    return current
+
+
+def time_query(cursor, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def run(sizes, repeat, seed, keep):
+    rng = random.Random(seed)
+    db_connection = connect_to_db()
+    db_connection.database = "secure_hospital_db"
+    cursor = db_connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(f"CREATE TABLE {BENCH_TABLE} LIKE Patient")
+    results = []
+    current = 0
+    try:
+        for size in sorted(sizes):
+            current = grow_table(cursor, db_connection, rng, current, size)
+            cursor.execute(f"ANALYZE TABLE {BENCH_TABLE}")
+            cursor.fetchall()
+            first, last = synthetic_name(rng)
+            queries = {
+                "last_prefix": last[:4],
+                "full_prefix": f"{first} {last[:2]}",
+                "infix": last[1:5],
+            }
+            for label, query in queries.items():
+                legacy = time_query(cursor, LEGACY_SQL, (f"%{query}%",) * 3, repeat)
+                sql, params = build_search_query(query, table=BENCH_TABLE, include_sensitive=False)
+                indexed = time_query(cursor, sql, params, repeat)
+                results.append({
+                    "rows": size, "query": label,
+                    "legacy_p50_ms": round(legacy[0], 3), "legacy_p95_ms": round(legacy[1], 3),
+                    "indexed_p50_ms": round(indexed[0], 3), "indexed_p95_ms": round(indexed[1], 3),
+                })
+                print(f"{size:>10} {label:<12} legacy p50={legacy[0]:9.2f}ms p95={legacy[1]:9.2f}ms | "
+                      f"indexed p50={indexed[0]:9.2f}ms p95={indexed[1]:9.2f}ms")
+    finally:
+        if not keep:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cursor.close()
+        db_connection.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {BENCH_TABLE} table afterwards")
+    args = parser.parse_args(argv)
+    results = run(args.sizes, args.repeat, args.seed, args.keep)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Concurrency test for billing.post_payment: many simultaneous payments on one bill.
+
+Creates a scratch bill for an existing patient, releases --payments payment
+attempts from --threads threads at once (each thread on its own connection, a
+share of the attempts reusing an idempotency key as a double-submit would), then
+checks the ledger invariants and exits non-zero if any is violated:
+
+    python -m benchmarks.payment_concurrency --threads 200 --payments 500
+
+Keep --threads below the server's max_connections. The bill total defaults to
+cover only part of the attempts, so the over-payment guard is exercised too.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from billing import PaymentError, ledger_status, new_idempotency_key, post_payment
+from hospital_db_setup import connect_to_db
+
+DATABASE = "secure_hospital_db"
+
+
+def _connect():
+    conn = connect_to_db()
+    conn.database = DATABASE
+    return conn
+
+
+def create_bill(total_amount):
+    """Insert a scratch Pending bill for the first patient; returns (billing_id, patient_id)."""
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(patient_id) FROM Patient")
+        patient_id = cur.fetchone()[0]
+        if patient_id is None:
+            raise SystemExit("Patient table is empty; run app.py or synthetic_data.py --load first.")
+        cur.execute("""INSERT INTO Billing (patient_id, total_amount, status, payment_due_date)
+                       VALUES (%s, %s, 'Pending', %s)""",
+                    (patient_id, total_amount, datetime.now() + timedelta(days=30)))
+        conn.commit()
+        billing_id = cur.lastrowid
+        cur.close()
+        return billing_id, patient_id
+    finally:
+        conn.close()
+
+
+def delete_bill(billing_id):
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM Payment_Transactions WHERE billing_id = %s", (billing_id,))
+        cur.execute("DELETE FROM Billing WHERE billing_id = %s", (billing_id,))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def plan_attempts(payments, duplicate_ratio, seed):
+    """Idempotency keys for each attempt; about ``duplicate_ratio`` of them repeat an earlier key."""
+    rng = random.Random(seed)
+    unique = max(1, round(payments * (1 - duplicate_ratio)))
+    keys = [new_idempotency_key() for _ in range(unique)]
+    attempts = keys + [rng.choice(keys) for _ in range(payments - unique)]
+    rng.shuffle(attempts)
+    return attempts
+
+
+def run_attempts(billing_id, patient_id, amount, attempts, threads):
+    """Post every attempt from ``threads`` threads released together; returns (outcomes, seconds).
+
+    Each outcome is (key, kind, payment_id or message) with kind one of
+    "created", "duplicate", "refused" or "error".
+    """
+    threads = min(threads, len(attempts))
+    barrier = threading.Barrier(threads)
+    outcomes = []
+    lock = threading.Lock()
+
+    def worker(share):
+        results = []
+        try:
+            conn = _connect()
+        except Exception as exc:
+            barrier.abort()
+            results.extend((key, "error", f"connect: {exc!r}") for key in share)
+        else:
+            try:
+                barrier.wait()
+                for key in share:
+                    try:
+                        payment_id, created = post_payment(conn, billing_id, amount, key, note="concurrency test",
+                                                           patient_id=patient_id)
+                        results.append((key, "created" if created else "duplicate", payment_id))
+                    except PaymentError as exc:
+                        results.append((key, "refused", str(exc)))
+                    except Exception as exc:
+                        results.append((key, "error", repr(exc)))
+            except threading.BrokenBarrierError:
+                results.extend((key, "error", "aborted: another thread could not connect") for key in share)
+            finally:
+                conn.close()
+        with lock:
+            outcomes.extend(results)
+
+    pool = [threading.Thread(target=worker, args=(attempts[i::threads],)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return outcomes, time.perf_counter() - start
+
+
+def check_invariants(billing_id, amount, outcomes):
+    """Compare the stored ledger with the attempt outcomes; returns a list of violations."""
+    conn = _connect()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT total_amount, paid_amount, balance_due, status, payment_due_date FROM Billing "
+                    "WHERE billing_id = %s", (billing_id,))
+        bill = cur.fetchone()
+        cur.execute("""SELECT payment_id, idempotency_key, amount FROM Payment_Transactions
+                       WHERE billing_id = %s AND status = 'Posted'""", (billing_id,))
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+
+    violations = []
+    posted = sum((row["amount"] for row in rows), Decimal("0.00"))
+    if posted != bill["paid_amount"]:
+        violations.append(f"paid_amount {bill['paid_amount']} != sum of Posted payments {posted}")
+    if bill["paid_amount"] > bill["total_amount"]:
+        violations.append(f"paid_amount {bill['paid_amount']} exceeds total {bill['total_amount']}")
+    expected_status = ledger_status("Pending", bill["total_amount"], bill["paid_amount"], bill["payment_due_date"])
+    if bill["status"] != expected_status:
+        violations.append(f"status {bill['status']} != expected {expected_status}")
+
+    key_counts = Counter(row["idempotency_key"] for row in rows)
+    repeated = [key for key, count in key_counts.items() if count > 1]
+    if repeated:
+        violations.append(f"{len(repeated)} idempotency keys recorded more than once")
+
+    created = [o for o in outcomes if o[1] == "created"]
+    if len(created) != len(rows):
+        violations.append(f"{len(created)} payments reported created but {len(rows)} recorded")
+    payment_ids = defaultdict(set)
+    for key, kind, value in outcomes:
+        if kind in ("created", "duplicate"):
+            payment_ids[key].add(value)
+    split = [key for key, ids in payment_ids.items() if len(ids) > 1]
+    if split:
+        violations.append(f"{len(split)} idempotency keys answered with different payment ids")
+    if any(key not in key_counts for key in payment_ids):
+        violations.append("a duplicate was answered for a key that has no recorded payment")
+    if any(kind == "refused" for _, kind, _ in outcomes) and bill["balance_due"] >= amount:
+        violations.append(f"payments were refused while balance {bill['balance_due']} still covered {amount}")
+    errors = [o for o in outcomes if o[1] == "error"]
+    if errors:
+        violations.append(f"{len(errors)} attempts failed unexpectedly, e.g. {errors[0][2]}")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--payments", type=int, default=400, help="Total payment attempts")
+    parser.add_argument("--amount", type=Decimal, default=Decimal("1.00"), help="Amount of each attempt")
+    parser.add_argument("--total", type=Decimal,
+                        help="Bill total (default: enough for 60%% of the distinct payments)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.25,
+                        help="Share of attempts that repeat another attempt's idempotency key")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch bill and its payments")
+    args = parser.parse_args(argv)
+
+    attempts = plan_attempts(args.payments, args.duplicate_ratio, args.seed)
+    distinct = len(set(attempts))
+    total = args.total if args.total is not None else (args.amount * distinct * Decimal("0.6")).quantize(Decimal("0.01"))
+    billing_id, patient_id = create_bill(total)
+    try:
+        outcomes, seconds = run_attempts(billing_id, patient_id, args.amount, attempts, args.threads)
+        kinds = Counter(kind for _, kind, _ in outcomes)
+        print(f"bill #{billing_id}: {len(attempts)} attempts ({distinct} distinct keys) from "
+              f"{min(args.threads, len(attempts))} threads in {seconds:.2f}s")
+        print("  " + ", ".join(f"{kind}={kinds.get(kind, 0)}" for kind in ("created", "duplicate", "refused", "error")))
+        violations = check_invariants(billing_id, args.amount, outcomes)
+    finally:
+        if not args.keep:
+            delete_bill(billing_id)
+    for violation in violations:
+        print(f"  VIOLATION: {violation}")
+    print("  invariants hold" if not violations else f"  {len(violations)} invariant(s) violated")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
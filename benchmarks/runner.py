@@ -0,0 +1,136 @@
+"""Timing runner and JSON results format shared by the micro-benchmarks.
+
+A benchmark is a zero-argument callable; ``ops`` says how many logical
+operations one call performs (e.g. 1000 for a bulk decrypt of 1000 cells) so
+results are comparable as time per operation. Results files look like::
+
+    {"meta": {...}, "results": {"name": {"per_op_us": ..., "min_us": ..., ...}}}
+
+and ``compare`` flags any benchmark whose median per-op time grew by more than
+the threshold relative to a saved baseline.
+"""
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+class SkipBenchmark(Exception):
+    """Raised by a benchmark's setup when a prerequisite (e.g. the database) is unavailable."""
+
+
+def _autorange(func, min_time):
+    """Smallest power-of-ten loop count whose total run takes at least ``min_time`` seconds."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - start >= min_time or loops >= 10 ** 7:
+            return loops
+        loops *= 10
+
+
+def measure(func, ops=1, repeat=7, min_time=0.05, warmup=1):
+    """Time ``func``; returns a result dict with per-operation times in microseconds."""
+    for _ in range(warmup):
+        func()
+    loops = _autorange(func, min_time)
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            samples.append((time.perf_counter() - start) / (loops * ops) * 1e6)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "per_op_us": round(statistics.median(samples), 4),
+        "min_us": round(min(samples), 4),
+        "stdev_us": round(statistics.stdev(samples), 4) if len(samples) > 1 else 0.0,
+        "loops": loops,
+        "repeat": repeat,
+        "ops": ops,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(benchmarks, name_filter=None, repeat=7, min_time=0.05):
+    """Run ``benchmarks`` (name -> (setup, ops)) where setup() returns the callable to time."""
+    results = {}
+    skipped = {}
+    for name, (setup, ops) in benchmarks.items():
+        if name_filter and not any(f in name for f in name_filter):
+            continue
+        try:
+            func = setup()
+        except SkipBenchmark as exc:
+            skipped[name] = str(exc)
+            print(f"{name:<48} skipped: {exc}")
+            continue
+        result = measure(func, ops=ops, repeat=repeat, min_time=min_time)
+        results[name] = result
+        print(f"{name:<48} {result['per_op_us']:>12.3f} us/op  (min {result['min_us']:.3f}, "
+              f"sd {result['stdev_us']:.3f}, {result['loops']}x{result['repeat']})")
+    meta = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "commit": _git_commit(),
+        "skipped": skipped,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(current, baseline, threshold=0.10):
+    """Return (rows, regressions) comparing median per-op times with a baseline results dict."""
+    rows = []
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("per_op_us"):
+            rows.append((name, None, result["per_op_us"], None))
+            continue
+        change = result["per_op_us"] / base["per_op_us"] - 1
+        rows.append((name, base["per_op_us"], result["per_op_us"], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_comparison(rows, regressions, threshold):
+    print(f"\n{'benchmark':<48}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for name, base, current, change in rows:
+        if change is None:
+            print(f"{name:<48}{'-':>14}{current:>14.3f}{'new':>10}")
+            continue
+        flag = "  SLOWER" if name in regressions else ""
+        print(f"{name:<48}{base:>14.3f}{current:>14.3f}{change:>+10.1%}{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {threshold:.0%}")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,323 @@
+import re
+import secrets
+from datetime import datetime
+from decimal import Decimal
+
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
+
+import audit
+
+BILLS_PAGE_SIZE = 20
+
+# Payment forms carry a one-time key so a resubmitted or retried POST is
+# recorded once; keys are stored in Payment_Transactions.idempotency_key (UNIQUE).
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+# Statuses derived from the ledger; anything else (e.g. Cancelled) is an admin
+# decision and is never overwritten by payments or reconciliation.
+LEDGER_STATUSES = ("Pending", "Partial", "Paid", "Overdue")
+
+# Bill status from its current paid_amount. MySQL evaluates single-table UPDATE
+# assignments left to right, so placed after "paid_amount = ..." this sees the new value.
+LEDGER_STATUS_SQL = """
+    CASE
+        WHEN status NOT IN ('Pending', 'Partial', 'Paid', 'Overdue') THEN status
+        WHEN paid_amount >= total_amount THEN 'Paid'
+        WHEN payment_due_date IS NOT NULL AND payment_due_date < NOW() THEN 'Overdue'
+        WHEN paid_amount > 0 THEN 'Partial'
+        ELSE 'Pending'
+    END
+"""
+
+
+def fetch_bills_with_payments(cur, patient_id: int, limit=None, offset: int = 0):
+    """Fetch a patient's bills and their payments in a single round trip.
+
+    ``cur`` must be a dictionary cursor. Bills are ordered newest first and
+    optionally paginated; each bill gets a ``payments`` list (newest first).
+    """
+    page_clause = "LIMIT %s OFFSET %s" if limit else ""
+    params = (patient_id, int(limit), int(offset)) if limit else (patient_id,)
+    cur.execute(f"""
+        SELECT b.billing_id, b.total_amount, b.paid_amount, b.balance_due, b.status, b.created_at,
+               b.payment_due_date, pt.payment_id, pt.amount, pt.paid_at, pt.status AS payment_status, pt.note
+        FROM (
+            SELECT billing_id, total_amount, paid_amount, balance_due, status, created_at, payment_due_date
+            FROM Billing
+            WHERE patient_id = %s
+            ORDER BY created_at DESC, billing_id DESC
+            {page_clause}
+        ) b
+        LEFT JOIN Payment_Transactions pt ON pt.billing_id = b.billing_id
+        ORDER BY b.created_at DESC, b.billing_id DESC, pt.paid_at DESC, pt.payment_id DESC
+    """, params)
+
+    bills = []
+    by_id = {}
+    for row in cur.fetchall():
+        bill = by_id.get(row["billing_id"])
+        if bill is None:
+            bill = {key: row[key] for key in ("billing_id", "total_amount", "paid_amount", "balance_due",
+                                              "status", "created_at", "payment_due_date")}
+            bill["payments"] = []
+            by_id[row["billing_id"]] = bill
+            bills.append(bill)
+        if row["payment_id"] is not None:
+            bill["payments"].append({
+                "payment_id": row["payment_id"],
+                "billing_id": row["billing_id"],
+                "amount": row["amount"],
+                "paid_at": row["paid_at"],
+                "status": row["payment_status"],
+                "note": row["note"],
+                "bill_total": row["total_amount"],
+            })
+    return bills
+
+
+def payment_history(bills):
+    """Flatten the grouped payments of ``bills`` into one list, newest first."""
+    history = [payment for bill in bills for payment in bill["payments"]]
+    history.sort(key=lambda p: (p["paid_at"] is not None, p["paid_at"], p["payment_id"]), reverse=True)
+    return history
+
+
+def outstanding_balance(cur, patient_id: int):
+    """Total balance_due over a patient's bills (served by idx_billing_patient_balance)."""
+    cur.execute("SELECT COALESCE(SUM(balance_due), 0) AS outstanding FROM Billing WHERE patient_id = %s",
+                (patient_id,))
+    row = cur.fetchone()
+    return row["outstanding"] if isinstance(row, dict) else row[0]
+
+
+def ledger_status(status, total_amount, paid_amount, payment_due_date, now=None):
+    """Python mirror of LEDGER_STATUS_SQL, used by reconciliation."""
+    if status not in LEDGER_STATUSES:
+        return status
+    if paid_amount >= total_amount:
+        return "Paid"
+    if payment_due_date is not None and payment_due_date < (now or datetime.now()):
+        return "Overdue"
+    if paid_amount > 0:
+        return "Partial"
+    return "Pending"
+
+
+class PaymentError(ValueError):
+    """A payment that cannot be posted; the message is safe to show to the user."""
+
+
+def new_idempotency_key() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def record_payment(cur, billing_id: int, patient_id: int, payment_method_id, amount, note,
+                   paid_at=None, status: str = "Posted", idempotency_key=None):
+    """Insert a payment and apply it to the bill's ledger in the caller's transaction.
+
+    The Billing row is updated first: its exclusive row lock serializes
+    concurrent payments on the same bill (the transaction insert only needs a
+    shared lock on it for the foreign key). The caller commits. Returns the
+    new payment_id. Use post_payment() for user-submitted payments.
+    """
+    if status == "Posted":
+        cur.execute(f"""
+            UPDATE Billing
+            SET paid_amount = COALESCE(paid_amount, 0) + %s,
+                status = {LEDGER_STATUS_SQL}
+            WHERE billing_id = %s
+        """, (amount, billing_id))
+    cur.execute(
+        """INSERT INTO Payment_Transactions
+               (billing_id, patient_id, payment_method_id, amount, paid_at, status, note, idempotency_key)
+           VALUES (%s, %s, %s, %s, COALESCE(%s, NOW()), %s, %s, %s)""",
+        (billing_id, patient_id, payment_method_id, amount, paid_at, status, note, idempotency_key)
+    )
+    return cur.lastrowid
+
+
+def _existing_payment(cur, idempotency_key, billing_id, amount):
+    """payment_id already recorded under ``idempotency_key`` (None if unused).
+
+    A plain read: a locking read of a missing key would gap-lock the unique
+    index and deadlock concurrent inserts. A key reused for a different bill or
+    amount is an error.
+    """
+    cur.execute("SELECT payment_id, billing_id, amount FROM Payment_Transactions WHERE idempotency_key = %s",
+                (idempotency_key,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    if row["billing_id"] != billing_id or row["amount"] != amount:
+        raise PaymentError("This payment form was already used for a different payment. Please reload and try again.")
+    return row["payment_id"]
+
+
+def post_payment(db_connection, billing_id: int, amount, idempotency_key: str, payment_method_id=None,
+                 note=None, patient_id=None, paid_at=None, changed_by=None):
+    """Post a payment against one bill, safely under concurrent and repeated submissions.
+
+    The bill is locked with SELECT ... FOR UPDATE, so the ownership, status and
+    balance checks and the ledger update see no interleaved payment. If
+    ``idempotency_key`` was already used, the original payment is returned
+    instead of posting again. Pass ``patient_id`` to require that the bill
+    belongs to that patient. ``changed_by`` is recorded as the acting user
+    in the audit log (AUDIT_MODE=async).
+
+    Runs in its own transaction: anything still open on ``db_connection`` is
+    rolled back first, so the key lookup's snapshot is taken after the bill
+    lock and sees every payment committed on the bill before it. Commits on
+    success and rolls back on failure. Returns ``(payment_id, created)``;
+    raises PaymentError for payments that are refused.
+    """
+    if not idempotency_key or not IDEMPOTENCY_KEY_PATTERN.match(idempotency_key):
+        raise PaymentError("Invalid payment request. Please reload the payment form and try again.")
+    amount = Decimal(amount).quantize(Decimal("0.01"))
+    db_connection.rollback()
+    cur = db_connection.cursor(dictionary=True)
+    try:
+        cur.execute("""
+            SELECT patient_id, total_amount, paid_amount, balance_due, status, payment_due_date FROM Billing
+            WHERE billing_id = %s FOR UPDATE
+        """, (billing_id,))
+        bill = cur.fetchone()
+        if bill is None:
+            raise PaymentError("Billing record not found.")
+        if patient_id is not None and bill["patient_id"] != patient_id:
+            raise PaymentError("You can only make payments for your own bills.")
+
+        # A retry of a payment that already committed is answered before the balance
+        # check, which the original payment has since reduced.
+        payment_id = _existing_payment(cur, idempotency_key, billing_id, amount)
+        if payment_id is not None:
+            db_connection.commit()
+            return payment_id, False
+
+        if bill["status"] not in LEDGER_STATUSES:
+            raise PaymentError(f"This bill is {bill['status']} and cannot be paid.")
+        balance_due = bill["balance_due"]
+        if amount <= 0 or amount > balance_due:
+            raise PaymentError(f"Payment amount must be between $0.01 and the balance due (${balance_due:.2f}).")
+
+        try:
+            payment_id = record_payment(cur, billing_id, bill["patient_id"], payment_method_id, amount, note,
+                                        paid_at=paid_at, idempotency_key=idempotency_key)
+        except IntegrityError as exc:
+            # The same key was committed concurrently under another bill's lock
+            if exc.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            db_connection.rollback()
+            if _existing_payment(cur, idempotency_key, billing_id, amount) is None:
+                raise
+            raise PaymentError("This payment form was already used. Please reload and try again.")
+        db_connection.commit()
+        old_paid = bill["paid_amount"] or Decimal("0.00")
+        new_paid = old_paid + amount
+        audit.record("Payment_Transactions", payment_id, "INSERT", new={
+            "billing_id": billing_id, "patient_id": bill["patient_id"], "amount": amount, "status": "Posted",
+            "payment_method_id": payment_method_id, "idempotency_key": idempotency_key,
+        }, changed_by=changed_by)
+        audit.record("Billing", billing_id, "UPDATE", old={
+            "total_amount": bill["total_amount"], "paid_amount": old_paid, "status": bill["status"],
+        }, new={
+            "total_amount": bill["total_amount"], "paid_amount": new_paid,
+            "status": ledger_status(bill["status"], bill["total_amount"], new_paid, bill["payment_due_date"]),
+        }, changed_by=changed_by)
+        return payment_id, True
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def mark_overdue(cur):
+    """Flip unpaid bills past their due date to Overdue; returns (bills changed, changes).
+
+    With AUDIT_MODE=async the bills are locked and listed first, and
+    ``changes`` holds their (billing_id, previous status) pairs; pass them to
+    audit_overdue() once the caller has committed. In trigger mode
+    ``changes`` is empty (the triggers audit the UPDATE).
+    """
+    overdue = "status IN ('Pending', 'Partial') AND payment_due_date < NOW()"
+    if not audit.ASYNC_AUDIT:
+        cur.execute(f"UPDATE Billing SET status = 'Overdue' WHERE {overdue}")
+        return cur.rowcount, []
+    cur.execute(f"SELECT billing_id, status FROM Billing WHERE {overdue} FOR UPDATE")
+    rows = [tuple(row.values()) if isinstance(row, dict) else tuple(row) for row in cur.fetchall()]
+    if not rows:
+        return 0, []
+    cur.execute(f"UPDATE Billing SET status = 'Overdue' WHERE billing_id IN ({', '.join(['%s'] * len(rows))})",
+                [billing_id for billing_id, _ in rows])
+    return cur.rowcount, rows
+
+
+def audit_overdue(changes, changed_by="SYSTEM") -> None:
+    """Queue audit events for committed mark_overdue() changes."""
+    for billing_id, status in changes:
+        audit.record("Billing", billing_id, "UPDATE", old={"status": status}, new={"status": "Overdue"},
+                     changed_by=changed_by)
+
+
+def reconcile_billing(db_connection, fix: bool = False, batch_size: int = 1000, changed_by="reconcile-billing"):
+    """Recompute every bill's paid_amount and status from its Posted transactions.
+
+    Walks Billing in primary-key batches and returns ``(checked, drift)`` where
+    drift lists the bills whose stored ledger differs. With ``fix`` each drifted
+    bill is corrected, guarded on the values read so a payment that lands in
+    between is not overwritten (such bills are reported with fixed=False).
+    """
+    cur = db_connection.cursor(dictionary=True)
+    checked = 0
+    drift = []
+    last_id = 0
+    try:
+        while True:
+            cur.execute("""
+                SELECT b.billing_id, b.patient_id, b.total_amount, b.paid_amount, b.status, b.payment_due_date,
+                       COALESCE(SUM(pt.amount), 0) AS posted_amount
+                FROM Billing b
+                LEFT JOIN Payment_Transactions pt ON pt.billing_id = b.billing_id AND pt.status = 'Posted'
+                WHERE b.billing_id > %s
+                GROUP BY b.billing_id
+                ORDER BY b.billing_id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            now = datetime.now()
+            batch_start = len(drift)
+            for row in rows:
+                stored_paid = row["paid_amount"] if row["paid_amount"] is not None else Decimal("0.00")
+                expected_paid = row["posted_amount"]
+                expected_status = ledger_status(row["status"], row["total_amount"], expected_paid,
+                                                row["payment_due_date"], now)
+                if stored_paid == expected_paid and row["status"] == expected_status:
+                    continue
+                entry = {
+                    "billing_id": row["billing_id"], "patient_id": row["patient_id"],
+                    "stored_paid": stored_paid, "expected_paid": expected_paid,
+                    "stored_status": row["status"], "expected_status": expected_status, "fixed": False,
+                }
+                if fix:
+                    cur.execute("""
+                        UPDATE Billing SET paid_amount = %s, status = %s
+                        WHERE billing_id = %s AND paid_amount <=> %s AND status <=> %s
+                    """, (expected_paid, expected_status, row["billing_id"], row["paid_amount"], row["status"]))
+                    entry["fixed"] = cur.rowcount == 1
+                drift.append(entry)
+            if fix:
+                db_connection.commit()
+                for entry in drift[batch_start:]:
+                    if entry["fixed"]:
+                        audit.record("Billing", entry["billing_id"], "UPDATE",
+                                     old={"paid_amount": entry["stored_paid"], "status": entry["stored_status"]},
+                                     new={"paid_amount": entry["expected_paid"], "status": entry["expected_status"]},
+                                     changed_by=changed_by)
+            checked += len(rows)
+            last_id = rows[-1]["billing_id"]
+    finally:
+        cur.close()
+    return checked, drift
@@ -11,28 +11,79 @@ try:
 except ModuleNotFoundError:
     raise RuntimeError("Missing dependency 'mysql-connector-python'. Run `pip install -r requirements.txt` to install required packages.")
 
+from db_pool import ConnectionPool
+
 
 # Persisted key file keeps encryption stable across restarts if env var is not set.
 # Sanitize path to prevent traversal from env; keep within cwd using basename.
 _key_env = os.environ.get("PII_KEY_FILE", ".encryption_key")
 KEY_FILE = os.path.join(os.getcwd(), os.path.basename(_key_env))
+# Separate HMAC key for blind indexes so search digests reveal nothing about the AES key.
+_index_key_env = os.environ.get("PII_INDEX_KEY_FILE", ".blind_index_key")
+INDEX_KEY_FILE = os.path.join(os.getcwd(), os.path.basename(_index_key_env))
+# Flask secret key; must be shared by every worker so session cookies verify everywhere.
+_secret_key_env = os.environ.get("APP_SECRET_KEY_FILE", ".app_secret_key")
+SECRET_KEY_FILE = os.path.join(os.getcwd(), os.path.basename(_secret_key_env))
+
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_PORT = int(os.environ.get("DB_PORT", "3306"))
+
+
+def db_connect_args() -> dict:
+    """MySQL server and credentials shared by the app pool and hospital_db_setup."""
+    return {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "user": os.environ.get("DB_USER"),
+        "password": os.environ.get("DB_PASS"),
+    }
+
+
+def _open_db_conn():
+    return mysql.connector.connect(database="secure_hospital_db", **db_connect_args())
+
+
+# Pool sizing is tunable per deployment; see get_pool_stats() when adjusting.
+_pool = ConnectionPool(
+    _open_db_conn,
+    size=int(os.environ.get("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.environ.get("DB_POOL_MAX_OVERFLOW", "10")),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+    idle_timeout=float(os.environ.get("DB_POOL_IDLE_TIMEOUT", "300")),
+    recycle=float(os.environ.get("DB_POOL_RECYCLE", "3600")),
+    pre_ping=os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+)
 
 
 def get_db_conn():
-    return mysql.connector.connect(
-        host="localhost",
-        user=os.environ.get("DB_USER"),
-        password=os.environ.get("DB_PASS"),
-        database="secure_hospital_db",
-    )
+    """Borrow a pooled connection; calling close() returns it to the pool."""
+    return _pool.connect()
+
+
+def get_pool_stats() -> dict:
+    return _pool.stats()
+
 
+def dispose_pool() -> None:
+    """Close idle pooled connections, e.g. in a server master before it forks workers."""
+    _pool.dispose()
 
-def _load_persisted_key() -> Optional[bytes]:
+
+def reset_pool_after_fork() -> None:
+    _pool.reset_after_fork()
+
+
+def set_cursor_hook(hook) -> None:
+    """Wrap every cursor created on a pooled connection with ``hook(cursor)``."""
+    _pool.cursor_hook = hook
+
+
+def _load_persisted_key(path: str = KEY_FILE) -> Optional[bytes]:
     """Return a 32-byte key from disk if present and valid."""
-    if not os.path.exists(KEY_FILE):
+    if not os.path.exists(path):
         return None
     try:
-        with open(KEY_FILE, "rb") as f:
+        with open(path, "rb") as f:
             key_bytes = f.read()
         if len(key_bytes) == 32:
             return key_bytes
@@ -41,28 +92,47 @@ def _load_persisted_key() -> Optional[bytes]:
     return None
 
 
-def _persist_key(key_bytes: bytes) -> None:
+def _persist_key(key_bytes: bytes, path: str = KEY_FILE, env_name: str = "PII_AES_KEY",
+                 required: bool = False) -> None:
     try:
-        with open(KEY_FILE, "wb") as f:
+        with open(path, "wb") as f:
             f.write(key_bytes)
     except OSError:
+        if required:
+            raise RuntimeError(f"Unable to persist a generated key to {path}; set {env_name} instead.")
         # If we cannot persist, warn but still return the key to keep the app working.
-        print("Warning: unable to persist AES key to disk; set PII_AES_KEY to avoid data loss.")
+        print(f"Warning: unable to persist key to disk; set {env_name} to avoid data loss.")
 
 
-def get_aes_key() -> bytes:
-    env_key = os.environ.get("PII_AES_KEY")
+def _get_key(env_name: str, path: str, persist_required: bool = False) -> bytes:
+    env_key = os.environ.get(env_name)
     if env_key:
         key_bytes = env_key.encode("utf-8")
         if len(key_bytes) != 32:
-            raise RuntimeError("AES key must be 32 bytes (after UTF-8 encoding) and set in PII_AES_KEY")
+            raise RuntimeError(f"Key must be 32 bytes (after UTF-8 encoding) and set in {env_name}")
         return key_bytes
 
-    persisted = _load_persisted_key()
+    persisted = _load_persisted_key(path)
     if persisted:
         return persisted
 
     # Generate a new 32-byte key and persist it for stable encryption across restarts.
     key_bytes = secrets.token_bytes(32)
-    _persist_key(key_bytes)
+    _persist_key(key_bytes, path, env_name, required=persist_required)
     return key_bytes
+
+
+def get_aes_key(persist_required: bool = False) -> bytes:
+    """AES key (PII_AES_KEY or persisted key file); ``persist_required`` fails instead of
+    returning a freshly generated key that could not be saved."""
+    return _get_key("PII_AES_KEY", KEY_FILE, persist_required)
+
+
+def get_blind_index_key(persist_required: bool = False) -> bytes:
+    """HMAC key for searchable blind indexes (PII_INDEX_KEY or persisted key file)."""
+    return _get_key("PII_INDEX_KEY", INDEX_KEY_FILE, persist_required)
+
+
+def get_app_secret_key() -> bytes:
+    """Flask secret key (APP_SECRET_KEY or persisted key file), stable across restarts and workers."""
+    return _get_key("APP_SECRET_KEY", SECRET_KEY_FILE)
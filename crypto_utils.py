@@ -1,27 +1,108 @@
+import hashlib
+import hmac
 import os
+import signal
+import threading
 from base64 import b64decode, b64encode
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
-from config import get_aes_key
+from config import get_aes_key, get_blind_index_key
+
+# Process-wide cipher cache: the key is read (env or key file) once and the
+# AESGCM object reused, so the encrypt/decrypt hot path does no I/O.
+_cipher = None
+_index_key = None
+_cipher_lock = threading.Lock()
+# Set by reload_key() (possibly from a signal handler, which must not take
+# _cipher_lock) and honoured by the next key access.
+_reload_requested = False
+
+
+def _apply_reload() -> None:
+    # Caller holds _cipher_lock
+    global _cipher, _index_key, _reload_requested
+    if _reload_requested:
+        _reload_requested = False
+        _cipher = None
+        _index_key = None
+
+
+def _get_cipher() -> AESGCM:
+    global _cipher
+    cipher = _cipher
+    if cipher is None or _reload_requested:
+        with _cipher_lock:
+            _apply_reload()
+            if _cipher is None:
+                _cipher = AESGCM(get_aes_key())
+            cipher = _cipher
+    return cipher
+
+
+def _get_index_key() -> bytes:
+    global _index_key
+    key = _index_key
+    if key is None or _reload_requested:
+        with _cipher_lock:
+            _apply_reload()
+            if _index_key is None:
+                _index_key = get_blind_index_key()
+            key = _index_key
+    return key
+
+
+def use_keys(aes_key: bytes, index_key: bytes) -> None:
+    """Use the given key bytes instead of resolving them (e.g. in bulk-load worker processes)."""
+    global _cipher, _index_key, _reload_requested
+    with _cipher_lock:
+        _reload_requested = False
+        _cipher = AESGCM(aes_key)
+        _index_key = index_key
+
+
+def load_keys() -> None:
+    """Read key material now (e.g. before forking workers) instead of on the first encrypt/decrypt."""
+    _get_cipher()
+    _get_index_key()
+
+
+def reload_key() -> None:
+    """Re-read key material on the next encrypt/decrypt call (e.g. after key rotation).
+
+    Only sets a flag, so it is safe to call from a signal handler that may
+    interrupt a thread holding _cipher_lock.
+    """
+    global _reload_requested
+    _reload_requested = True
+
+
+def install_reload_signal_handler(signum: int = getattr(signal, "SIGHUP", 0)) -> bool:
+    """Reload key material when the process receives ``signum`` (SIGHUP by default)."""
+    if not signum or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signum, lambda *_: reload_key())
+    return True
 
 
 def encrypt_value(plaintext: str) -> str:
     """Encrypt text with AES-256-GCM and return base64 string."""
-    key = get_aes_key()
     data = plaintext.encode("utf-8")
     iv = os.urandom(12)
-    aesgcm = AESGCM(key)
-    ciphertext = aesgcm.encrypt(iv, data, None)
+    ciphertext = _get_cipher().encrypt(iv, data, None)
     return b64encode(iv + ciphertext).decode("utf-8")
 
 
 def decrypt_value(enc: str) -> str:
     """Decrypt base64 string that was encrypted with encrypt_value."""
-    key = get_aes_key()
     raw = b64decode(enc)
     iv = raw[:12]
     ciphertext = raw[12:]
-    aesgcm = AESGCM(key)
-    data = aesgcm.decrypt(iv, ciphertext, None)
+    data = _get_cipher().decrypt(iv, ciphertext, None)
     return data.decode("utf-8")
+
+
+def blind_index_value(field: str, normalized: str) -> bytes:
+    """Keyed HMAC-SHA256 digest of an already-normalized value, scoped per field."""
+    message = field.encode("utf-8") + b"\x00" + normalized.encode("utf-8")
+    return hmac.new(_get_index_key(), message, hashlib.sha256).digest()
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no connection becomes available within the borrow timeout."""
+
+
+class PooledConnection:
+    """Proxy around a raw connection; close() hands it back to the pool."""
+
+    def __init__(self, pool: "ConnectionPool", raw, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        hook = self._pool.cursor_hook
+        return hook(cursor) if hook else cursor
+
+    def close(self) -> None:
+        if self._returned:
+            return
+        self._returned = True
+        self._pool._release(self._raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """Thread-safe connection pool with overflow, idle timeout, pre-ping and recycling.
+
+    Up to ``size`` connections are kept idle for reuse. Up to ``max_overflow``
+    extra connections may be opened under load; they are closed when returned
+    if the idle set is already full. Borrowers wait at most ``timeout`` seconds.
+    ``cursor_hook``, if set, wraps every cursor handed out (e.g. for timing).
+    """
+
+    def __init__(self, connect: Callable, size: int = 5, max_overflow: int = 10,
+                 timeout: float = 30.0, idle_timeout: float = 300.0,
+                 recycle: float = 3600.0, pre_ping: bool = True,
+                 cursor_hook: Optional[Callable] = None):
+        self._connect = connect
+        self.cursor_hook = cursor_hook
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = deque()  # (raw, created_at, returned_at)
+        self._cond = threading.Condition()
+        self._open = 0
+        self._pid = os.getpid()
+        self._stats = {"borrowed": 0, "waiting": 0, "created": 0, "recycled": 0,
+                       "discarded": 0, "overflow_closed": 0, "timeouts": 0}
+
+    def _discard(self, raw) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_stale(self, created_at: float, returned_at: float, now: float) -> bool:
+        if self.recycle and now - created_at > self.recycle:
+            return True
+        if self.idle_timeout and now - returned_at > self.idle_timeout:
+            return True
+        return False
+
+    def _check_fork(self) -> None:
+        # Sockets inherited across fork() must never be shared with the parent.
+        if self._pid != os.getpid():
+            self._idle.clear()
+            self._open = 0
+            self._pid = os.getpid()
+
+    def connect(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._check_fork()
+            while True:
+                now = time.time()
+                while self._idle:
+                    raw, created_at, returned_at = self._idle.pop()
+                    if self._is_stale(created_at, returned_at, now):
+                        self._open -= 1
+                        self._stats["recycled"] += 1
+                        self._discard(raw)
+                        continue
+                    self._cond.release()
+                    try:
+                        alive = not self.pre_ping or self._ping(raw)
+                    finally:
+                        self._cond.acquire()
+                    if not alive:
+                        self._open -= 1
+                        self._stats["discarded"] += 1
+                        self._discard(raw)
+                        continue
+                    self._stats["borrowed"] += 1
+                    return PooledConnection(self, raw, created_at)
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available within {self.timeout:.1f}s "
+                        f"(pool size={self.size}, overflow={self.max_overflow})"
+                    )
+                self._stats["waiting"] += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._stats["waiting"] -= 1
+
+        # Open the new connection outside the lock so slow handshakes don't stall other borrowers.
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+            self._stats["borrowed"] += 1
+        return PooledConnection(self, raw, time.time())
+
+    @staticmethod
+    def _ping(raw) -> bool:
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _release(self, raw, created_at: float) -> None:
+        # End any transaction left open by read-only callers so the next borrower
+        # does not inherit a stale REPEATABLE READ snapshot.
+        healthy = True
+        try:
+            raw.rollback()
+        except Exception:
+            healthy = False
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            now = time.time()
+            if not healthy:
+                reason = "discarded"
+            elif self.recycle and now - created_at > self.recycle:
+                reason = "recycled"
+            elif len(self._idle) >= self.size:
+                reason = "overflow_closed"
+            else:
+                reason = None
+            if reason:
+                self._open -= 1
+                self._stats[reason] += 1
+                self._discard(raw)
+            else:
+                self._idle.append((raw, created_at, now))
+            self._cond.notify()
+
+    def reset_after_fork(self) -> None:
+        """Forget connections (and lock state) inherited from the parent; call first thing in a forked worker."""
+        self._cond = threading.Condition()
+        self._check_fork()
+
+    def dispose(self) -> None:
+        """Close all idle connections (checked-out ones close on return)."""
+        with self._cond:
+            while self._idle:
+                raw, _, _ = self._idle.pop()
+                self._open -= 1
+                self._discard(raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            data = dict(self._stats)
+            data.update(
+                size=self.size,
+                max_overflow=self.max_overflow,
+                open=self._open,
+                idle=len(self._idle),
+                in_use=self._open - len(self._idle),
+            )
+            return data
@@ -0,0 +1,60 @@
+# Gunicorn settings, read automatically when starting `gunicorn wsgi:app` from this directory.
+# Gunicorn is optional (`pip install gunicorn`); `python app.py` still runs the development server.
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('APP_HOST', '127.0.0.1')}:{os.environ.get('APP_PORT', '5000')}"
+# Workers are processes (one connection pool each), threads share a worker's pool; keep
+# APP_THREADS <= DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW and workers * that below max_connections.
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+# Sessions must be visible to every worker: default to the host-wide SQLite store (read
+# when the app is imported, after this file). Set SESSION_BACKEND=mysql for several hosts.
+os.environ.setdefault("SESSION_BACKEND", "sqlite")
+threads = int(os.environ.get("APP_THREADS", "4"))
+worker_class = "gthread"
+# Import the app once in the master so workers share its code pages copy-on-write
+preload_app = True
+timeout = int(os.environ.get("APP_WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("APP_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.environ.get("APP_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+# TLS in gunicorn itself; leave unset when a proxy terminates TLS (it must send X-Forwarded-Proto)
+certfile = os.environ.get("TLS_CERT_FILE") or None
+keyfile = os.environ.get("TLS_KEY_FILE") or None
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+accesslog = os.environ.get("APP_ACCESS_LOG") or None
+
+
+def on_starting(server):
+    # Master only, before any worker exists: database check once instead of per worker
+    from app import check_mysql_and_database
+    from sessions import SESSION_BACKEND
+
+    if not check_mysql_and_database():
+        raise SystemExit(1)
+    if server.cfg.workers > 1 and SESSION_BACKEND == "memory":
+        server.log.error("SESSION_BACKEND=memory keeps sessions per worker, so users would be logged "
+                         "out as requests move between the %d workers; use sqlite or mysql, or run "
+                         "one worker (WEB_CONCURRENCY=1)", server.cfg.workers)
+        raise SystemExit(1)
+
+
+def when_ready(server):
+    # Master, after binding and before forking: keys, schema metadata and templates for all workers
+    from app import preload_shared_state
+
+    preload_shared_state()
+
+
+def on_reload(server):
+    # `kill -HUP <master pid>`: re-read keys and metadata, then gunicorn replaces workers gracefully
+    from app import preload_shared_state
+
+    preload_shared_state()
+
+
+def post_fork(server, worker):
+    from app import reset_after_fork
+
+    reset_after_fork()
@@ -1,20 +1,39 @@
+import argparse
+import csv
+import json
 import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 import mysql.connector
 from mysql.connector import errorcode
-from crypto_utils import encrypt_value, decrypt_value
+from audit import (ASYNC_AUDIT, audit_partition_clause, audit_partitions, ensure_audit_partitions,
+                   expire_audit_partitions, partition_audit_log)
+from billing import audit_overdue, mark_overdue, reconcile_billing
+from config import db_connect_args, get_aes_key, get_blind_index_key
+from crypto_utils import encrypt_value, decrypt_value, blind_index_value, use_keys
+from instrumentation import timed
+from sessions import SESSION_BACKEND, SESSION_BACKENDS, MySQLStore, SQLiteStore
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Bump whenever create_database_and_tables changes the schema; running it stamps
+# Schema_Meta so in-process caches (schema_cache.py) know to reload.
+SCHEMA_VERSION = 9
 
+
+@timed("crypto")
 def encrypt_data(plain_text: str) -> str:
     """Encrypt sensitive values with AES-256-GCM (base64 payload)."""
     return encrypt_value(plain_text or "")
 
 
+@timed("crypto")
 def decrypt_data(encrypted_data) -> str:
     """Decrypt AES-256-GCM payload pulled from the database."""
     if encrypted_data in (None, b"", ""):
@@ -23,13 +42,119 @@ def decrypt_data(encrypted_data) -> str:
         encrypted_data = encrypted_data.decode("utf-8")
     return decrypt_value(encrypted_data)
 
+
+# Registry of columns stored as AES-GCM ciphertext (see create_database_and_tables).
+# Readers decrypt exactly these columns; every other column, including the binary
+# *_bidx blind indexes, is treated as plaintext without trial decryption.
+ENCRYPTED_COLUMNS = {
+    "Staff": ("email", "phone_number"),
+    "Patient": ("phone_number", "email", "ssn", "state_id"),
+    "Medical_Record": ("diagnosis", "treatment_plan"),
+    "Payment_Methods": ("data_enc",),
+    "Patient_Sensitive": ("mrn", "home_address", "insurance_policy"),
+}
+
+
+def encrypted_columns(table: str, selected=None):
+    """Encrypted columns of ``table``, optionally limited to the ``selected`` column names."""
+    columns = ENCRYPTED_COLUMNS.get(table, ())
+    if selected is None:
+        return columns
+    selected = set(selected)
+    return tuple(column for column in columns if column in selected)
+
+
+# Normalizers applied before hashing so that equivalent inputs ("555-123-4567"
+# vs "(555) 123 4567", "A@x.com" vs "a@x.com") produce the same blind index.
+BLIND_INDEX_NORMALIZERS = {
+    "email": lambda value: value.strip().lower(),
+    "phone": lambda value: re.sub(r"\D", "", value),
+    "mrn": lambda value: re.sub(r"[^0-9A-Z]", "", value.upper()),
+    "insurance": lambda value: re.sub(r"[^0-9A-Z]", "", value.upper()),
+}
+
+
+def blind_index(value, field: str):
+    """Keyed HMAC blind index for equality search on an encrypted field (None if empty)."""
+    normalized = BLIND_INDEX_NORMALIZERS[field](value or "")
+    if not normalized:
+        return None
+    return blind_index_value(field, normalized)
+
+
+# Pages with at least this many encrypted cells are decrypted on a thread pool;
+# AES-GCM runs in OpenSSL with the GIL released, so threads give real parallelism.
+PARALLEL_DECRYPT_THRESHOLD = int(os.environ.get("PARALLEL_DECRYPT_THRESHOLD", "512"))
+CRYPTO_WORKERS = int(os.environ.get("CRYPTO_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+_crypto_executor = None
+_crypto_executor_lock = threading.Lock()
+
+
+def _get_crypto_executor() -> ThreadPoolExecutor:
+    global _crypto_executor
+    with _crypto_executor_lock:
+        if _crypto_executor is None:
+            _crypto_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto")
+        return _crypto_executor
+
+
+def _decrypt_cells(cells):
+    """Decrypt (row_index, column, value) triples; return (results, errors)."""
+    results = []
+    errors = []
+    for row_index, column, value in cells:
+        try:
+            results.append((row_index, column, decrypt_data(value)))
+        except Exception as exc:
+            errors.append((row_index, column, exc))
+    return results, errors
+
+
+@timed("crypto")
+def decrypt_many(rows, columns, placeholder="[Encrypted]", keep_null=False, parallel=None):
+    """Decrypt ``columns`` of every row in a fetched result set in one pass.
+
+    Dict rows are updated in place; tuple rows are replaced by lists. NULLs
+    become "" like decrypt_data() unless ``keep_null`` is set. Cells that fail
+    to decrypt are set to ``placeholder`` and reported instead of raised.
+    Returns ``(rows, errors)`` where errors is a list of (row_index, column, exc).
+    """
+    rows = [row if isinstance(row, (dict, list)) else list(row) for row in rows]
+    cells = [(i, col, row[col]) for i, row in enumerate(rows) for col in columns
+             if not (keep_null and row[col] is None)]
+    if parallel is None:
+        parallel = len(cells) >= PARALLEL_DECRYPT_THRESHOLD
+    if parallel and len(cells) > 1:
+        executor = _get_crypto_executor()
+        chunk = -(-len(cells) // CRYPTO_WORKERS)
+        parts = executor.map(_decrypt_cells, [cells[i:i + chunk] for i in range(0, len(cells), chunk)])
+        results, errors = [], []
+        for part_results, part_errors in parts:
+            results.extend(part_results)
+            errors.extend(part_errors)
+    else:
+        results, errors = _decrypt_cells(cells)
+
+    for row_index, column, value in results:
+        rows[row_index][column] = value
+    for row_index, column, _ in errors:
+        rows[row_index][column] = placeholder
+    return rows, errors
+
+
+@timed("crypto")
+def encrypt_many(values, parallel=None):
+    """Encrypt a sequence of plaintexts, preserving order (None encrypts as "")."""
+    values = list(values)
+    if parallel is None:
+        parallel = len(values) >= PARALLEL_DECRYPT_THRESHOLD
+    if parallel and len(values) > 1:
+        return list(_get_crypto_executor().map(encrypt_data, values))
+    return [encrypt_data(value) for value in values]
+
 def connect_to_db():
     """Connect to the MySQL database"""
-    return mysql.connector.connect(
-        host="localhost",
-        user=os.environ.get("DB_USER"),
-        password=os.environ.get("DB_PASS"),
-    )
+    return mysql.connector.connect(**db_connect_args())
 
 def create_database_and_tables():
     """Create the database and tables with foreign keys and encrypted columns"""
@@ -84,6 +209,11 @@ def create_database_and_tables():
         ssn BLOB,                         -- Encrypted Social Security Number (or other gov't ID)
         state_id BLOB,                    -- Encrypted State ID
         primary_doctor_id INT,            -- Foreign Key (Links to Staff)
+        email_bidx VARBINARY(32),         -- HMAC blind index of normalized email
+        phone_bidx VARBINARY(32),         -- HMAC blind index of phone digits
+        first_name_norm VARCHAR(100) AS (LOWER(TRIM(first_name))) STORED,
+        last_name_norm VARCHAR(100) AS (LOWER(TRIM(last_name))) STORED,
+        full_name_norm VARCHAR(201) AS (LOWER(CONCAT_WS(' ', TRIM(first_name), TRIM(last_name)))) STORED,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
         FOREIGN KEY (primary_doctor_id) REFERENCES Staff(staff_id)
@@ -97,6 +227,8 @@ def create_database_and_tables():
         patient_id INT,
         doctor_id INT,
         appointment_date DATETIME,
+        duration_minutes SMALLINT NOT NULL DEFAULT 30,
+        appointment_end DATETIME AS (appointment_date + INTERVAL duration_minutes MINUTE) STORED,
         status VARCHAR(20) DEFAULT 'Scheduled',  -- Status of the appointment
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -104,6 +236,23 @@ def create_database_and_tables():
         FOREIGN KEY (doctor_id) REFERENCES Staff(staff_id)
     );
     """)
+
+    # Weekly working hours per doctor; scheduling.py turns them into bookable slots
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Doctor_Availability (
+        availability_id INT AUTO_INCREMENT PRIMARY KEY,
+        doctor_id INT NOT NULL,
+        weekday TINYINT NOT NULL,         -- 0 = Monday ... 6 = Sunday
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        slot_minutes SMALLINT NOT NULL DEFAULT 30,
+        valid_from DATE,                  -- NULL = no start/end limit
+        valid_until DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (doctor_id) REFERENCES Staff(staff_id),
+        INDEX idx_availability_doctor (doctor_id, weekday)
+    );
+    """)
     
     # Create the Medical Record table
     cursor.execute("""
@@ -128,13 +277,49 @@ def create_database_and_tables():
                 return
             raise
 
+    def safe_add_column(sql_stmt):
+        # Brings databases created by older versions of this script up to date.
+        try:
+            cursor.execute(sql_stmt)
+        except mysql.connector.Error as exc:
+            if exc.errno == errorcode.ER_DUP_FIELDNAME:
+                return
+            raise
+
+    # Appointment lengths and the doctor/time index used for overlap checks (scheduling.py)
+    safe_add_column("ALTER TABLE Appointment ADD COLUMN duration_minutes SMALLINT NOT NULL DEFAULT 30;")
+    safe_add_column("ALTER TABLE Appointment ADD COLUMN appointment_end DATETIME "
+                    "AS (appointment_date + INTERVAL duration_minutes MINUTE) STORED;")
+    safe_create_index("CREATE INDEX idx_appointment_doctor_date ON Appointment(doctor_id, appointment_date);")
+    # Patient calendar range reads (scheduling.patient_calendar)
+    safe_create_index("CREATE INDEX idx_appointment_patient_date ON Appointment(patient_id, appointment_date);")
+
+    safe_add_column("ALTER TABLE Patient ADD COLUMN email_bidx VARBINARY(32);")
+    safe_add_column("ALTER TABLE Patient ADD COLUMN phone_bidx VARBINARY(32);")
+    safe_create_index("CREATE INDEX idx_patient_email_bidx ON Patient(email_bidx);")
+    safe_create_index("CREATE INDEX idx_patient_phone_bidx ON Patient(phone_bidx);")
+
+    # Normalized name columns back the indexed prefix/infix search in patient_search.py
+    safe_add_column("ALTER TABLE Patient ADD COLUMN first_name_norm VARCHAR(100) AS (LOWER(TRIM(first_name))) STORED;")
+    safe_add_column("ALTER TABLE Patient ADD COLUMN last_name_norm VARCHAR(100) AS (LOWER(TRIM(last_name))) STORED;")
+    safe_add_column("ALTER TABLE Patient ADD COLUMN full_name_norm VARCHAR(201) "
+                    "AS (LOWER(CONCAT_WS(' ', TRIM(first_name), TRIM(last_name)))) STORED;")
+    safe_create_index("CREATE INDEX idx_patient_first_name_norm ON Patient(first_name_norm);")
+    safe_create_index("CREATE INDEX idx_patient_last_name_norm ON Patient(last_name_norm);")
+    safe_create_index("CREATE INDEX idx_patient_full_name_norm ON Patient(full_name_norm);")
+    try:
+        safe_create_index("CREATE FULLTEXT INDEX ft_patient_full_name ON Patient(full_name_norm) WITH PARSER ngram;")
+    except mysql.connector.Error as exc:
+        print(f"Warning: ngram FULLTEXT index unavailable ({exc}); infix name search is disabled.")
+
     # Create the Billing table
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS Billing (
         billing_id INT AUTO_INCREMENT PRIMARY KEY,
         patient_id INT,
         total_amount DECIMAL(10, 2) NOT NULL,
-        paid_amount DECIMAL(10, 2) DEFAULT 0.00,
+        paid_amount DECIMAL(10, 2) DEFAULT 0.00,  -- Maintained by billing.record_payment
+        balance_due DECIMAL(10, 2) AS (total_amount - COALESCE(paid_amount, 0)) STORED,
         status VARCHAR(20) DEFAULT 'Pending',
         payment_due_date DATETIME,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -144,6 +329,11 @@ def create_database_and_tables():
     """)
     safe_create_index("CREATE INDEX idx_billing_patient ON Billing(patient_id);")
     safe_create_index("CREATE INDEX idx_billing_status ON Billing(status);")
+    safe_add_column("ALTER TABLE Billing ADD COLUMN balance_due DECIMAL(10, 2) "
+                    "AS (total_amount - COALESCE(paid_amount, 0)) STORED AFTER paid_amount;")
+    safe_create_index("CREATE INDEX idx_billing_patient_balance ON Billing(patient_id, balance_due);")
+    # Overdue sweep (billing.mark_overdue) reads unpaid bills by due date
+    safe_create_index("CREATE INDEX idx_billing_status_due ON Billing(status, payment_due_date);")
 
     # Create the Payment_Methods table (store encrypted method data)
     cursor.execute("""
@@ -173,6 +363,7 @@ def create_database_and_tables():
         paid_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         status VARCHAR(20) DEFAULT 'Posted',
         note TEXT,
+        idempotency_key VARCHAR(64),        -- One-time key from the payment form (see billing.post_payment)
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (billing_id) REFERENCES Billing(billing_id),
         FOREIGN KEY (patient_id) REFERENCES Patient(patient_id),
@@ -181,6 +372,9 @@ def create_database_and_tables():
     """)
     safe_create_index("CREATE INDEX idx_payment_tx_billing ON Payment_Transactions(billing_id);")
     safe_create_index("CREATE INDEX idx_payment_tx_patient ON Payment_Transactions(patient_id);")
+    safe_add_column("ALTER TABLE Payment_Transactions ADD COLUMN idempotency_key VARCHAR(64);")
+    # NULL keys (admin-loaded or legacy rows) do not conflict under a UNIQUE index
+    safe_create_index("CREATE UNIQUE INDEX uq_payment_tx_idempotency ON Payment_Transactions(idempotency_key);")
 
     # Create table for additional sensitive identifiers (address, MRN, insurance)
     cursor.execute("""
@@ -191,29 +385,44 @@ def create_database_and_tables():
         home_address BLOB,                    -- Encrypted address
         insurance_policy BLOB,                -- Encrypted insurance policy number
         card_last4 VARCHAR(12),               -- Last 4-6 digits only (no full PAN storage)
+        mrn_bidx VARBINARY(32),               -- HMAC blind index of normalized MRN
+        insurance_bidx VARBINARY(32),         -- HMAC blind index of normalized policy number
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
         FOREIGN KEY (patient_id) REFERENCES Patient(patient_id) ON DELETE CASCADE
     );
     """)
     safe_create_index("CREATE INDEX idx_sensitive_patient ON Patient_Sensitive(patient_id);")
+    safe_add_column("ALTER TABLE Patient_Sensitive ADD COLUMN mrn_bidx VARBINARY(32);")
+    safe_add_column("ALTER TABLE Patient_Sensitive ADD COLUMN insurance_bidx VARBINARY(32);")
+    safe_create_index("CREATE INDEX idx_sensitive_mrn_bidx ON Patient_Sensitive(mrn_bidx);")
+    safe_create_index("CREATE INDEX idx_sensitive_insurance_bidx ON Patient_Sensitive(insurance_bidx);")
     
-    # Audit log table
-    cursor.execute("""
+    # Audit log table, range-partitioned by month of changed_at so time-window queries
+    # prune to the months they cover and retention drops whole partitions (see audit.py).
+    # The partition key must be part of every unique key, hence the composite primary key.
+    cursor.execute(f"""
     CREATE TABLE IF NOT EXISTS Audit_Log (
-        audit_id INT AUTO_INCREMENT PRIMARY KEY,
+        audit_id INT AUTO_INCREMENT,
         table_name VARCHAR(255) NOT NULL,
         record_id INT NOT NULL,
         action VARCHAR(50) NOT NULL,
         changed_by VARCHAR(255),
-        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
         old_data TEXT,
-        new_data TEXT
-    );
+        new_data TEXT,
+        PRIMARY KEY (audit_id, changed_at)
+    )
+    {audit_partition_clause(datetime.now())};
     """)
+    if partition_audit_log(cursor):
+        print("Partitioned existing Audit_Log by month.")
+    ensure_audit_partitions(cursor)
     safe_create_index("CREATE INDEX idx_audit_table_record ON Audit_Log(table_name, record_id);")
+    safe_create_index("CREATE INDEX idx_audit_changed_at ON Audit_Log(changed_at);")
+    safe_create_index("CREATE INDEX idx_audit_actor ON Audit_Log(changed_by, changed_at);")
 
-    # Triggers for audit logging
+    # Triggers for audit logging. JSON_OBJECT (unlike CONCAT) keeps NULL columns as JSON null.
     triggers = [
         # Patient updates
         ("DROP TRIGGER IF EXISTS trg_patient_before_update;", """
@@ -227,8 +436,8 @@ def create_database_and_tables():
                 OLD.patient_id,
                 'UPDATE',
                 'SYSTEM',
-                CONCAT('{\"first_name\":\"', OLD.first_name, '\",\"last_name\":\"', OLD.last_name, '\",\"dob\":\"', OLD.dob, '\",\"gender\":\"', OLD.gender, '\"}'),
-                CONCAT('{\"first_name\":\"', NEW.first_name, '\",\"last_name\":\"', NEW.last_name, '\",\"dob\":\"', NEW.dob, '\",\"gender\":\"', NEW.gender, '\"}')
+                JSON_OBJECT('first_name', OLD.first_name, 'last_name', OLD.last_name, 'dob', OLD.dob, 'gender', OLD.gender),
+                JSON_OBJECT('first_name', NEW.first_name, 'last_name', NEW.last_name, 'dob', NEW.dob, 'gender', NEW.gender)
             );
         END;
         """),
@@ -244,8 +453,8 @@ def create_database_and_tables():
                 OLD.sensitive_id,
                 'UPDATE',
                 'SYSTEM',
-                CONCAT('{\"card_last4\":\"', OLD.card_last4, '\"}'),
-                CONCAT('{\"card_last4\":\"', NEW.card_last4, '\"}')
+                JSON_OBJECT('card_last4', OLD.card_last4),
+                JSON_OBJECT('card_last4', NEW.card_last4)
             );
         END;
         """),
@@ -261,8 +470,8 @@ def create_database_and_tables():
                 OLD.billing_id,
                 'UPDATE',
                 'SYSTEM',
-                CONCAT('{\"total_amount\":', OLD.total_amount, ',\"paid_amount\":', OLD.paid_amount, ',\"status\":\"', OLD.status, '\"}'),
-                CONCAT('{\"total_amount\":', NEW.total_amount, ',\"paid_amount\":', NEW.paid_amount, ',\"status\":\"', NEW.status, '\"}')
+                JSON_OBJECT('total_amount', OLD.total_amount, 'paid_amount', OLD.paid_amount, 'status', OLD.status),
+                JSON_OBJECT('total_amount', NEW.total_amount, 'paid_amount', NEW.paid_amount, 'status', NEW.status)
             );
         END;
         """),
@@ -278,8 +487,8 @@ def create_database_and_tables():
                 OLD.payment_method_id,
                 'UPDATE',
                 'SYSTEM',
-                CONCAT('{\"type\":\"', OLD.type, '\",\"last4\":\"', OLD.last4, '\",\"is_default\":', OLD.is_default, '}'),
-                CONCAT('{\"type\":\"', NEW.type, '\",\"last4\":\"', NEW.last4, '\",\"is_default\":', NEW.is_default, '}')
+                JSON_OBJECT('type', OLD.type, 'last4', OLD.last4, 'is_default', OLD.is_default),
+                JSON_OBJECT('type', NEW.type, 'last4', NEW.last4, 'is_default', NEW.is_default)
             );
         END;
         """),
@@ -295,7 +504,7 @@ def create_database_and_tables():
                 NEW.payment_id,
                 'INSERT',
                 'SYSTEM',
-                CONCAT('{\"billing_id\":', NEW.billing_id, ',\"patient_id\":', NEW.patient_id, ',\"amount\":', NEW.amount, ',\"status\":\"', NEW.status, '\"}')
+                JSON_OBJECT('billing_id', NEW.billing_id, 'patient_id', NEW.patient_id, 'amount', NEW.amount, 'status', NEW.status)
             );
         END;
         """)
@@ -303,9 +512,37 @@ def create_database_and_tables():
 
     for drop_sql, create_sql in triggers:
         cursor.execute(drop_sql)
-        cursor.execute(create_sql)
+        # AUDIT_MODE=async: the application records these events (audit.py) instead
+        if not ASYNC_AUDIT:
+            cursor.execute(create_sql)
         db_connection.commit()
 
+    # Server-side sessions for SESSION_BACKEND=mysql (sessions.py); keyed by a digest of the cookie id
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS App_Session (
+        session_key CHAR(64) PRIMARY KEY,
+        user_id INT NULL,
+        data MEDIUMTEXT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        INDEX idx_app_session_user (user_id),
+        INDEX idx_app_session_expires (expires_at)
+    );
+    """)
+
+    # Schema version stamp (single row), read by schema_cache.py
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Schema_Meta (
+        meta_id TINYINT PRIMARY KEY,
+        schema_version INT NOT NULL,
+        migrated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+    );
+    """)
+    cursor.execute("""
+        INSERT INTO Schema_Meta (meta_id, schema_version, migrated_at)
+        VALUES (1, %s, CURRENT_TIMESTAMP(6))
+        ON DUPLICATE KEY UPDATE schema_version = VALUES(schema_version), migrated_at = VALUES(migrated_at)
+    """, (SCHEMA_VERSION,))
+
     db_connection.commit()
     cursor.close()
     db_connection.close()
@@ -373,8 +610,9 @@ def insert_patient_data(db_connection, patient_data):
     
     # Prepare the SQL insert query
     query = """
-        INSERT INTO Patient (first_name, last_name, dob, gender, phone_number, email, ssn, state_id, primary_doctor_id)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        INSERT INTO Patient (first_name, last_name, dob, gender, phone_number, email, ssn, state_id, primary_doctor_id,
+                             email_bidx, phone_bidx)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
     
     # Ensure primary_doctor_id is integer or None, never boolean
@@ -391,7 +629,9 @@ def insert_patient_data(db_connection, patient_data):
         encrypted_email,
         encrypted_ssn,
         encrypted_state_id,
-        primary_doctor_id
+        primary_doctor_id,
+        blind_index(patient_data['email'], 'email'),
+        blind_index(patient_data['phone_number'], 'phone')
     )
     
     # Execute the query and commit the changes
@@ -499,6 +739,17 @@ def insert_comprehensive_dummy_data():
         for staff_data in staff_members:
             staff_id = insert_staff_data(db_connection, staff_data)
             staff_ids.append(staff_id)
+
+        # Doctors work weekdays 9-12 and 13-17 in 30-minute slots
+        for staff_id, staff_data in zip(staff_ids, staff_members):
+            if staff_data['role'] != 'Doctor':
+                continue
+            for weekday in range(5):
+                for start_time, end_time in (("09:00", "12:00"), ("13:00", "17:00")):
+                    cursor.execute("""
+                        INSERT INTO Doctor_Availability (doctor_id, weekday, start_time, end_time, slot_minutes)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (int(staff_id), weekday, start_time, end_time, 30))
         
         # Insert multiple patients with complete information (excluding John Doe - Patient ID 1 and Jane Smith patient)
         # Ensure all staff_ids are integers to prevent boolean values in ID columns
@@ -542,14 +793,17 @@ def insert_comprehensive_dummy_data():
             # Ensure patient_id is integer, not boolean
             patient_id_val = int(sensitive_data['patient_id']) if sensitive_data['patient_id'] is not None else None
             cursor.execute("""
-                INSERT INTO Patient_Sensitive (patient_id, mrn, home_address, insurance_policy, card_last4)
-                VALUES (%s, %s, %s, %s, %s)
+                INSERT INTO Patient_Sensitive (patient_id, mrn, home_address, insurance_policy, card_last4,
+                                               mrn_bidx, insurance_bidx)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (
                 patient_id_val,
                 encrypt_data(sensitive_data['mrn']),
                 encrypt_data(sensitive_data['home_address']),
                 encrypt_data(sensitive_data['insurance_policy']),
-                sensitive_data['card_last4']
+                sensitive_data['card_last4'],
+                blind_index(sensitive_data['mrn'], 'mrn'),
+                blind_index(sensitive_data['insurance_policy'], 'insurance')
             ))
         
         # Insert Appointments (excluding appointments with Patient ID 1 and Staff ID 1)
@@ -675,6 +929,262 @@ def insert_comprehensive_dummy_data():
         db_connection.close()
 
 
+def backfill_blind_indexes(batch_size=500):
+    """Compute blind indexes for rows written before the *_bidx columns existed."""
+    db_connection = connect_to_db()
+    db_connection.database = "secure_hospital_db"
+    cursor = db_connection.cursor()
+    jobs = [
+        ("Patient", "patient_id", (("email", "email_bidx", "email"), ("phone_number", "phone_bidx", "phone"))),
+        ("Patient_Sensitive", "sensitive_id", (("mrn", "mrn_bidx", "mrn"), ("insurance_policy", "insurance_bidx", "insurance"))),
+    ]
+    try:
+        for table, pk, fields in jobs:
+            select_sql = (
+                f"SELECT {pk}, {', '.join(src for src, _, _ in fields)} FROM {table} "
+                f"WHERE {pk} > %s ORDER BY {pk} LIMIT %s"
+            )
+            update_sql = f"UPDATE {table} SET {', '.join(f'{dst} = %s' for _, dst, _ in fields)} WHERE {pk} = %s"
+            last_id = 0
+            updated = 0
+            while True:
+                cursor.execute(select_sql, (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                decrypted, errors = decrypt_many(rows, range(1, len(fields) + 1), placeholder=None)
+                failed = {row_index for row_index, _, _ in errors}
+                params = [
+                    tuple(blind_index(row[i + 1], kind) for i, (_, _, kind) in enumerate(fields)) + (row[0],)
+                    for row_index, row in enumerate(decrypted) if row_index not in failed
+                ]
+                if params:
+                    cursor.executemany(update_sql, params)
+                db_connection.commit()
+                updated += len(params)
+                if failed:
+                    print(f"  {table}: skipped {len(failed)} rows that could not be decrypted")
+                last_id = rows[-1][0]
+            print(f"Backfilled blind indexes for {updated} {table} rows.")
+    except Exception as e:
+        print(f"Error backfilling blind indexes: {e}")
+        db_connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        db_connection.close()
+
+
+# Columns accepted per table by bulk_load(). Primary keys are optional in the input
+# so migration extracts can keep their IDs and reference each other across files.
+BULK_LOAD_COLUMNS = {
+    "Users": ("user_id", "email", "password_hash", "role", "reference_id", "is_active"),
+    "Staff": ("staff_id", "first_name", "last_name", "role", "email", "phone_number"),
+    "Patient": ("patient_id", "first_name", "last_name", "dob", "gender", "phone_number", "email",
+                "ssn", "state_id", "primary_doctor_id"),
+    "Patient_Sensitive": ("sensitive_id", "patient_id", "mrn", "home_address", "insurance_policy", "card_last4"),
+    "Appointment": ("appointment_id", "patient_id", "doctor_id", "appointment_date", "status"),
+    "Doctor_Availability": ("availability_id", "doctor_id", "weekday", "start_time", "end_time", "slot_minutes",
+                            "valid_from", "valid_until"),
+    "Medical_Record": ("record_id", "patient_id", "doctor_id", "diagnosis", "treatment_plan"),
+    "Billing": ("billing_id", "patient_id", "total_amount", "paid_amount", "status", "payment_due_date"),
+    "Payment_Methods": ("payment_method_id", "patient_id", "type", "last4", "data_enc", "is_default"),
+    "Payment_Transactions": ("payment_id", "billing_id", "patient_id", "payment_method_id", "amount",
+                             "paid_at", "status", "note"),
+}
+
+# (index column, plaintext source column, blind_index field) derived during load
+BULK_LOAD_BLIND_INDEXES = {
+    "Patient": (("email_bidx", "email", "email"), ("phone_bidx", "phone_number", "phone")),
+    "Patient_Sensitive": (("mrn_bidx", "mrn", "mrn"), ("insurance_bidx", "insurance_policy", "insurance")),
+}
+
+
+def _read_records(path, fmt):
+    """Yield dict records from a CSV (header row) or JSONL file; empty CSV cells become NULL."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for record in csv.DictReader(f):
+                yield {key: (value if value != "" else None) for key, value in record.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _batched(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_load_columns(table, records):
+    """Columns of ``table`` present in the extract; every record must carry exactly the same ones."""
+    allowed = BULK_LOAD_COLUMNS[table]
+    columns = None
+    for number, record in enumerate(records, start=1):
+        unknown = set(record) - set(allowed)
+        if unknown:
+            raise ValueError(f"Record {number}: unknown columns for {table}: {', '.join(sorted(unknown))}")
+        present = tuple(col for col in allowed if col in record)
+        if columns is None:
+            columns = present
+        elif present != columns:
+            raise ValueError(f"Record {number}: columns ({', '.join(present)}) differ from the first "
+                             f"record's ({', '.join(columns)})")
+    return columns
+
+
+def _prepare_bulk_rows(table, columns, records):
+    """Encrypt registered columns and derive blind indexes; runs in worker processes."""
+    secret = set(encrypted_columns(table))
+    indexes = BULK_LOAD_BLIND_INDEXES.get(table, ())
+    rows = []
+    for record in records:
+        row = [encrypt_data(record.get(col)) if col in secret else record.get(col) for col in columns]
+        row.extend(blind_index(record.get(source), field) for _, source, field in indexes)
+        rows.append(tuple(row))
+    return rows
+
+
+def bulk_load(table, path, fmt=None, batch_size=1000, workers=None, disable_checks=False):
+    """Load a CSV/JSONL extract into ``table`` with batched multi-row INSERTs.
+
+    Encryption runs on a process pool while the previous batch is being
+    inserted; each batch is one executemany() (a single multi-row INSERT) and
+    one commit. Returns the number of rows inserted.
+    """
+    if table not in BULK_LOAD_COLUMNS:
+        raise ValueError(f"Bulk load not supported for table '{table}'")
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    workers = (os.cpu_count() or 1) if workers is None else max(1, workers)
+
+    # Validation pass over the whole extract first, so bad input is rejected before any batch commits
+    columns = _bulk_load_columns(table, _read_records(path, fmt))
+    if columns is None:
+        print(f"No records found in {path}.")
+        return 0
+    insert_columns = columns + tuple(index for index, _, _ in BULK_LOAD_BLIND_INDEXES.get(table, ()))
+    insert_sql = (
+        f"INSERT INTO {table} ({', '.join(insert_columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(insert_columns))})"
+    )
+
+    # Resolve the key bytes once (a generated key must be persisted, or it would be lost)
+    # and hand exactly these to every worker, so all rows are encrypted with the same keys.
+    keys = (get_aes_key(persist_required=True), get_blind_index_key(persist_required=True))
+    use_keys(*keys)
+
+    db_connection = connect_to_db()
+    db_connection.database = "secure_hospital_db"
+    cursor = db_connection.cursor()
+    if disable_checks:
+        cursor.execute("SET SESSION unique_checks = 0")
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=use_keys, initargs=keys) if workers > 1 else None
+    inserted = 0
+    started = datetime.now()
+    try:
+        pending = []
+        for batch in _batched(_read_records(path, fmt), batch_size):
+            if pool:
+                pending.append(pool.submit(_prepare_bulk_rows, table, columns, batch))
+                # Keep a bounded number of batches in flight so memory stays flat
+                if len(pending) < workers * 2:
+                    continue
+                rows = pending.pop(0).result()
+            else:
+                rows = _prepare_bulk_rows(table, columns, batch)
+            cursor.executemany(insert_sql, rows)
+            db_connection.commit()
+            inserted += len(rows)
+            if inserted % (batch_size * 50) < len(rows):
+                print(f"  {table}: {inserted} rows loaded...")
+        for future in pending:
+            rows = future.result()
+            cursor.executemany(insert_sql, rows)
+            db_connection.commit()
+            inserted += len(rows)
+    except Exception as e:
+        print(f"Error bulk loading {table}: {e}")
+        db_connection.rollback()
+        raise
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if disable_checks:
+            cursor.execute("SET SESSION unique_checks = 1")
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.close()
+        db_connection.close()
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Loaded {inserted} rows into {table} in {elapsed:.1f}s ({inserted / max(elapsed, 0.001):.0f} rows/s).")
+    return inserted
+
+
+def reconcile_billing_ledger(fix=False, batch_size=1000):
+    """Mark overdue bills, then report (and optionally fix) ledger drift against Payment_Transactions."""
+    db_connection = connect_to_db()
+    db_connection.database = "secure_hospital_db"
+    try:
+        cursor = db_connection.cursor()
+        overdue, changes = mark_overdue(cursor)
+        db_connection.commit()
+        audit_overdue(changes)
+        cursor.close()
+        print(f"Marked {overdue} bills Overdue.")
+        checked, drift = reconcile_billing(db_connection, fix=fix, batch_size=batch_size)
+        for entry in drift:
+            print(f"  Bill {entry['billing_id']} (patient {entry['patient_id']}): "
+                  f"paid {entry['stored_paid']} -> {entry['expected_paid']}, "
+                  f"status {entry['stored_status']} -> {entry['expected_status']}"
+                  f"{' [fixed]' if entry['fixed'] else ''}")
+        fixed = sum(1 for entry in drift if entry["fixed"])
+        print(f"Checked {checked} bills: {len(drift)} with drift"
+              f"{f', {fixed} fixed' if fix else ' (run with --fix to correct)' if drift else ''}.")
+        return drift
+    except Exception as e:
+        print(f"Error reconciling billing ledger: {e}")
+        db_connection.rollback()
+        raise
+    finally:
+        db_connection.close()
+
+
+def audit_retention(keep_months, export_dir=None, drop=True):
+    """Create upcoming Audit_Log partitions, then archive and/or drop the months past retention."""
+    db_connection = connect_to_db()
+    db_connection.database = "secure_hospital_db"
+    try:
+        cursor = db_connection.cursor()
+        partitioned = bool(audit_partitions(cursor))
+        added = ensure_audit_partitions(cursor) if partitioned else []
+        cursor.close()
+        if not partitioned:
+            print("Audit_Log is not partitioned; run 'python hospital_db_setup.py' to migrate it first.")
+            return []
+        if added:
+            print(f"Added Audit_Log partitions: {', '.join(added)}.")
+        expired = expire_audit_partitions(db_connection, keep_months, export_dir=export_dir, drop=drop)
+        for name, month, rows, path, dropped in expired:
+            print(f"  {name} ({month:%Y-%m}): {rows} rows"
+                  f"{f' exported to {path}' if path else ''}{' [dropped]' if dropped else ''}")
+        print(f"{len(expired)} partitions older than {keep_months} months"
+              f"{' dropped' if drop else ' (run without --no-drop to drop them)' if expired else ''}.")
+        return expired
+    except Exception as e:
+        print(f"Error applying Audit_Log retention: {e}")
+        raise
+    finally:
+        db_connection.close()
+
+
 def main():
     # Step 1: Create Database and Tables
     print("="*60)
@@ -698,5 +1208,61 @@ def main():
     print("Database setup completed successfully!")
     print("="*60)
 
+def sweep_sessions(backend=SESSION_BACKEND):
+    """Delete expired sessions from the SQLite file or App_Session table (the app also sweeps periodically)."""
+    if backend == "memory":
+        print("In-memory sessions live inside each app process and are swept there.")
+        return 0
+    if backend == "sqlite":
+        store = SQLiteStore()
+    else:
+        def connect():
+            db_connection = connect_to_db()
+            db_connection.database = "secure_hospital_db"
+            return db_connection
+        store = MySQLStore(connect)
+    swept = store.sweep(time.time())
+    print(f"Deleted {swept} expired sessions ({backend}).")
+    return swept
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Secure hospital database setup and maintenance")
+    subcommands = parser.add_subparsers(dest="command")
+    backfill_parser = subcommands.add_parser("backfill-blind-indexes", help="Populate *_bidx search columns for existing rows")
+    backfill_parser.add_argument("--batch-size", type=int, default=500)
+    load_parser = subcommands.add_parser("bulk-load", help="Load a CSV/JSONL extract with batched, encrypted inserts")
+    load_parser.add_argument("--table", required=True, choices=sorted(BULK_LOAD_COLUMNS))
+    load_parser.add_argument("--input", required=True, help="Path to a .csv (with header) or .jsonl file")
+    load_parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    load_parser.add_argument("--batch-size", type=int, default=1000)
+    load_parser.add_argument("--workers", type=int, help="Encryption processes (default: CPU count, 1 disables)")
+    load_parser.add_argument("--disable-checks", action="store_true",
+                             help="Turn off unique/foreign key checks for the load session (trusted extracts only)")
+    reconcile_parser = subcommands.add_parser("reconcile-billing",
+                                              help="Recompute bill balances/statuses from payments and report drift")
+    reconcile_parser.add_argument("--fix", action="store_true", help="Correct drifted bills")
+    reconcile_parser.add_argument("--batch-size", type=int, default=1000)
+    retention_parser = subcommands.add_parser("audit-retention",
+                                              help="Archive and drop monthly Audit_Log partitions past retention")
+    retention_parser.add_argument("--keep-months", type=int, required=True,
+                                  help="Months of audit history to keep, including the current month")
+    retention_parser.add_argument("--export-dir", help="Write each expired partition here as .jsonl.gz first")
+    retention_parser.add_argument("--no-drop", action="store_true", help="Only export/list, keep the partitions")
+    sweep_parser = subcommands.add_parser("sweep-sessions", help="Delete expired server-side sessions")
+    sweep_parser.add_argument("--backend", choices=SESSION_BACKENDS, default=SESSION_BACKEND)
+    args = parser.parse_args()
+
+    if args.command == "backfill-blind-indexes":
+        backfill_blind_indexes(batch_size=args.batch_size)
+    elif args.command == "reconcile-billing":
+        reconcile_billing_ledger(fix=args.fix, batch_size=args.batch_size)
+    elif args.command == "audit-retention":
+        audit_retention(args.keep_months, export_dir=args.export_dir, drop=not args.no_drop)
+    elif args.command == "sweep-sessions":
+        sweep_sessions(args.backend)
+    elif args.command == "bulk-load":
+        bulk_load(args.table, args.input, fmt=args.format, batch_size=args.batch_size,
+                  workers=args.workers, disable_checks=args.disable_checks)
+    else:
+        main()
@@ -0,0 +1,319 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+# INSTRUMENTATION=0 turns every hook into a no-op. Server-Timing exposes
+# internal timings to the browser, so it is opt-in.
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION", "1") == "1"
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING", "0") == "1"
+METRICS_LOG_ENABLED = os.environ.get("METRICS_LOG", "0") == "1"
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+TIMED_KINDS = ("db", "crypto", "template")
+
+metrics_logger = logging.getLogger("hospital_app.metrics")
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Counters for one request; filled in by the cursor, crypto and template hooks."""
+
+    __slots__ = ("started", "seconds", "queries", "rows", "crypto_calls", "active", "template_started")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = dict.fromkeys(TIMED_KINDS, 0.0)
+        self.queries = 0
+        self.rows = 0
+        self.crypto_calls = 0
+        self.active = set()
+        self.template_started = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def current_metrics():
+    return _current.get()
+
+
+def timed(kind):
+    """Decorator adding the wall time of the call to the current request's ``kind`` total.
+
+    Nested calls of the same kind (decrypt_many -> decrypt_data) are counted once.
+    Calls on threads without a request context (e.g. crypto worker threads) are
+    not recorded individually; the caller's span covers them.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _current.get()
+            if metrics is None or kind in metrics.active:
+                return func(*args, **kwargs)
+            metrics.active.add(kind)
+            if kind == "crypto":
+                metrics.crypto_calls += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.seconds[kind] += time.perf_counter() - start
+                metrics.active.discard(kind)
+        return wrapper
+    return decorator
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute/fetch calls and counts queries and rows."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, method, *args, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.seconds["db"] += time.perf_counter() - start
+
+    def execute(self, *args, **kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.queries += 1
+        return self._timed(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.queries += 1
+        return self._timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def _count(self, rows):
+        metrics = _current.get()
+        if metrics is not None and rows:
+            metrics.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._count((row,))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(self._timed(self._cursor.fetchmany, *args, **kwargs))
+
+    def fetchall(self):
+        return self._count(self._timed(self._cursor.fetchall))
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+        return False
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.total += value_ms
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing the q-th observation (None above the last bound)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return float(bound)
+        return None
+
+    def snapshot(self):
+        buckets = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """Per-endpoint histograms of wall, DB, crypto and template time plus query/row totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, status, wall_ms, metrics):
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = {
+                    "wall": Histogram(),
+                    **{kind: Histogram() for kind in TIMED_KINDS},
+                    "queries": 0, "rows": 0, "crypto_calls": 0, "statuses": {},
+                }
+                self._endpoints[endpoint] = entry
+            entry["wall"].observe(wall_ms)
+            for kind in TIMED_KINDS:
+                entry[kind].observe(metrics.seconds[kind] * 1000)
+            entry["queries"] += metrics.queries
+            entry["rows"] += metrics.rows
+            entry["crypto_calls"] += metrics.crypto_calls
+            entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            report = {}
+            for endpoint, entry in sorted(self._endpoints.items()):
+                requests = entry["wall"].count
+                report[endpoint] = {
+                    "requests": requests,
+                    "statuses": dict(entry["statuses"]),
+                    "wall": entry["wall"].snapshot(),
+                    **{kind: entry[kind].snapshot() for kind in TIMED_KINDS},
+                    "queries_per_request": round(entry["queries"] / requests, 2) if requests else 0.0,
+                    "rows_per_request": round(entry["rows"] / requests, 2) if requests else 0.0,
+                    "crypto_calls_per_request": round(entry["crypto_calls"] / requests, 2) if requests else 0.0,
+                }
+            return {"buckets_ms": list(LATENCY_BUCKETS_MS), "endpoints": report}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+def start_request():
+    """Begin collecting metrics for the request running in this context."""
+    if not INSTRUMENTATION_ENABLED:
+        return None
+    metrics = RequestMetrics()
+    _current.set(metrics)
+    return metrics
+
+
+def finish_request(endpoint, response):
+    """Record the current request under ``endpoint`` and annotate ``response``.
+
+    A streamed body is produced after this hook returns, so its DB, crypto and
+    template time is measured while the server iterates it and the request is
+    recorded when the response closes; Server-Timing is only added to
+    non-streamed responses, whose headers are not sent yet.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return response
+    _current.set(None)
+    if response.is_streamed:
+        response.response = _measured_body(response.response, metrics)
+        response.call_on_close(lambda: _record(endpoint, response.status_code, metrics))
+        return response
+    wall_ms = _record(endpoint, response.status_code, metrics)
+    if SERVER_TIMING_ENABLED:
+        response.headers.add("Server-Timing", ", ".join((
+            f'db;dur={metrics.seconds["db"] * 1000:.2f};desc="{metrics.queries} queries, {metrics.rows} rows"',
+            f"crypto;dur={metrics.seconds['crypto'] * 1000:.2f}",
+            f"tpl;dur={metrics.seconds['template'] * 1000:.2f}",
+            f"total;dur={wall_ms:.2f}",
+        )))
+    return response
+
+
+def _measured_body(body, metrics):
+    """Iterate ``body`` with ``metrics`` as the current request's, one chunk at a time."""
+    iterator = iter(body)
+    try:
+        while True:
+            token = _current.set(metrics)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def _record(endpoint, status, metrics):
+    """Add a finished request to the registry (and the metrics log); returns its wall time in ms."""
+    wall_ms = metrics.elapsed_ms()
+    registry.record(endpoint, status, wall_ms, metrics)
+    if METRICS_LOG_ENABLED:
+        metrics_logger.info(json.dumps({
+            "event": "request", "endpoint": endpoint, "status": status,
+            "wall_ms": round(wall_ms, 3), "db_ms": round(metrics.seconds["db"] * 1000, 3),
+            "queries": metrics.queries, "rows": metrics.rows,
+            "crypto_ms": round(metrics.seconds["crypto"] * 1000, 3), "crypto_calls": metrics.crypto_calls,
+            "template_ms": round(metrics.seconds["template"] * 1000, 3),
+        }, separators=(",", ":")))
+    return wall_ms
+
+
+def _template_started(sender, **extra):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.template_started = time.perf_counter()
+
+
+def _template_finished(sender, **extra):
+    metrics = _current.get()
+    if metrics is not None and metrics.template_started is not None:
+        metrics.seconds["template"] += time.perf_counter() - metrics.template_started
+        metrics.template_started = None
+
+
+def init_app(app):
+    """Hook template rendering and pooled DB cursors into the request metrics."""
+    if not INSTRUMENTATION_ENABLED:
+        return
+    from flask import before_render_template, template_rendered
+
+    from config import set_cursor_hook
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    set_cursor_hook(InstrumentedCursor)
+    # Log lines go through the app logger's handlers (the rotating app log)
+    global metrics_logger
+    metrics_logger = app.logger.getChild("metrics")
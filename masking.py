@@ -0,0 +1,127 @@
+import re
+from functools import lru_cache
+
+_NON_DIGITS = re.compile(r"[^\d]")
+
+# Columns containing any of these keywords are flagged as sensitive in the UI.
+SENSITIVE_KEYWORDS = [
+    'ssn', 'social_security', 'phone', 'email', 'card', 'account', 'routing',
+    'mrn', 'medical_record', 'insurance', 'address', 'password', 'pwd',
+    'state_id', 'drivers_license', 'license'
+]
+
+
+def _last4(template, fallback):
+    """Mask keeping the last four digits of the value, e.g. ``"***-**-{}"``."""
+    def mask(value):
+        digits = _NON_DIGITS.sub("", value)
+        if len(digits) >= 4:
+            return template.format(digits[-4:])
+        return fallback
+    return mask
+
+
+def _mask_email(value):
+    if '@' in value:
+        parts = value.split('@')
+        if len(parts) == 2:
+            username, domain = parts
+            if len(username) > 0:
+                return f"{username[0]}{'*' * min(3, len(username) - 1)}@{domain}"
+    return "***@***.***"
+
+
+def _mask_address(value):
+    # Show only the last component (state/zip) when the address has one
+    parts = value.split(',')
+    if len(parts) >= 2:
+        return f"***, {parts[-1].strip()}"
+    return "*** [Address Hidden]"
+
+
+def _mask_license(value):
+    if len(value) >= 4:
+        return f"***{value[-4:]}"
+    return "***"
+
+
+# Masking rules in priority order: (name, keywords, required keywords, mask).
+# A column matches when its lower-cased name contains any keyword and, if
+# required keywords are given, also any of those. The first match wins.
+MASK_RULES = [
+    ("ssn", ("ssn", "social_security"), (), _last4("***-**-{}", "***-**-****")),
+    ("phone", ("phone",), (), _last4("(***) ***-{}", "(***) ***-****")),
+    ("email", ("email",), (), _mask_email),
+    ("card_number", ("card",), ("number", "num"), _last4("****-****-****-{}", "****-****-****-****")),
+    ("account_number", ("account",), ("number",), _last4("****{}", "****")),
+    ("routing", ("routing",), (), lambda value: "****"),
+    ("mrn", ("mrn", "medical_record"), (), _last4("MRN-****{}", "MRN-****")),
+    ("insurance_policy", ("insurance",), ("policy", "number"), _last4("POL-****{}", "POL-****")),
+    ("address", ("address",), (), _mask_address),
+    ("password", ("password", "pwd"), (), lambda value: "********"),
+    ("state_id", ("state_id", "drivers_license", "license"), (), _mask_license),
+]
+
+
+def register_mask_rule(name, keywords, mask, requires=(), before=None):
+    """Add (or replace) a masking rule; ``mask`` receives the stripped string value.
+
+    The rule is appended unless ``before`` names an existing rule. Its keywords
+    also mark matching columns as sensitive.
+    """
+    rule = (name, tuple(keywords), tuple(requires), mask)
+    MASK_RULES[:] = [existing for existing in MASK_RULES if existing[0] != name]
+    position = next((i for i, existing in enumerate(MASK_RULES) if existing[0] == before), len(MASK_RULES))
+    MASK_RULES.insert(position, rule)
+    SENSITIVE_KEYWORDS.extend(keyword for keyword in rule[1] if keyword not in SENSITIVE_KEYWORDS)
+    column_mask.cache_clear()
+    is_sensitive_column.cache_clear()
+
+
+@lru_cache(maxsize=1024)
+def column_mask(column_name):
+    """Resolve a column name to its mask function (None for non-sensitive columns), once per name."""
+    column_lower = (column_name or "").lower()
+    for _, keywords, requires, mask in MASK_RULES:
+        if any(keyword in column_lower for keyword in keywords) and \
+                (not requires or any(keyword in column_lower for keyword in requires)):
+            return mask
+    return None
+
+
+@lru_cache(maxsize=1024)
+def is_sensitive_column(column_name):
+    """Check if a column name indicates sensitive data"""
+    if not column_name:
+        return False
+    column_lower = column_name.lower()
+    return any(keyword in column_lower for keyword in SENSITIVE_KEYWORDS)
+
+
+def _apply(mask, value):
+    if value is None:
+        return None
+    value_str = str(value).strip()
+    if not value_str or value_str in ('NULL', 'None'):
+        return value_str
+    return mask(value_str) if mask else value_str
+
+
+def mask_sensitive_data(value, column_name):
+    """Mask sensitive data based on column name and value type"""
+    return _apply(column_mask(column_name), value)
+
+
+def mask_rows(rows, columns):
+    """Mask a whole result set column by column; returns new dicts of display strings.
+
+    Each column's mask is resolved once, so a page costs one lookup per column
+    rather than a keyword scan per cell. NULLs and booleans are passed through.
+    """
+    masked = [{} for _ in rows]
+    for column in columns:
+        mask = column_mask(column)
+        for out, row in zip(masked, rows):
+            value = row.get(column)
+            out[column] = value if isinstance(value, bool) else _apply(mask, value)
+    return masked
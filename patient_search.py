@@ -0,0 +1,146 @@
+import re
+
+from hospital_db_setup import blind_index
+from schema_cache import schema_cache
+
+PAGE_SIZE = 50
+PHONE_SEARCH_REGEX = re.compile(r"^[\d\s().+-]+$")
+
+# Result tiers, best first. Results are ordered by (rank, patient_id DESC).
+RANK_EXACT = 0          # patient ID, blind-index hit, or exact full name
+RANK_FULL_PREFIX = 1    # "jo" / "john sm" -> "john smith" (also covers first-name prefixes)
+RANK_LAST_PREFIX = 2    # "smi" -> "... smith"
+RANK_INFIX = 3          # "ohn" -> "john ..." (ngram FULLTEXT)
+
+PATIENT_LIST_COLUMNS = "p.patient_id, p.first_name, p.last_name, p.email, p.phone_number, p.dob"
+
+
+def normalize_name(value: str) -> str:
+    """Match the *_name_norm generated columns: lower-cased, whitespace collapsed."""
+    return " ".join((value or "").split()).lower()
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_branches(search_query: str, table: str = "Patient", include_sensitive: bool = True,
+                    fulltext: bool = True):
+    """Return (rank, table, condition, params) lookups for a search box query.
+
+    Every condition is served by an index: blind-index equality for encrypted
+    fields, B-tree range scans for name prefixes and the ngram FULLTEXT index
+    for infix name matches (skipped when ``fulltext`` is False, i.e. the index
+    does not exist). Conditions of lower tiers exclude higher tiers so each
+    patient is counted once per page.
+    """
+    branches = []
+    if "@" in search_query:
+        branches.append((RANK_EXACT, table, "email_bidx = %s", [blind_index(search_query, "email")]))
+        return branches
+
+    if search_query.isdigit():
+        branches.append((RANK_EXACT, table, "patient_id = %s", [int(search_query)]))
+    if PHONE_SEARCH_REGEX.match(search_query) and len(re.sub(r"\D", "", search_query)) >= 7:
+        branches.append((RANK_EXACT, table, "phone_bidx = %s", [blind_index(search_query, "phone")]))
+    if include_sensitive:
+        for field, column in (("mrn", "mrn_bidx"), ("insurance", "insurance_bidx")):
+            digest = blind_index(search_query, field)
+            if digest:
+                branches.append((RANK_EXACT, "Patient_Sensitive", f"{column} = %s", [digest]))
+    if search_query.isdigit():
+        return branches
+
+    name = normalize_name(search_query)
+    prefix = _escape_like(name) + "%"
+    branches.extend([
+        (RANK_EXACT, table, "full_name_norm = %s", [name]),
+        (RANK_FULL_PREFIX, table, "full_name_norm LIKE %s AND full_name_norm <> %s", [prefix, name]),
+        (RANK_LAST_PREFIX, table, "last_name_norm LIKE %s AND full_name_norm NOT LIKE %s", [prefix, prefix]),
+    ])
+    if fulltext and len(name) >= 2:
+        phrase = '"' + name.replace('"', " ") + '"'
+        branches.append((
+            RANK_INFIX, table,
+            "MATCH(full_name_norm) AGAINST (%s IN BOOLEAN MODE) "
+            "AND full_name_norm NOT LIKE %s AND last_name_norm NOT LIKE %s",
+            [phrase, prefix, prefix],
+        ))
+    return branches
+
+
+def parse_cursor(raw):
+    """Decode a "rank.patient_id" keyset cursor; invalid cursors restart at page one."""
+    try:
+        rank, patient_id = (int(part) for part in (raw or "").split(".", 1))
+        return rank, patient_id
+    except ValueError:
+        return None
+
+
+def build_search_query(search_query: str, after=None, limit: int = PAGE_SIZE, table: str = "Patient",
+                       include_sensitive: bool = True, fulltext: bool = True):
+    """Build the ranked, keyset-paginated search SQL; returns (sql, params)."""
+    parts = []
+    params = []
+    for rank, branch_table, condition, branch_params in search_branches(search_query, table, include_sensitive,
+                                                                         fulltext):
+        seek = ""
+        seek_params = []
+        if after:
+            after_rank, after_id = after
+            if rank < after_rank:
+                continue
+            if rank == after_rank:
+                seek = " AND patient_id < %s"
+                seek_params = [after_id]
+        # Each branch is bounded by the page size, so a broad prefix never
+        # materializes more than limit + 1 rows per tier.
+        parts.append(
+            f"(SELECT patient_id, {rank} AS search_rank FROM {branch_table} "
+            f"WHERE {condition}{seek} ORDER BY patient_id DESC LIMIT {int(limit) + 1})"
+        )
+        params.extend(branch_params + seek_params)
+    if not parts:
+        return None, []
+    sql = f"""
+        SELECT {PATIENT_LIST_COLUMNS}, m.search_rank
+        FROM (SELECT patient_id, MIN(search_rank) AS search_rank
+              FROM ({" UNION ALL ".join(parts)}) u
+              GROUP BY patient_id) m
+        JOIN {table} p ON p.patient_id = m.patient_id
+        ORDER BY m.search_rank, p.patient_id DESC
+        LIMIT {int(limit) + 1}
+    """
+    return sql, params
+
+
+def search_patients(cur, search_query: str, after=None, limit: int = PAGE_SIZE):
+    """Run a patient search (or list newest patients when the query is empty).
+
+    ``cur`` must be a dictionary cursor. Returns ``(rows, next_cursor)`` where
+    next_cursor is None on the last page.
+    """
+    if search_query:
+        # Infix search needs the ngram FULLTEXT index, which some servers cannot create
+        fulltext = schema_cache.has_fulltext_index("Patient", "full_name_norm")
+        sql, params = build_search_query(search_query, after, limit, fulltext=fulltext)
+        if sql is None:
+            return [], None
+        cur.execute(sql, params)
+    else:
+        seek = "WHERE p.patient_id < %s" if after else ""
+        cur.execute(f"""
+            SELECT {PATIENT_LIST_COLUMNS}, {RANK_EXACT} AS search_rank
+            FROM Patient p
+            {seek}
+            ORDER BY p.patient_id DESC
+            LIMIT {int(limit) + 1}
+        """, (after[1],) if after else ())
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f"{last['search_rank']}.{last['patient_id']}"
+    return rows, next_cursor
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+
+from hospital_db_setup import decrypt_many
+from masking import mask_rows
+
+# Streaming row pipeline: fetch -> selective decrypt -> mask -> render. Each stage
+# is a generator over batches of dict rows, so a page of any size is processed
+# STREAM_BATCH_SIZE rows at a time and only masked display values reach templates.
+STREAM_BATCH_SIZE = 200
+EXPORT_BATCH_SIZE = 1000
+
+
+class PageState:
+    """Keyset pagination facts filled in while a page streams through the pipeline."""
+
+    def __init__(self):
+        self.first_key = None
+        self.last_key = None
+        self.count = 0
+        self.has_more = False
+        self.has_prev = False
+        self.has_next = False
+
+    @property
+    def empty(self):
+        return self.count == 0
+
+
+def fetch_batches(cur, batch_size=STREAM_BATCH_SIZE):
+    """Yield lists of rows from an executed cursor with fetchmany()."""
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def take_page(batches, limit, key_column, page):
+    """Pass through at most ``limit`` rows, recording keys; one extra row sets ``page.has_more``."""
+    for batch in batches:
+        remaining = limit - page.count
+        if len(batch) > remaining:
+            page.has_more = True
+            batch = batch[:remaining]
+        if batch:
+            if page.first_key is None:
+                page.first_key = batch[0][key_column]
+            page.last_key = batch[-1][key_column]
+            page.count += len(batch)
+            yield batch
+        if page.has_more:
+            return
+
+
+def decrypt_batches(batches, columns):
+    """Decrypt only the registry-listed ``columns``; NULLs stay NULL."""
+    for batch in batches:
+        if columns:
+            decrypt_many(batch, columns, keep_null=True)
+        yield batch
+
+
+def summarize_binary(batches):
+    """Replace remaining binary values (e.g. blind indexes) with their size."""
+    for batch in batches:
+        for row in batch:
+            for key, value in row.items():
+                if isinstance(value, (bytes, bytearray)):
+                    row[key] = f"[BLOB: {len(value)} bytes]"
+        yield batch
+
+
+def mask_batches(batches, columns):
+    """Mask each batch column-wise; yields batches of display-only dicts."""
+    for batch in batches:
+        yield mask_rows(batch, columns)
+
+
+def mask_selected(batches, columns):
+    """Mask only ``columns`` of each row in place; other values pass through unchanged."""
+    for batch in batches:
+        if columns:
+            for row, masked in zip(batch, mask_rows(batch, columns)):
+                row.update(masked)
+        yield batch
+
+
+def iter_rows(batches):
+    for batch in batches:
+        yield from batch
+
+
+def csv_chunks(batches, columns):
+    """Serialize batches of dict rows as CSV text, one chunk per batch (header first)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([["" if row[col] is None else row[col] for col in columns] for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(batches, columns):
+    """Serialize batches of dict rows as newline-delimited JSON, one chunk per batch."""
+    for batch in batches:
+        yield "".join(json.dumps({col: row[col] for col in columns}, default=str) + "\n" for row in batch)
+
+
+def json_object_chunks(fields, list_name, batches):
+    """Serialize ``fields`` plus a ``list_name`` array of the batched rows as one JSON object.
+
+    Yields the opening fields first and then one chunk per batch, so the array
+    is never materialized as a whole.
+    """
+    head = json.dumps({**fields, list_name: []}, default=str)
+    yield head[:-2]  # up to and including the array's "["
+    separator = ""
+    for batch in batches:
+        if batch:
+            yield separator + ", ".join(json.dumps(row, default=str) for row in batch)
+            separator = ", "
+    yield "]}"
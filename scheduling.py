@@ -0,0 +1,385 @@
+import bisect
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from config import get_db_conn
+
+DEFAULT_APPOINTMENT_MINUTES = 30
+# Longest bookable appointment; bounds the overlap lookup's index range scan.
+MAX_APPOINTMENT_MINUTES = 240
+# Appointments in these statuses do not occupy the doctor's time.
+NON_BLOCKING_STATUSES = ("Cancelled",)
+# The free-slot cache covers this many days ahead and is rebuilt at most this often
+# (bookings made in this process update it immediately).
+AVAILABILITY_HORIZON_DAYS = int(os.environ.get("AVAILABILITY_HORIZON_DAYS", "14"))
+AVAILABILITY_REFRESH_SECONDS = float(os.environ.get("AVAILABILITY_REFRESH_SECONDS", "30"))
+MAX_SLOTS_PER_QUERY = 100
+CALENDAR_VIEWS = ("day", "week", "month")
+# Doctor-day calendar entries are reused for this long (bookings made in this
+# process invalidate them immediately); at most CALENDAR_CACHE_DAYS are kept.
+CALENDAR_CACHE_SECONDS = float(os.environ.get("CALENDAR_CACHE_SECONDS", "30"))
+CALENDAR_CACHE_DAYS = int(os.environ.get("CALENDAR_CACHE_DAYS", "5000"))
+
+
+class SchedulingError(ValueError):
+    """A booking that cannot be made; the message is safe to show to the user."""
+
+
+def _as_datetime(day: date, value) -> datetime:
+    # MySQL TIME columns come back as timedelta
+    if isinstance(value, timedelta):
+        return datetime.combine(day, datetime.min.time()) + value
+    return datetime.combine(day, value)
+
+
+def _template_windows(templates, day: date):
+    """(start, end, slot_minutes) working windows on ``day`` from a doctor's availability templates."""
+    for weekday, start_time, end_time, slot_minutes, valid_from, valid_until in templates:
+        if weekday != day.weekday():
+            continue
+        if (valid_from is not None and day < valid_from) or (valid_until is not None and day > valid_until):
+            continue
+        yield _as_datetime(day, start_time), _as_datetime(day, end_time), slot_minutes
+
+
+def _within_availability(templates, start: datetime, end: datetime) -> bool:
+    return any(window_start <= start and end <= window_end
+               for window_start, window_end, _ in _template_windows(templates, start.date()))
+
+
+def _free_slots(windows, booked):
+    """Slot (start, end) pairs from ``windows`` that overlap none of the ``booked`` intervals."""
+    booked = sorted(booked)
+    booked_starts = [b_start for b_start, _ in booked]
+    longest = timedelta(minutes=MAX_APPOINTMENT_MINUTES)
+    slots = []
+    for window_start, window_end, slot_minutes in windows:
+        step = timedelta(minutes=slot_minutes)
+        start = window_start
+        while start + step <= window_end:
+            end = start + step
+            # Only bookings starting in (start - longest, end) can overlap the slot
+            low = bisect.bisect_right(booked_starts, start - longest)
+            high = bisect.bisect_left(booked_starts, end)
+            if not any(booked[i][1] > start for i in range(low, high)):
+                slots.append((start, end))
+            start = end
+    slots.sort()
+    return slots
+
+
+class AvailabilityCache:
+    """Per-doctor sorted free slots for the next AVAILABILITY_HORIZON_DAYS days.
+
+    Built from Doctor_Availability templates minus booked appointments with two
+    queries, then answers slot searches by bisecting the sorted slot lists. It
+    is advisory: book_appointment re-checks conflicts under a row lock, and the
+    lists are rebuilt every AVAILABILITY_REFRESH_SECONDS to pick up bookings
+    made by other processes.
+    """
+
+    def __init__(self, horizon_days: int = AVAILABILITY_HORIZON_DAYS,
+                 refresh_interval: float = AVAILABILITY_REFRESH_SECONDS):
+        self.horizon_days = horizon_days
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._slots = None  # doctor_id -> ([starts], [ends])
+        self._window = None  # (first day, first day past the horizon)
+        self._loaded_at = 0.0
+
+    def _load(self, cur, today: date):
+        first, last = today, today + timedelta(days=self.horizon_days)
+        cur.execute("""
+            SELECT doctor_id, weekday, start_time, end_time, slot_minutes, valid_from, valid_until
+            FROM Doctor_Availability
+            ORDER BY doctor_id, weekday, start_time
+        """)
+        templates = {}
+        for doctor_id, *template in cur.fetchall():
+            templates.setdefault(doctor_id, []).append(tuple(template))
+        booked = {doctor_id: [] for doctor_id in templates}
+        if templates:
+            # Served by idx_appointment_doctor_date: one range per doctor
+            cur.execute(f"""
+                SELECT doctor_id, appointment_date, appointment_end FROM Appointment
+                WHERE doctor_id IN ({", ".join(["%s"] * len(templates))})
+                  AND appointment_date >= %s AND appointment_date < %s
+                  AND status NOT IN ({", ".join(["%s"] * len(NON_BLOCKING_STATUSES))})
+            """, (*templates, datetime.combine(first, datetime.min.time())
+                  - timedelta(minutes=MAX_APPOINTMENT_MINUTES),
+                  datetime.combine(last, datetime.min.time()), *NON_BLOCKING_STATUSES))
+            for doctor_id, start, end in cur.fetchall():
+                booked[doctor_id].append((start, end))
+        slots = {}
+        for doctor_id, doctor_templates in templates.items():
+            windows = [window for offset in range(self.horizon_days)
+                       for window in _template_windows(doctor_templates, first + timedelta(days=offset))]
+            free = _free_slots(windows, booked[doctor_id])
+            slots[doctor_id] = ([start for start, _ in free], [end for _, end in free])
+        return slots, (first, last)
+
+    def refresh(self, force: bool = False) -> None:
+        """Rebuild if forced, never built, stale, or the horizon has rolled over to a new day."""
+        now = time.time()
+        today = date.today()
+        if not force and self._fresh(now, today):
+            return
+        with self._lock:
+            if not force and self._fresh(now, today):
+                return
+            conn = cur = None
+            try:
+                conn = get_db_conn()
+                cur = conn.cursor()
+                self._slots, self._window = self._load(cur, today)
+                self._loaded_at = now
+            finally:
+                if cur:
+                    cur.close()
+                if conn:
+                    conn.close()
+
+    def _fresh(self, now: float, today: date) -> bool:
+        return (self._slots is not None and now - self._loaded_at < self.refresh_interval
+                and self._window[0] == today)
+
+    def mark_booked(self, doctor_id: int, start: datetime, end: datetime) -> None:
+        """Remove the doctor's cached slots that overlap a new booking."""
+        with self._lock:
+            if self._slots is None or doctor_id not in self._slots:
+                return
+            starts, ends = self._slots[doctor_id]
+            low = bisect.bisect_left(starts, start - timedelta(minutes=MAX_APPOINTMENT_MINUTES))
+            high = bisect.bisect_left(starts, end)
+            keep = [i for i in range(low, high) if ends[i] <= start]
+            starts[low:high] = [starts[i] for i in keep]
+            ends[low:high] = [ends[i] for i in keep]
+
+    def next_free_slots(self, doctor_id=None, after: datetime = None, limit: int = 10):
+        """The first ``limit`` free slots starting at or after ``after`` (default now).
+
+        With ``doctor_id`` None, slots of all doctors are merged in start order.
+        Returns ``[(doctor_id, start, end), ...]``.
+        """
+        self.refresh()
+        after = max(after or datetime.now(), datetime.now())
+        limit = max(1, min(int(limit), MAX_SLOTS_PER_QUERY))
+        with self._lock:
+            if doctor_id is not None:
+                doctors = [doctor_id] if doctor_id in self._slots else []
+            else:
+                doctors = list(self._slots)
+            streams = []
+            for doctor in doctors:
+                starts, ends = self._slots[doctor]
+                index = bisect.bisect_left(starts, after)
+                streams.append([(starts[i], doctor, ends[i]) for i in range(index, min(index + limit, len(starts)))])
+            return [(doctor, start, end) for start, doctor, end in heapq.merge(*streams)][:limit]
+
+
+availability = AvailabilityCache()
+
+
+def calendar_range(view: str, day: date):
+    """First day and the day after the last day of the ``view`` around ``day``; weeks start on Monday."""
+    if view == "day":
+        first, days = day, 1
+    elif view == "week":
+        first, days = day - timedelta(days=day.weekday()), 7
+    elif view == "month":
+        first = day.replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        days = (following - first).days
+    else:
+        raise SchedulingError(f"Calendar view must be one of: {', '.join(CALENDAR_VIEWS)}.")
+    return first, first + timedelta(days=days)
+
+
+def _calendar_entry(row) -> dict:
+    appointment_id, patient_id, doctor_id, start, end, duration_minutes, status, first_name, last_name = row
+    return {
+        "appointment_id": appointment_id,
+        "patient_id": patient_id,
+        "doctor_id": doctor_id,
+        "start": start.isoformat(timespec="minutes"),
+        "end": end.isoformat(timespec="minutes"),
+        "duration_minutes": duration_minutes,
+        "status": status,
+        "name": " ".join(part for part in (first_name, last_name) if part),
+    }
+
+
+class CalendarCache:
+    """Calendar entries per (doctor_id, day), least recently used evicted first.
+
+    Entries expire after ``ttl`` seconds so bookings made by other processes
+    show up; book_appointment invalidates the doctor-day it books in this
+    process. A load that overlaps an invalidation is not stored.
+    """
+
+    def __init__(self, ttl: float = CALENDAR_CACHE_SECONDS, max_days: int = CALENDAR_CACHE_DAYS):
+        self.ttl = ttl
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self._days = OrderedDict()  # (doctor_id, day) -> (loaded_at, entries)
+        self._generation = 0
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, doctor_id: int, day: date):
+        with self._lock:
+            cached = self._days.get((doctor_id, day))
+            if cached is None:
+                return None
+            if time.time() - cached[0] >= self.ttl:
+                del self._days[(doctor_id, day)]
+                return None
+            self._days.move_to_end((doctor_id, day))
+            return cached[1]
+
+    def put(self, doctor_id: int, day: date, entries, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._days[(doctor_id, day)] = (time.time(), entries)
+            self._days.move_to_end((doctor_id, day))
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    def invalidate(self, doctor_id=None, day: date = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if doctor_id is None:
+                self._days.clear()
+            else:
+                self._days.pop((doctor_id, day), None)
+
+
+calendar_cache = CalendarCache()
+
+
+def doctor_calendar(db_connection, doctor_id: int, first: date, last: date):
+    """Calendar entries of ``doctor_id`` for the days ``first`` up to ``last`` (exclusive), in start order.
+
+    Cached doctor-days are served from calendar_cache; the missing ones are
+    loaded with a single range read on idx_appointment_doctor_date.
+    """
+    days = [first + timedelta(days=offset) for offset in range((last - first).days)]
+    by_day = {day: calendar_cache.get(doctor_id, day) for day in days}
+    missing = [day for day, entries in by_day.items() if entries is None]
+    if missing:
+        generation = calendar_cache.generation()
+        loaded = {day: [] for day in missing}
+        cur = db_connection.cursor()
+        try:
+            cur.execute("""
+                SELECT a.appointment_id, a.patient_id, a.doctor_id, a.appointment_date, a.appointment_end,
+                       a.duration_minutes, a.status, p.first_name, p.last_name
+                FROM Appointment a
+                LEFT JOIN Patient p ON p.patient_id = a.patient_id
+                WHERE a.doctor_id = %s AND a.appointment_date >= %s AND a.appointment_date < %s
+                ORDER BY a.appointment_date, a.appointment_id
+            """, (doctor_id, datetime.combine(missing[0], datetime.min.time()),
+                  datetime.combine(missing[-1] + timedelta(days=1), datetime.min.time())))
+            for row in cur.fetchall():
+                entries = loaded.get(row[3].date())
+                if entries is not None:
+                    entries.append(_calendar_entry(row))
+        finally:
+            cur.close()
+        for day, entries in loaded.items():
+            entries = tuple(entries)
+            calendar_cache.put(doctor_id, day, entries, generation)
+            by_day[day] = entries
+    return [entry for day in days for entry in by_day[day]]
+
+
+def patient_calendar(cur, patient_id: int, first: date, last: date):
+    """Execute the range read for ``patient_id``'s appointments from ``first`` up to ``last`` (exclusive).
+
+    Served by idx_appointment_patient_date; stream the result from ``cur`` with
+    row_pipeline.fetch_batches and turn rows into entries with calendar_entries.
+    """
+    cur.execute("""
+        SELECT a.appointment_id, a.patient_id, a.doctor_id, a.appointment_date, a.appointment_end,
+               a.duration_minutes, a.status, s.first_name, s.last_name
+        FROM Appointment a
+        LEFT JOIN Staff s ON s.staff_id = a.doctor_id
+        WHERE a.patient_id = %s AND a.appointment_date >= %s AND a.appointment_date < %s
+        ORDER BY a.appointment_date, a.appointment_id
+    """, (patient_id, datetime.combine(first, datetime.min.time()), datetime.combine(last, datetime.min.time())))
+
+
+def calendar_entries(batches):
+    """Map batches of patient_calendar rows to batches of calendar entries."""
+    for batch in batches:
+        yield [_calendar_entry(row) for row in batch]
+
+
+def book_appointment(db_connection, patient_id: int, doctor_id, start: datetime,
+                     duration_minutes: int = DEFAULT_APPOINTMENT_MINUTES, status: str = "Scheduled",
+                     enforce_availability: bool = True) -> int:
+    """Insert an appointment unless it overlaps another booking of the same doctor.
+
+    The doctor's Staff row is locked with SELECT ... FOR UPDATE, serializing
+    bookings per doctor so two concurrent requests cannot both pass the overlap
+    check; the check itself is an index range scan on (doctor_id,
+    appointment_date). With ``enforce_availability`` the booking must also fall
+    inside one of the doctor's Doctor_Availability windows (doctors without
+    templates are unrestricted). Runs in its own transaction like
+    billing.post_payment: anything open on ``db_connection`` is rolled back
+    first. Commits and returns the new appointment_id; raises SchedulingError.
+    """
+    if not 5 <= duration_minutes <= MAX_APPOINTMENT_MINUTES:
+        raise SchedulingError(f"Appointment length must be between 5 and {MAX_APPOINTMENT_MINUTES} minutes.")
+    end = start + timedelta(minutes=duration_minutes)
+    db_connection.rollback()
+    cur = db_connection.cursor()
+    try:
+        if doctor_id is not None:
+            cur.execute("SELECT staff_id FROM Staff WHERE staff_id = %s FOR UPDATE", (doctor_id,))
+            if cur.fetchone() is None:
+                raise SchedulingError("Doctor ID not found.")
+        if doctor_id is not None and status not in NON_BLOCKING_STATUSES:
+            if enforce_availability:
+                cur.execute("""
+                    SELECT weekday, start_time, end_time, slot_minutes, valid_from, valid_until
+                    FROM Doctor_Availability WHERE doctor_id = %s
+                """, (doctor_id,))
+                templates = cur.fetchall()
+                if templates and not _within_availability(templates, start, end):
+                    raise SchedulingError("The doctor is not available at that time.")
+            cur.execute(f"""
+                SELECT appointment_id, appointment_date FROM Appointment
+                WHERE doctor_id = %s
+                  AND appointment_date > %s AND appointment_date < %s
+                  AND appointment_end > %s
+                  AND status NOT IN ({", ".join(["%s"] * len(NON_BLOCKING_STATUSES))})
+                LIMIT 1
+            """, (doctor_id, start - timedelta(minutes=MAX_APPOINTMENT_MINUTES), end, start,
+                  *NON_BLOCKING_STATUSES))
+            conflict = cur.fetchone()
+            if conflict is not None:
+                raise SchedulingError(f"The doctor already has an appointment at {conflict[1]:%Y-%m-%d %H:%M}.")
+        cur.execute(
+            """INSERT INTO Appointment (patient_id, doctor_id, appointment_date, duration_minutes, status)
+               VALUES (%s, %s, %s, %s, %s)""",
+            (patient_id, doctor_id, start, duration_minutes, status)
+        )
+        appointment_id = cur.lastrowid
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        cur.close()
+    if doctor_id is not None:
+        calendar_cache.invalidate(doctor_id, start.date())
+        if status not in NON_BLOCKING_STATUSES:
+            availability.mark_booked(doctor_id, start, end)
+    return appointment_id
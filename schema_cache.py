@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+from config import get_db_conn
+
+# How often (seconds) to compare the cached schema against Schema_Meta. The check
+# is a single-row primary-key read, far cheaper than information_schema queries.
+SCHEMA_CHECK_INTERVAL = float(os.environ.get("SCHEMA_CHECK_INTERVAL", "30"))
+
+
+class SchemaCache:
+    """In-process copy of table/column metadata for the application database.
+
+    Loaded with one information_schema.COLUMNS query (plus one STATISTICS
+    query for FULLTEXT indexes) and reused until the (schema_version,
+    migrated_at) stamp written by hospital_db_setup.create_database_and_tables
+    changes.
+    """
+
+    def __init__(self, check_interval: float = SCHEMA_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._columns = None  # table -> tuple of column dicts
+        self._fulltext = frozenset()  # (table, column) pairs covered by a FULLTEXT index
+        self._stamp = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _read_stamp(cur):
+        try:
+            cur.execute("SELECT schema_version, migrated_at FROM Schema_Meta WHERE meta_id = 1")
+            row = cur.fetchone()
+        except Exception:
+            # Databases created before Schema_Meta existed: fall back to periodic reloads.
+            return None
+        return tuple(row.values()) if isinstance(row, dict) else tuple(row or ())
+
+    def _load(self, cur):
+        cur.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """)
+        columns = {}
+        for table_name, column_name, data_type, is_nullable in cur.fetchall():
+            columns.setdefault(table_name, []).append(
+                {"COLUMN_NAME": column_name, "DATA_TYPE": data_type, "IS_NULLABLE": is_nullable}
+            )
+        return {table: tuple(cols) for table, cols in columns.items()}
+
+    @staticmethod
+    def _load_fulltext(cur):
+        # Optional indexes (e.g. ngram FULLTEXT) that hospital_db_setup may have been unable to create
+        cur.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND INDEX_TYPE = 'FULLTEXT'
+        """)
+        return frozenset(tuple(row) for row in cur.fetchall())
+
+    def refresh(self, force: bool = False) -> None:
+        """Reload metadata if forced, never loaded, or the schema stamp changed."""
+        now = time.time()
+        if not force and self._columns is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if not force and self._columns is not None and now - self._checked_at < self.check_interval:
+                return
+            conn = cur = None
+            try:
+                conn = get_db_conn()
+                cur = conn.cursor()
+                stamp = self._read_stamp(cur)
+                if force or self._columns is None or stamp is None or stamp != self._stamp:
+                    self._columns = self._load(cur)
+                    self._fulltext = self._load_fulltext(cur)
+                    self._stamp = stamp
+                self._checked_at = now
+            finally:
+                if cur:
+                    cur.close()
+                if conn:
+                    conn.close()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._columns = None
+            self._stamp = None
+
+    def tables(self):
+        self.refresh()
+        return sorted(self._columns)
+
+    def columns(self, table: str):
+        """Column dicts (COLUMN_NAME, DATA_TYPE, IS_NULLABLE) in ordinal order; () if unknown."""
+        self.refresh()
+        return self._columns.get(table, ())
+
+    def column_names(self, table: str):
+        return tuple(col["COLUMN_NAME"] for col in self.columns(table))
+
+    def column_types(self, table: str):
+        return {col["COLUMN_NAME"]: col["DATA_TYPE"] for col in self.columns(table)}
+
+    def has_fulltext_index(self, table: str, column: str) -> bool:
+        self.refresh()
+        return (table, column) in self._fulltext
+
+
+schema_cache = SchemaCache()
@@ -0,0 +1,353 @@
+import hashlib
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+# Where session data lives: "memory" (one process only), "sqlite" (workers on one
+# host) or "mysql" (any number of hosts, App_Session table).
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory").lower()
+SESSION_BACKENDS = ("memory", "sqlite", "mysql")
+SESSION_MAX_ENTRIES = int(os.environ.get("SESSION_MAX_ENTRIES", "100000"))
+# Anonymous sessions (e.g. only a CSRF token from GET /login) get their own, smaller
+# LRU in the memory store, so a flood of them cannot evict logged-in users.
+SESSION_MAX_ANONYMOUS = int(os.environ.get("SESSION_MAX_ANONYMOUS", "20000"))
+_sqlite_env = os.environ.get("SESSION_SQLITE_FILE", ".sessions.sqlite3")
+SESSION_SQLITE_FILE = os.path.join(os.getcwd(), os.path.basename(_sqlite_env))
+# An unchanged session is rewritten (to push its expiry forward) at most this often,
+# so ordinary page views are a single primary-key read.
+SESSION_TOUCH_INTERVAL = float(os.environ.get("SESSION_TOUCH_INTERVAL", "60"))
+# Expired sessions are deleted by the request that first notices this much time has passed.
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", "300"))
+SWEEP_BATCH_SIZE = 5000
+
+
+def _new_sid() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def _store_key(sid: str) -> str:
+    # Stores only see a digest, so a leaked session table cannot be replayed as cookies.
+    return hashlib.sha256(sid.encode("ascii")).hexdigest()
+
+
+class MemoryStore:
+    """Sessions in LRU-bounded dicts of this process; lost on restart, not shared by workers.
+
+    Logged-in and anonymous sessions are bounded separately.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, max_anonymous: int = SESSION_MAX_ANONYMOUS):
+        self.max_entries = max_entries
+        self.max_anonymous = max_anonymous
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # key -> (user_id, data, expires_at)
+        self._anonymous = OrderedDict()  # key -> (None, data, expires_at)
+        self._by_user = {}  # user_id -> set of keys
+
+    def _remove(self, key):
+        entry = self._sessions.pop(key, None) or self._anonymous.pop(key, None)
+        if entry is not None and entry[0] is not None:
+            keys = self._by_user.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[0]]
+
+    def get(self, key: str, now: float):
+        with self._lock:
+            sessions = self._sessions if key in self._sessions else self._anonymous
+            entry = sessions.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                self._remove(key)
+                return None
+            sessions.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key: str, user_id, data: str, expires_at: float) -> None:
+        with self._lock:
+            self._remove(key)
+            if user_id is None:
+                sessions, limit = self._anonymous, self.max_anonymous
+            else:
+                sessions, limit = self._sessions, self.max_entries
+                self._by_user.setdefault(user_id, set()).add(key)
+            sessions[key] = (user_id, data, expires_at)
+            while len(sessions) > limit:
+                self._remove(next(iter(sessions)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def delete_user(self, user_id) -> int:
+        with self._lock:
+            keys = list(self._by_user.get(user_id, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def sweep(self, now: float) -> int:
+        with self._lock:
+            expired = [key for sessions in (self._sessions, self._anonymous)
+                       for key, (_, _, expires_at) in sessions.items() if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            return len(expired)
+
+
+class SQLiteStore:
+    """Sessions in a local SQLite file (WAL mode) shared by the workers of one host."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_SQLITE_FILE):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS app_session (
+                session_key TEXT PRIMARY KEY,
+                user_id INTEGER,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_app_session_user ON app_session(user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_app_session_expires ON app_session(expires_at)")
+
+    def _connection(self):
+        # One connection per thread, reopened in forked children
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str, now: float):
+        return self._connection().execute(
+            "SELECT data, expires_at FROM app_session WHERE session_key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+
+    def set(self, key: str, user_id, data: str, expires_at: float) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO app_session (session_key, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+            (key, user_id, data, expires_at),
+        )
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM app_session WHERE session_key = ?", (key,))
+
+    def delete_user(self, user_id) -> int:
+        return self._connection().execute("DELETE FROM app_session WHERE user_id = ?", (user_id,)).rowcount
+
+    def sweep(self, now: float) -> int:
+        return self._connection().execute("DELETE FROM app_session WHERE expires_at <= ?", (now,)).rowcount
+
+
+class MySQLStore:
+    """Sessions in the App_Session table (created by hospital_db_setup.py), shared by every host."""
+
+    name = "mysql"
+
+    def __init__(self, connect=None):
+        if connect is None:
+            from config import get_db_conn as connect
+        self._connect = connect
+
+    def _execute(self, sql: str, params=(), fetch: bool = False):
+        conn = cur = None
+        try:
+            conn = self._connect()
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            result = cur.fetchone() if fetch else cur.rowcount
+            conn.commit()
+            return result
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                conn.close()
+
+    def get(self, key: str, now: float):
+        row = self._execute("""
+            SELECT data, UNIX_TIMESTAMP(expires_at) FROM App_Session
+            WHERE session_key = %s AND expires_at > FROM_UNIXTIME(%s)
+        """, (key, now), fetch=True)
+        return (row[0], float(row[1])) if row else None
+
+    def set(self, key: str, user_id, data: str, expires_at: float) -> None:
+        self._execute("""
+            INSERT INTO App_Session (session_key, user_id, data, expires_at)
+            VALUES (%s, %s, %s, FROM_UNIXTIME(%s))
+            ON DUPLICATE KEY UPDATE user_id = VALUES(user_id), data = VALUES(data), expires_at = VALUES(expires_at)
+        """, (key, user_id, data, expires_at))
+
+    def delete(self, key: str) -> None:
+        self._execute("DELETE FROM App_Session WHERE session_key = %s", (key,))
+
+    def delete_user(self, user_id) -> int:
+        return self._execute("DELETE FROM App_Session WHERE user_id = %s", (user_id,))
+
+    def sweep(self, now: float) -> int:
+        # Batched so a large backlog never holds locks on the whole index range at once
+        total = 0
+        while True:
+            deleted = self._execute(f"DELETE FROM App_Session WHERE expires_at <= FROM_UNIXTIME(%s) "
+                                    f"LIMIT {SWEEP_BATCH_SIZE}", (now,))
+            total += deleted
+            if deleted < SWEEP_BATCH_SIZE:
+                return total
+
+
+class ServerSession(SecureCookieSession):
+    """Session dict identified by a random id; the cookie carries only the signed id."""
+
+    def __init__(self, initial=None, sid: str = None, stored=None):
+        super().__init__(initial)
+        self.new = sid is None
+        self.sid = sid or _new_sid()
+        self.stored = stored  # (serialized data, expires_at) as loaded from the store
+        self.previous_sid = None
+
+    def regenerate(self) -> None:
+        """Move the data to a fresh id; call on login so a pre-login id is never promoted."""
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = _new_sid()
+        self.stored = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in ``store`` behind an opaque cookie.
+
+    Sessions record the logged-in Users.user_id, so revoke_user() ends every
+    session of a user at once.
+    """
+
+    serializer = TaggedJSONSerializer()
+    salt = "server-session"
+
+    def __init__(self, store, touch_interval: float = SESSION_TOUCH_INTERVAL,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.store = store
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._swept_at = time.time()
+        self._counters = {"loaded": 0, "missed": 0, "written": 0, "deleted": 0, "revoked": 0, "swept": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation="hmac")
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return ServerSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode("ascii")
+        except (BadSignature, UnicodeDecodeError):
+            return ServerSession()
+        stored = self.store.get(_store_key(sid), time.time())
+        if stored is None:
+            self._count("missed")
+            return ServerSession()
+        try:
+            data = self.serializer.loads(stored[0])
+        except ValueError:
+            return ServerSession()
+        self._count("loaded")
+        return ServerSession(data, sid=sid, stored=tuple(stored))
+
+    def save_session(self, app, session, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        partitioned = self.get_cookie_partitioned(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+        if session.previous_sid is not None:
+            self.store.delete(_store_key(session.previous_sid))
+            self._count("deleted")
+
+        if not session.keys() - {"_permanent"}:
+            # Empty, or emptied (e.g. session.clear() on logout): nothing to keep, revoke it
+            # server-side. The permanent flag alone does not make anonymous visitors stored.
+            if not session.new:
+                if session.previous_sid is None:
+                    self.store.delete(_store_key(session.sid))
+                    self._count("deleted")
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly, partitioned=partitioned)
+            return
+
+        now = time.time()
+        expires = self.get_expiration_time(app, session)
+        expires_at = expires.timestamp() if expires else now + app.permanent_session_lifetime.total_seconds()
+        data = self.serializer.dumps(dict(session))
+        written = False
+        if (session.stored is None or data != session.stored[0]
+                or expires_at - session.stored[1] >= self.touch_interval):
+            self.store.set(_store_key(session.sid), session.get("user_id"), data, expires_at)
+            self._count("written")
+            written = True
+        if written or self.should_set_cookie(app, session):
+            response.set_cookie(name, self._signer(app).sign(session.sid).decode("ascii"), expires=expires,
+                                httponly=httponly, domain=domain, path=path, secure=secure,
+                                samesite=samesite, partitioned=partitioned)
+        self._maybe_sweep(now)
+
+    def _maybe_sweep(self, now: float) -> None:
+        if now - self._swept_at < self.sweep_interval:
+            return
+        with self._lock:
+            if now - self._swept_at < self.sweep_interval:
+                return
+            self._swept_at = now
+        self._count("swept", self.store.sweep(now))
+
+    def revoke_user(self, user_id) -> int:
+        """End every stored session of ``user_id`` (e.g. after a role change or password reset)."""
+        revoked = self.store.delete_user(user_id)
+        self._count("revoked", revoked)
+        return revoked
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, backend=self.store.name)
+
+
+def create_session_interface(backend: str = SESSION_BACKEND) -> ServerSessionInterface:
+    if backend == "memory":
+        store = MemoryStore()
+    elif backend == "sqlite":
+        store = SQLiteStore()
+    elif backend == "mysql":
+        store = MySQLStore()
+    else:
+        raise RuntimeError(f"SESSION_BACKEND must be one of: {', '.join(SESSION_BACKENDS)}")
+    return ServerSessionInterface(store)
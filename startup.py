@@ -0,0 +1,145 @@
+import os
+import time
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from crypto_utils import load_keys
+from hospital_db_setup import SCHEMA_VERSION, create_database_and_tables, main as setup_main
+
+DB_NAME = "secure_hospital_db"
+# Startup waits this long in total for MySQL to accept connections, retrying with
+# exponential backoff starting at DB_STARTUP_BACKOFF seconds.
+DB_STARTUP_TIMEOUT = float(os.environ.get("DB_STARTUP_TIMEOUT", "60"))
+DB_STARTUP_BACKOFF = float(os.environ.get("DB_STARTUP_BACKOFF", "0.5"))
+DB_STARTUP_MAX_BACKOFF = 8.0
+# "0": never migrate at startup; "1": create/upgrade the schema; "seed": also create
+# the initial users and sample data on an empty database (development containers).
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "0").lower()
+AUTO_MIGRATE_MODES = ("0", "1", "seed")
+MIGRATION_LOCK = f"{DB_NAME}.migrate"
+MIGRATION_LOCK_TIMEOUT = 300
+# Retrying cannot fix these
+_FATAL_CONNECT_ERRORS = (errorcode.ER_ACCESS_DENIED_ERROR, errorcode.ER_DBACCESS_DENIED_ERROR)
+
+
+class StartupError(RuntimeError):
+    """The app cannot start; the message tells the operator what to do."""
+
+
+def connect_with_retry(connect, timeout: float = DB_STARTUP_TIMEOUT, backoff: float = DB_STARTUP_BACKOFF,
+                       log=print):
+    """Call ``connect()`` until it succeeds or ``timeout`` seconds have passed (then re-raise)."""
+    deadline = time.monotonic() + timeout
+    delay = backoff
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return connect()
+        except mysql.connector.Error as exc:
+            remaining = deadline - time.monotonic()
+            if exc.errno in _FATAL_CONNECT_ERRORS or remaining <= 0:
+                raise
+            wait = min(delay, remaining)
+            log(f"MySQL not reachable (attempt {attempt}): {exc}; retrying in {wait:.1f}s")
+            time.sleep(wait)
+            delay = min(delay * 2, DB_STARTUP_MAX_BACKOFF)
+
+
+def read_schema_version(cur):
+    """Version stamped in Schema_Meta, or None when the database or the stamp does not exist."""
+    try:
+        cur.execute(f"SELECT schema_version FROM {DB_NAME}.Schema_Meta WHERE meta_id = 1")
+    except mysql.connector.Error as exc:
+        if exc.errno in (errorcode.ER_BAD_DB_ERROR, errorcode.ER_NO_SUCH_TABLE):
+            return None
+        raise
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def migrate(conn, seed: bool = False, log=print) -> None:
+    """Run the idempotent hospital_db_setup steps under a server-wide lock.
+
+    Containers starting together wait for the first one's migration and then
+    find the schema current, instead of running DDL concurrently.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        if cur.fetchone()[0] != 1:
+            raise StartupError("Timed out waiting for another process's schema migration.")
+        try:
+            version = read_schema_version(cur)
+            if version is not None and version >= SCHEMA_VERSION and not seed:
+                log(f"Schema already migrated to version {version} by another process.")
+                return
+            log(f"Migrating schema to version {SCHEMA_VERSION}...")
+            if seed:
+                setup_main()
+            else:
+                create_database_and_tables()
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cur.fetchone()
+    finally:
+        cur.close()
+
+
+def ensure_schema(connect, auto_migrate: str = AUTO_MIGRATE, confirm=None, log=print) -> int:
+    """Wait for MySQL, then make sure the schema is at least SCHEMA_VERSION; returns the version.
+
+    A missing or outdated schema is migrated when ``auto_migrate`` allows it or
+    ``confirm(state)`` (an operator prompt, interactive starts only) returns
+    True; otherwise StartupError is raised rather than waiting for input.
+    """
+    if auto_migrate not in AUTO_MIGRATE_MODES:
+        raise StartupError(f"AUTO_MIGRATE must be one of: {', '.join(AUTO_MIGRATE_MODES)}")
+    conn = connect_with_retry(connect, log=log)
+    try:
+        cur = conn.cursor()
+        version = read_schema_version(cur)
+        cur.close()
+        if version is not None and version >= SCHEMA_VERSION:
+            if version > SCHEMA_VERSION:
+                log(f"Warning: database schema version {version} is newer than this code ({SCHEMA_VERSION}).")
+            return version
+        state = "does not exist" if version is None else f"is at version {version}, this code needs {SCHEMA_VERSION}"
+        if auto_migrate != "0":
+            migrate(conn, seed=auto_migrate == "seed", log=log)
+        elif confirm is not None and confirm(state):
+            # Operator-approved setup of a new database also seeds users and sample data, as before
+            migrate(conn, seed=version is None, log=log)
+        else:
+            raise StartupError(f"Database '{DB_NAME}' {state}. Run 'python hospital_db_setup.py' "
+                               f"or start with AUTO_MIGRATE=1.")
+        return SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def readiness(get_conn):
+    """(ready, checks) for a readiness probe: the database answers, its schema is current, keys load."""
+    checks = {}
+    try:
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT schema_version FROM Schema_Meta WHERE meta_id = 1")
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+        version = row[0] if row else None
+        checks["database"] = "ok"
+        checks["schema"] = ("ok" if version is not None and version >= SCHEMA_VERSION
+                            else f"version {version}, need {SCHEMA_VERSION}")
+    except Exception as exc:
+        checks["database"] = f"unavailable ({exc.__class__.__name__})"
+    try:
+        load_keys()
+        checks["keys"] = "ok"
+    except Exception as exc:
+        checks["keys"] = f"unavailable ({exc.__class__.__name__})"
+    return "schema" in checks and all(value == "ok" for value in checks.values()), checks
@@ -0,0 +1,313 @@
+"""Seeded synthetic dataset generator for load and performance testing.
+
+Writes one JSONL file per table (explicit IDs, so files reference each other)
+and optionally loads them with hospital_db_setup.bulk_load:
+
+    python synthetic_data.py --patients 100000 --out data/ --load
+
+Login accounts are created for a sample of patients, staff and admins, all
+with the same password; they are listed in <out>/credentials.json for
+benchmarks/loadtest.py.
+"""
+import argparse
+import json
+import math
+import os
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from werkzeug.security import generate_password_hash
+
+from hospital_db_setup import bulk_load, connect_to_db
+
+# Dependency order for loading
+LOAD_ORDER = ("Staff", "Doctor_Availability", "Patient", "Patient_Sensitive", "Users", "Appointment",
+              "Medical_Record", "Billing", "Payment_Methods", "Payment_Transactions")
+PRIMARY_KEYS = {
+    "Staff": "staff_id", "Doctor_Availability": "availability_id", "Patient": "patient_id", "Patient_Sensitive": "sensitive_id", "Users": "user_id",
+    "Appointment": "appointment_id", "Medical_Record": "record_id", "Billing": "billing_id",
+    "Payment_Methods": "payment_method_id", "Payment_Transactions": "payment_id",
+}
+
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William",
+               "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah",
+               "Charles", "Karen", "Maria", "Jose", "Wei", "Fatima", "Mohammed", "Anh", "Sofia", "Lucas",
+               "Priya", "Olga", "Kenji", "Amara", "Diego", "Noah", "Emma", "Liam", "Olivia", "Ava"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor",
+              "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Nguyen", "Chen",
+              "Patel", "Kim", "Okafor", "Ivanova", "Tanaka", "Silva", "Cohen", "Murphy", "Rossi"]
+STATES = ["TX", "FL", "IL", "WA", "CA", "NY", "GA", "OH", "PA", "AZ"]
+STREETS = ["Pine Road", "Elm Street", "Maple Drive", "Cedar Lane", "Oak Avenue", "Birch Court", "Lakeview Blvd"]
+DIAGNOSES = [
+    ("Common Cold", "Rest, fluids, over-the-counter cold medication."),
+    ("Hypertension", "Lisinopril 10mg daily. Low-sodium diet. Recheck in 3 months."),
+    ("Type 2 Diabetes", "Metformin 500mg twice daily. Dietary counselling."),
+    ("Migraine", "Sumatriptan 50mg as needed. Avoid known triggers."),
+    ("Asthma", "Albuterol inhaler as needed. Avoid allergens."),
+    ("Seasonal Allergies", "Loratadine 10mg daily."),
+    ("Lower Back Pain", "Physical therapy twice weekly. NSAIDs as needed."),
+    ("Annual Physical", "No issues found. Routine follow-up in 12 months."),
+]
+STAFF_ROLES = [("Doctor", 0.4), ("Nurse", 0.4), ("Receptionist", 0.1), ("Technician", 0.07), ("Administrator", 0.03)]
+LOADTEST_PASSWORD = "loadtest123"
+
+
+def _weighted(rng, choices):
+    pick = rng.random()
+    total = 0.0
+    for value, weight in choices:
+        total += weight
+        if pick < total:
+            return value
+    return choices[-1][0]
+
+
+def _poisson(rng, mean):
+    # Knuth's algorithm; fine for the small means used here
+    limit = math.exp(-mean)
+    k, p = 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def _phone(rng):
+    return f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+
+
+def _money(value):
+    return str(Decimal(value).quantize(Decimal("0.01")))
+
+
+class SyntheticDataset:
+    """Generates related rows for every table with realistic-looking distributions."""
+
+    def __init__(self, seed=42, id_offsets=None, today=None):
+        self.rng = random.Random(seed)
+        self.offsets = id_offsets or {}
+        self.today = today or datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.counters = {table: self.offsets.get(table, 0) for table in PRIMARY_KEYS}
+
+    def _next_id(self, table):
+        self.counters[table] += 1
+        return self.counters[table]
+
+    def staff(self, count):
+        for _ in range(count):
+            role = _weighted(self.rng, STAFF_ROLES)
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            staff_id = self._next_id("Staff")
+            yield {
+                "staff_id": staff_id,
+                "first_name": f"Dr. {first}" if role == "Doctor" else first,
+                "last_name": last,
+                "role": role,
+                "email": f"{first.lower()}.{last.lower()}.{staff_id}@hospital.test",
+                "phone_number": _phone(self.rng),
+            }
+
+    def availability(self, doctor_ids):
+        """Weekday clinic hours (08:00-12:00, 13:00-17:00) in 30-minute slots for every doctor."""
+        for doctor_id in doctor_ids:
+            for weekday in range(5):
+                for start_time, end_time in (("08:00:00", "12:00:00"), ("13:00:00", "17:00:00")):
+                    yield {
+                        "availability_id": self._next_id("Doctor_Availability"), "doctor_id": doctor_id,
+                        "weekday": weekday, "start_time": start_time, "end_time": end_time, "slot_minutes": 30,
+                        "valid_from": None, "valid_until": None,
+                    }
+
+    def patient(self, doctor_ids):
+        rng = self.rng
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        patient_id = self._next_id("Patient")
+        # Age skews toward adults with a long tail of elderly patients
+        age_days = int(min(100, max(0, rng.gauss(45, 22))) * 365.25) + rng.randint(0, 364)
+        patient = {
+            "patient_id": patient_id,
+            "first_name": first,
+            "last_name": last,
+            "dob": (date.today() - timedelta(days=age_days)).isoformat(),
+            "gender": rng.choice(["Male", "Female"]) if rng.random() < 0.98 else "Other",
+            "phone_number": _phone(rng),
+            "email": f"{first.lower()}.{last.lower()}.{patient_id}@example.test",
+            "ssn": f"{rng.randint(100, 899)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}",
+            "state_id": f"{rng.choice(STATES)}{rng.randint(1000000, 9999999)}",
+            "primary_doctor_id": rng.choice(doctor_ids) if doctor_ids and rng.random() < 0.8 else None,
+        }
+        sensitive = {
+            "sensitive_id": self._next_id("Patient_Sensitive"),
+            "patient_id": patient_id,
+            "mrn": f"MRN{patient_id:09d}",
+            "home_address": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, Springfield, {rng.choice(STATES)} "
+                            f"{rng.randint(10000, 99999)}",
+            "insurance_policy": f"INS-{rng.randint(100000000, 999999999)}" if rng.random() < 0.85 else None,
+            "card_last4": None,
+        }
+        return patient, sensitive
+
+    def encounters(self, patient_id, doctor_ids):
+        """Appointments plus the records, bills, payment methods and payments they produce."""
+        rng = self.rng
+        out = {table: [] for table in ("Appointment", "Medical_Record", "Billing", "Payment_Methods",
+                                       "Payment_Transactions")}
+        method_id = None
+        if rng.random() < 0.7:
+            method_id = self._next_id("Payment_Methods")
+            last4 = f"{rng.randint(0, 9999):04d}"
+            out["Payment_Methods"].append({
+                "payment_method_id": method_id, "patient_id": patient_id, "type": "CARD", "last4": last4,
+                "data_enc": json.dumps({"card_number": f"****{last4}", "expiry": "12/29"}), "is_default": True,
+            })
+        for _ in range(_poisson(rng, 3)):
+            # Two years of history plus two months of future bookings, on 30-minute slots in clinic hours
+            when = self.today - timedelta(days=rng.randint(-60, 730))
+            when = when.replace(hour=rng.randint(8, 16), minute=rng.choice([0, 30]))
+            doctor_id = rng.choice(doctor_ids) if doctor_ids else None
+            if when > self.today:
+                status = "Scheduled" if rng.random() < 0.9 else "Cancelled"
+            else:
+                status = _weighted(rng, [("Completed", 0.88), ("Cancelled", 0.08), ("No-Show", 0.04)])
+            out["Appointment"].append({
+                "appointment_id": self._next_id("Appointment"), "patient_id": patient_id, "doctor_id": doctor_id,
+                "appointment_date": when.isoformat(sep=" "), "status": status,
+            })
+            if status != "Completed":
+                continue
+            if rng.random() < 0.6:
+                diagnosis, plan = rng.choice(DIAGNOSES)
+                out["Medical_Record"].append({
+                    "record_id": self._next_id("Medical_Record"), "patient_id": patient_id, "doctor_id": doctor_id,
+                    "diagnosis": diagnosis, "treatment_plan": plan,
+                })
+            # Log-normal bill amounts: median around $250 with a long tail of large bills
+            total = Decimal(min(50000.0, rng.lognormvariate(math.log(250), 0.9))).quantize(Decimal("0.01"))
+            payment_state = _weighted(rng, [("Paid", 0.6), ("Partial", 0.2), ("Unpaid", 0.2)])
+            paid = total if payment_state == "Paid" else (
+                (total * Decimal(rng.uniform(0.1, 0.9))).quantize(Decimal("0.01")) if payment_state == "Partial"
+                else Decimal("0.00"))
+            due = when + timedelta(days=30)
+            status = "Paid" if paid >= total else ("Overdue" if due < self.today else "Pending")
+            billing_id = self._next_id("Billing")
+            out["Billing"].append({
+                "billing_id": billing_id, "patient_id": patient_id, "total_amount": _money(total),
+                "paid_amount": _money(paid), "status": status, "payment_due_date": due.isoformat(sep=" "),
+            })
+            remaining = paid
+            installments = 1 if payment_state == "Paid" and rng.random() < 0.7 else rng.randint(1, 3)
+            for i in range(installments):
+                if remaining <= 0:
+                    break
+                amount = remaining if i == installments - 1 else (remaining / 2).quantize(Decimal("0.01"))
+                remaining -= amount
+                out["Payment_Transactions"].append({
+                    "payment_id": self._next_id("Payment_Transactions"), "billing_id": billing_id,
+                    "patient_id": patient_id, "payment_method_id": method_id, "amount": _money(amount),
+                    "paid_at": (when + timedelta(days=rng.randint(0, 45))).isoformat(sep=" "),
+                    "status": "Posted", "note": "Synthetic payment",
+                })
+        return out
+
+    def users(self, role, reference_ids, password_hash):
+        for reference_id in reference_ids:
+            user_id = self._next_id("Users")
+            yield {
+                "user_id": user_id, "email": f"loadtest.{role}.{user_id}@hospital.test",
+                "password_hash": password_hash, "role": role, "reference_id": reference_id, "is_active": True,
+            }
+
+
+def current_max_ids():
+    """Highest existing primary key per table, so generated IDs never collide."""
+    db_connection = connect_to_db()
+    db_connection.database = "secure_hospital_db"
+    cursor = db_connection.cursor()
+    try:
+        offsets = {}
+        for table, pk in PRIMARY_KEYS.items():
+            cursor.execute(f"SELECT COALESCE(MAX({pk}), 0) FROM {table}")
+            offsets[table] = int(cursor.fetchone()[0])
+        return offsets
+    finally:
+        cursor.close()
+        db_connection.close()
+
+
+def generate(out_dir, patients, staff=None, seed=42, login_sample=50, id_offsets=None):
+    """Write <Table>.jsonl files to ``out_dir``; returns {table: row_count}."""
+    os.makedirs(out_dir, exist_ok=True)
+    dataset = SyntheticDataset(seed=seed, id_offsets=id_offsets)
+    staff = staff or max(5, patients // 50)
+    files = {table: open(os.path.join(out_dir, f"{table}.jsonl"), "w", encoding="utf-8") for table in LOAD_ORDER}
+    counts = {table: 0 for table in LOAD_ORDER}
+
+    def write(table, row):
+        files[table].write(json.dumps(row) + "\n")
+        counts[table] += 1
+
+    try:
+        staff_rows = list(dataset.staff(staff))
+        for row in staff_rows:
+            write("Staff", row)
+        doctor_ids = [row["staff_id"] for row in staff_rows if row["role"] == "Doctor"]
+        for row in dataset.availability(doctor_ids):
+            write("Doctor_Availability", row)
+        sample_patients = []
+        for _ in range(patients):
+            patient, sensitive = dataset.patient(doctor_ids)
+            write("Patient", patient)
+            write("Patient_Sensitive", sensitive)
+            if len(sample_patients) < login_sample:
+                sample_patients.append(patient["patient_id"])
+            for table, rows in dataset.encounters(patient["patient_id"], doctor_ids).items():
+                for row in rows:
+                    write(table, row)
+
+        # One hash reused for every load-test account: hashing per user would dominate generation time
+        password_hash = generate_password_hash(LOADTEST_PASSWORD)
+        non_admin_staff = [row["staff_id"] for row in staff_rows if row["role"] != "Administrator"]
+        admin_staff = [row["staff_id"] for row in staff_rows if row["role"] == "Administrator"] or [None]
+        credentials = {"password": LOADTEST_PASSWORD, "patient": [], "staff": [], "admin": []}
+        for role, refs in (("patient", sample_patients),
+                           ("staff", non_admin_staff[:max(1, login_sample // 5)]),
+                           ("admin", admin_staff[:max(1, login_sample // 25)])):
+            for user in dataset.users(role, refs, password_hash):
+                write("Users", user)
+                credentials[role].append(user["email"])
+        with open(os.path.join(out_dir, "credentials.json"), "w", encoding="utf-8") as f:
+            json.dump(credentials, f, indent=2)
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate (and optionally load) a synthetic hospital dataset")
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--staff", type=int, help="Default: one staff member per 50 patients")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="synthetic_data")
+    parser.add_argument("--login-sample", type=int, default=50, help="Patients that get login accounts")
+    parser.add_argument("--load", action="store_true", help="Bulk load the generated files into the database")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    id_offsets = current_max_ids() if args.load else None
+    counts = generate(args.out, args.patients, args.staff, args.seed, args.login_sample, id_offsets)
+    for table in LOAD_ORDER:
+        print(f"  {table}: {counts[table]} rows")
+    if args.load:
+        for table in LOAD_ORDER:
+            if counts[table]:
+                bulk_load(table, os.path.join(args.out, f"{table}.jsonl"), batch_size=args.batch_size,
+                          workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# WSGI entry point for production servers, e.g. `gunicorn wsgi:app` (settings in gunicorn.conf.py).
+# A plain import of the module-level Flask app; shared state is preloaded by the server's
+# master process hooks, not per import.
+from app import app
+
+application = app